@@ -12,10 +12,15 @@ config = context.config
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
 if config.config_file_name is not None:
-    fileConfig(config.config_file_name)
+    # Leave the app's loggers alone when migrations run in-process (migrate_database.upgrade_database)
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
 
-from database import Base
+from database import Base, DATABASE_URL
 from models import user  # this loads the User model
+from models import analysis_job, cim_artifact, cim_fingerprint, compression_dictionary, portfolio_stat  # noqa: F401
+
+# The app's DATABASE_URL wins over the placeholder in alembic.ini
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
 
 target_metadata = Base.metadata
 
@@ -64,7 +69,9 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            render_as_batch=connection.dialect.name == "sqlite",
         )
 
         with context.begin_transaction():
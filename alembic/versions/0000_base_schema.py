@@ -0,0 +1,153 @@
+"""base schema: users, results with their typed columns, artifacts and jobs
+
+Revision ID: 0000_base_schema
+Revises:
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0000_base_schema'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Everything the later revisions build on, so `alembic upgrade head` works on an empty
+# database. Databases created by create_all() or upgraded by the old migrate_database.py
+# already have some or all of it: existing tables only get the columns they're missing.
+
+# Added to analysis_results after it was first created
+RESULT_COLUMNS = [
+    ("user_rating", sa.Float),
+    ("confidence_score", sa.Float),
+    ("content_hash", lambda: sa.String(length=64)),
+    ("company_name", lambda: sa.String(length=200)),
+    ("revenue", sa.Float),
+    ("ebitda", sa.Float),
+    ("ebitda_margin", sa.Float),
+    ("fiscal_year", sa.Integer),
+    ("thesis_count", sa.Integer),
+    ("red_flag_count", sa.Integer),
+    ("ai_confidence", sa.Float),
+    ("confidence_company_info", sa.Float),
+    ("confidence_financials", sa.Float),
+    ("confidence_thesis", sa.Float),
+    ("confidence_red_flags", sa.Float),
+    ("confidence_summary", sa.Float),
+    ("summary_version", sa.Integer),
+]
+
+# Added to analysis_jobs after it was first created (batch_id and upload_key come in 0002 and 0005)
+JOB_COLUMNS = [
+    ("content_hash", lambda: sa.String(length=64), {}),
+    ("force_reanalysis", sa.Boolean, {"nullable": False, "server_default": sa.false()}),
+    ("extraction_stats", sa.Text, {}),
+]
+
+
+def _add_missing_columns(table, existing, columns):
+    for name, column_type, *options in columns:
+        if name not in existing:
+            op.add_column(table, sa.Column(name, column_type(), **(options[0] if options else {"nullable": True})))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "users" not in tables:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.String(), nullable=False),
+            sa.Column("email", sa.String(), nullable=True),
+            sa.Column("hashed_password", sa.String(), nullable=True),
+            sa.Column("full_name", sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_users_id", "users", ["id"])
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if "cim_artifacts" not in tables:
+        op.create_table(
+            "cim_artifacts",
+            sa.Column("sha256", sa.String(length=64), nullable=False),
+            sa.Column("s3_key", sa.String(), nullable=True),
+            sa.Column("s3_url", sa.String(), nullable=True),
+            sa.Column("size_bytes", sa.Integer(), nullable=True),
+            sa.Column("extracted_text", sa.Text(), nullable=True),
+            sa.Column("summary_json", sa.Text(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("analyzed_at", sa.DateTime(), nullable=True),
+            sa.Column("last_used_at", sa.DateTime(), nullable=True),
+            sa.Column("hit_count", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("sha256"),
+        )
+        op.create_index("ix_cim_artifacts_last_used_at", "cim_artifacts", ["last_used_at"])
+
+    if "analysis_results" not in tables:
+        op.create_table(
+            "analysis_results",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.String(), nullable=True),
+            sa.Column("filename", sa.String(length=100), nullable=True),
+            sa.Column("preview_text", sa.Text(), nullable=True),
+            sa.Column("summary_json", sa.Text(), nullable=True),
+            sa.Column("timestamp", sa.DateTime(), nullable=True),
+            *[sa.Column(name, column_type(), nullable=True) for name, column_type in RESULT_COLUMNS],
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.ForeignKeyConstraint(["content_hash"], ["cim_artifacts.sha256"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        op.create_index("ix_analysis_results_id", "analysis_results", ["id"])
+    else:
+        # SQLite can't add a constraint with ALTER TABLE, so an added content_hash goes without its FK there
+        existing = {column["name"] for column in inspector.get_columns("analysis_results")}
+        _add_missing_columns("analysis_results", existing, RESULT_COLUMNS)
+    op.create_index("ix_analysis_results_content_hash", "analysis_results", ["content_hash"], if_not_exists=True)
+
+    if "analysis_jobs" not in tables:
+        op.create_table(
+            "analysis_jobs",
+            sa.Column("id", sa.String(length=32), nullable=False),
+            sa.Column("user_id", sa.String(), nullable=True),
+            sa.Column("filename", sa.String(length=100), nullable=True),
+            sa.Column("content_type", sa.String(length=100), nullable=True),
+            sa.Column("pdf_path", sa.String(), nullable=True),
+            sa.Column("content_hash", sa.String(length=64), nullable=True),
+            sa.Column("force_reanalysis", sa.Boolean(), nullable=False, server_default=sa.false()),
+            sa.Column("idempotency_key", sa.String(length=100), nullable=True),
+            sa.Column("state", sa.String(length=20), nullable=False),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.Column("stage_timings", sa.Text(), nullable=True),
+            sa.Column("extraction_stats", sa.Text(), nullable=True),
+            sa.Column("locked_by", sa.String(length=100), nullable=True),
+            sa.Column("locked_at", sa.DateTime(), nullable=True),
+            sa.Column("result_id", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("started_at", sa.DateTime(), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.ForeignKeyConstraint(["result_id"], ["analysis_results.id"], ondelete="SET NULL"),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("user_id", "idempotency_key", name="uq_analysis_jobs_user_idempotency_key"),
+        )
+        op.create_index("ix_analysis_jobs_user_id", "analysis_jobs", ["user_id"])
+        op.create_index("ix_analysis_jobs_state_created_at", "analysis_jobs", ["state", "created_at"])
+    else:
+        existing = {column["name"] for column in inspector.get_columns("analysis_jobs")}
+        _add_missing_columns("analysis_jobs", existing, JOB_COLUMNS)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("analysis_jobs")
+    op.drop_table("analysis_results")
+    op.drop_table("cim_artifacts")
+    op.drop_table("users")
@@ -0,0 +1,46 @@
+"""composite indexes for per-user result listings
+
+Revision ID: 0001_composite_result_indexes
+Revises: 0000_base_schema
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_composite_result_indexes'
+down_revision: Union[str, Sequence[str], None] = '0000_base_schema'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every results query is scoped to one user, then sorted or filtered on one column.
+# Databases created by create_all() already have these, hence if_not_exists.
+INDEXES = [
+    ("ix_analysis_results_user_timestamp", ["user_id", "timestamp"]),
+    ("ix_analysis_results_user_rating", ["user_id", "user_rating"]),
+    ("ix_analysis_results_user_confidence", ["user_id", "confidence_score"]),
+    ("ix_analysis_results_user_company_name", ["user_id", "company_name"]),
+    ("ix_analysis_results_user_revenue", ["user_id", "revenue"]),
+    ("ix_analysis_results_user_ebitda", ["user_id", "ebitda"]),
+    ("ix_analysis_results_user_ebitda_margin", ["user_id", "ebitda_margin"]),
+    ("ix_analysis_results_user_fiscal_year", ["user_id", "fiscal_year"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for name, columns in INDEXES:
+        op.create_index(name, "analysis_results", columns, if_not_exists=True)
+    if op.get_bind().dialect.name == "sqlite":
+        # Refresh planner statistics so SQLite actually picks the new indexes
+        op.execute(sa.text("ANALYZE analysis_results"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name="analysis_results", if_exists=True)
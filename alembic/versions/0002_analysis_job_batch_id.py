@@ -0,0 +1,32 @@
+"""batch id on analysis jobs
+
+Revision ID: 0002_analysis_job_batch_id
+Revises: 0001_composite_result_indexes
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_analysis_job_batch_id'
+down_revision: Union[str, Sequence[str], None] = '0001_composite_result_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("analysis_jobs")}
+    if "batch_id" not in columns:
+        op.add_column("analysis_jobs", sa.Column("batch_id", sa.String(length=32), nullable=True))
+    op.create_index("ix_analysis_jobs_batch_id", "analysis_jobs", ["batch_id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_analysis_jobs_batch_id", table_name="analysis_jobs", if_exists=True)
+    op.drop_column("analysis_jobs", "batch_id")
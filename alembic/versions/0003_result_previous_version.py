@@ -0,0 +1,38 @@
+"""link analysis results to the earlier version of the same CIM
+
+Revision ID: 0003_result_previous_version
+Revises: 0002_analysis_job_batch_id
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_result_previous_version'
+down_revision: Union[str, Sequence[str], None] = '0002_analysis_job_batch_id'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    columns = {column["name"] for column in sa.inspect(bind).get_columns("analysis_results")}
+    if "previous_version_id" not in columns:
+        # SQLite can't add a constraint with ALTER TABLE (and doesn't enforce it by default)
+        constraints = [] if bind.dialect.name == "sqlite" else [
+            sa.ForeignKey("analysis_results.id", ondelete="SET NULL")
+        ]
+        op.add_column("analysis_results", sa.Column("previous_version_id", sa.Integer(), *constraints, nullable=True))
+    op.create_index("ix_analysis_results_previous_version_id", "analysis_results", ["previous_version_id"],
+                    if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_analysis_results_previous_version_id", table_name="analysis_results", if_exists=True)
+    op.drop_column("analysis_results", "previous_version_id")
@@ -0,0 +1,40 @@
+"""zstd dictionaries for the compressed analysis_results text columns
+
+Revision ID: 0004_compression_dictionaries
+Revises: 0003_result_previous_version
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_compression_dictionaries'
+down_revision: Union[str, Sequence[str], None] = '0003_result_previous_version'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # summary_json and preview_text keep their TEXT declaration: SQLite stores the
+    # compressed values as BLOBs in them as they are, and Postgres leaves them as text.
+    # Existing rows are compressed by `python compress_results.py`, online.
+    if "compression_dictionaries" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "compression_dictionaries",
+            sa.Column("dict_id", sa.Integer(), autoincrement=False, nullable=False),
+            sa.Column("data", sa.LargeBinary(), nullable=False),
+            sa.Column("sample_count", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("dict_id"),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Run `python compress_results.py --decompress` first, or compressed rows become unreadable
+    op.drop_table("compression_dictionaries")
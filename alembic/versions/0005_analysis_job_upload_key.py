@@ -0,0 +1,30 @@
+"""S3 key of a direct upload on analysis jobs
+
+Revision ID: 0005_analysis_job_upload_key
+Revises: 0004_compression_dictionaries
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_analysis_job_upload_key'
+down_revision: Union[str, Sequence[str], None] = '0004_compression_dictionaries'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("analysis_jobs")}
+    if "upload_key" not in columns:
+        op.add_column("analysis_jobs", sa.Column("upload_key", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("analysis_jobs", "upload_key")
@@ -0,0 +1,63 @@
+"""portfolio histograms and near-duplicate fingerprint tables
+
+Revision ID: 0006_portfolio_and_fingerprint_tables
+Revises: 0005_analysis_job_upload_key
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_portfolio_and_fingerprint_tables'
+down_revision: Union[str, Sequence[str], None] = '0005_analysis_job_upload_key'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Until now only create_all() made these; databases that have them are left alone.
+    # portfolio_stats is filled for existing results by 0008 (or `python portfolio_stats.py`).
+    tables = set(sa.inspect(op.get_bind()).get_table_names())
+    if "portfolio_stats" not in tables:
+        op.create_table(
+            "portfolio_stats",
+            sa.Column("user_id", sa.String(), nullable=False),
+            sa.Column("quarter", sa.String(length=6), nullable=False),
+            sa.Column("rating_bucket", sa.String(length=8), nullable=False),
+            sa.Column("metric", sa.String(length=32), nullable=False),
+            sa.Column("bin", sa.Integer(), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.Column("total", sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint("user_id", "quarter", "rating_bucket", "metric", "bin"),
+        )
+    if "cim_fingerprints" not in tables:
+        op.create_table(
+            "cim_fingerprints",
+            sa.Column("content_hash", sa.String(length=64), nullable=False),
+            sa.Column("signature", sa.LargeBinary(), nullable=False),
+            sa.Column("page_signatures", sa.LargeBinary(), nullable=False),
+            sa.Column("page_hashes", sa.Text(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["content_hash"], ["cim_artifacts.sha256"]),
+            sa.PrimaryKeyConstraint("content_hash"),
+        )
+    if "cim_lsh_buckets" not in tables:
+        op.create_table(
+            "cim_lsh_buckets",
+            sa.Column("bucket", sa.String(length=24), nullable=False),
+            sa.Column("content_hash", sa.String(length=64), nullable=False),
+            sa.ForeignKeyConstraint(["content_hash"], ["cim_artifacts.sha256"]),
+            sa.PrimaryKeyConstraint("bucket", "content_hash"),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("cim_lsh_buckets")
+    op.drop_table("cim_fingerprints")
+    op.drop_table("portfolio_stats")
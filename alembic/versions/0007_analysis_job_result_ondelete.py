@@ -0,0 +1,44 @@
+"""null analysis_jobs.result_id when its result is deleted
+
+Revision ID: 0007_analysis_job_result_ondelete
+Revises: 0006_portfolio_and_fingerprint_tables
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_analysis_job_result_ondelete'
+down_revision: Union[str, Sequence[str], None] = '0006_portfolio_and_fingerprint_tables'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+CONSTRAINT = "analysis_jobs_result_id_fkey"
+
+
+def _replace_result_fk(ondelete):
+    bind = op.get_bind()
+    # SQLite doesn't enforce foreign keys here, so deleting a result never trips over its job
+    if bind.dialect.name == "sqlite":
+        return
+    for fk in sa.inspect(bind).get_foreign_keys("analysis_jobs"):
+        if fk["referred_table"] == "analysis_results" and fk["constrained_columns"] == ["result_id"]:
+            if fk["options"].get("ondelete") == ondelete:
+                return
+            op.drop_constraint(fk["name"], "analysis_jobs", type_="foreignkey")
+    op.create_foreign_key(CONSTRAINT, "analysis_jobs", "analysis_results", ["result_id"], ["id"], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Without it, deleting a result a job points at fails on Postgres
+    _replace_result_fk("SET NULL")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _replace_result_fk(None)
@@ -0,0 +1,70 @@
+"""full-text search index, and portfolio histograms for existing results
+
+Revision ID: 0008_search_index_and_portfolio_stats
+Revises: 0007_analysis_job_result_ondelete
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+import portfolio_stats
+import search_index
+from search_index import FTS_TABLE, POSTGRES_DOCUMENT
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008_search_index_and_portfolio_stats'
+down_revision: Union[str, Sequence[str], None] = '0007_analysis_job_result_ondelete'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Until now the app made these on every start (search_index.ensure_search_index)
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        # The old insert/update triggers called cim_decompress(), which only the app's engines had;
+        # rows are indexed from Python now (search_index.index_result)
+        op.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai")
+        op.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au")
+        columns = {row[1] for row in bind.execute(sa.text(f"PRAGMA table_info({FTS_TABLE})"))}
+        if columns and "owner" not in columns:
+            op.execute(f"DROP TABLE {FTS_TABLE}")  # user_id UNINDEXED: rebuilt below
+        op.execute(f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            filename, preview_text, thesis, red_flags, summary, owner,
+            tokenize='porter unicode61'
+        )""")
+        op.execute(f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON analysis_results BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END""")
+        search_index.index_missing_results(bind)
+    elif bind.dialect.name == "postgresql":
+        # Like the JSON check on SQLite: malformed LLM output indexes as empty text
+        op.execute("""CREATE OR REPLACE FUNCTION cim_json_text(doc text, key text) RETURNS text AS $$
+        BEGIN
+            RETURN doc::jsonb ->> key;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql IMMUTABLE""")
+        # Same expression search_results queries, or the planner can't use it
+        op.execute(f"CREATE INDEX IF NOT EXISTS ix_analysis_results_search ON analysis_results "
+                   f"USING GIN ({POSTGRES_DOCUMENT})")
+
+    # Results analyzed before portfolio_stats existed; later ones update it as they're saved
+    portfolio_stats.ensure_portfolio_stats(bind)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        op.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad")
+        op.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+    elif bind.dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_analysis_results_search")
+        op.execute("DROP FUNCTION IF EXISTS cim_json_text(text, text)")
@@ -0,0 +1,32 @@
+"""index results by (content_hash, user_id) for near-duplicate lookups
+
+Revision ID: 0009_result_content_hash_user_index
+Revises: 0008_search_index_and_portfolio_stats
+Create Date: 2026-10-17 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009_result_content_hash_user_index'
+down_revision: Union[str, Sequence[str], None] = '0008_search_index_and_portfolio_stats'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # near_duplicates.find_previous_version checks each LSH candidate for a result of this user
+    op.create_index("ix_analysis_results_content_hash_user", "analysis_results",
+                    ["content_hash", "user_id"], if_not_exists=True)
+    if op.get_bind().dialect.name == "sqlite":
+        op.execute(sa.text("ANALYZE analysis_results"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_analysis_results_content_hash_user", table_name="analysis_results", if_exists=True)
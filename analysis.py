@@ -0,0 +1,581 @@
+import asyncio
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import quote, unquote
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from pdf_extraction import extract_pages_parallel
+from page_selection import select_pages, strip_repeated_lines, count_tokens, split_to_tokens
+from partial_json import SectionParser
+from llm_governor import governor
+from llm_providers import get_provider
+from metrics import stage, STAGE_SECONDS, PAGES_EXTRACTED, PROMPT_TOKENS
+from artifact_cache import hash_file, s3_key_for
+from summary_fields import load_summary
+import near_duplicates
+
+# Load environment variables
+load_dotenv()
+# OpenAI by default; LLM_PROVIDER=fake for offline runs and load tests
+provider = get_provider()
+
+# PDF parsing is CPU-bound, so it runs in a small process pool off the event loop
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 2)))
+pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+# Pages that take longer than this are skipped
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", "5"))
+
+AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
+AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
+AWS_REGION = os.getenv("AWS_REGION")
+S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+# Point at MinIO or a moto server instead of AWS
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+
+s3_client = boto3.client(
+    "s3",
+    aws_access_key_id=AWS_ACCESS_KEY_ID,
+    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+    region_name=AWS_REGION,
+    endpoint_url=S3_ENDPOINT_URL,
+)
+
+# Files above the threshold go up as concurrent multipart chunks streamed from disk
+s3_transfer_config = TransferConfig(
+    multipart_threshold=int(os.getenv("S3_MULTIPART_THRESHOLD_MB", "16")) * 1024 * 1024,
+    multipart_chunksize=int(os.getenv("S3_MULTIPART_CHUNK_MB", "8")) * 1024 * 1024,
+)
+
+# Single mode ranks this many useful pages and sends the best of them (PROMPT_TOKEN_BUDGET tokens)
+ANALYSIS_SCAN_PAGES = int(os.getenv("ANALYSIS_SCAN_PAGES", "40"))
+
+# "single" sends the most relevant pages in one call; "chunked" map-reduces the whole document
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "single")
+ANALYSIS_CHUNK_TOKENS = int(os.getenv("ANALYSIS_CHUNK_TOKENS", "6000"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+# Completion tokens reserved per call against the tokens-per-minute budget
+LLM_COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", "1000"))
+# A revised CIM with more than this share of its pages changed is analyzed from scratch
+REVISION_MAX_CHANGED_SHARE = float(os.getenv("REVISION_MAX_CHANGED_SHARE", "0.5"))
+
+
+class NoReadableContentError(Exception):
+    """The PDF parsed fine but had no pages worth sending to the LLM."""
+
+
+class LLMAnalysisError(Exception):
+    """The LLM call failed or returned nothing usable."""
+
+
+def upload_file_to_s3(pdf_path, filename, content_type):
+    s3_client.upload_file(
+        str(pdf_path),
+        S3_BUCKET_NAME,
+        filename,
+        ExtraArgs={"ContentType": content_type},
+        Config=s3_transfer_config,
+    )
+    return f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{filename}"
+
+
+# Direct uploads: the browser POSTs the PDF straight to the bucket with a presigned policy
+
+def presign_pdf_upload(key, filename, max_bytes, expires_in):
+    """Presigned POST for one PDF at `key`: at most `max_bytes`, Content-Type application/pdf.
+
+    Returns {"url", "fields"}; the client sends `fields` plus the file as
+    multipart/form-data to `url`. S3 rejects anything outside the policy.
+    """
+    fields = {"Content-Type": "application/pdf", "x-amz-meta-filename": quote(filename)}
+    return s3_client.generate_presigned_post(
+        S3_BUCKET_NAME,
+        key,
+        Fields=fields,
+        Conditions=[{name: value} for name, value in fields.items()] + [["content-length-range", 1, max_bytes]],
+        ExpiresIn=expires_in,
+    )
+
+
+def head_s3_object(key):
+    """Size, content type and filename of an uploaded object, or None if it isn't there."""
+    try:
+        head = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return {
+        "size": head["ContentLength"],
+        "content_type": head.get("ContentType"),
+        "filename": unquote(head.get("Metadata", {}).get("filename", "")),
+    }
+
+
+def read_s3_range(key, start, length):
+    """`length` bytes of an object from offset `start` (one ranged GET)."""
+    response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key, Range=f"bytes={start}-{start + length - 1}")
+    return response["Body"].read()
+
+
+def download_file_from_s3(key, pdf_path):
+    # Objects over the multipart threshold come down as concurrent ranged GETs, written straight to disk
+    s3_client.download_file(S3_BUCKET_NAME, key, str(pdf_path), Config=s3_transfer_config)
+
+
+def copy_s3_object(source_key, dest_key):
+    """Server-side copy (multipart for big objects), so no bytes pass through us. Returns the URL."""
+    s3_client.copy({"Bucket": S3_BUCKET_NAME, "Key": source_key}, S3_BUCKET_NAME, dest_key,
+                   Config=s3_transfer_config)
+    return f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{dest_key}"
+
+
+def delete_s3_object(key):
+    s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=key)
+
+
+ANALYSIS_SCHEMA = """{
+  "COMPANY INFO": {
+    "Name": "",
+    "Description": ""
+  },
+  "FINANCIALS": {
+    "Actuals": {
+      "revenue": "", 
+      "EBITDA": "", 
+      "year": "", 
+      "margin": "", 
+      "FCF": ""
+    },
+    "Estimates": {
+      "forward revenue": "", 
+      "EBITDA": "", 
+      "capex": "", 
+      "capex/revenue": ""
+    }
+  },
+  "THESIS": ["Key investment thesis points as bullet points"],
+  "RED FLAGS": ["Key risks or concerns as bullet points"],
+  "SUMMARY": "Concise, plain-English summary of the CIM excerpt.",
+  "confidence_score": 0,
+  "confidence_breakdown": {
+    "COMPANY INFO": 0,
+    "FINANCIALS": 0,
+    "THESIS": 0,
+    "RED FLAGS": 0,
+    "SUMMARY": 0
+  },
+  "flagged_fields": [],
+  "low_confidence_flags": ""
+}"""
+
+ANALYSIS_PROMPT = """
+You are a top-tier private equity investment analyst. Extract only clear, actionable, investment-focused insights from the Confidential Information Memorandum (CIM) excerpt below. Do not hallucinate or guess beyond what's written. Return only what is explicitly stated or clearly implied.
+
+Summarize in this JSON format (no markdown):
+
+{schema}
+
+If a field is missing, use "" or "unknown" (not null). Be concise and factual. Focus on what a private equity team would want to know for a quick investment meeting.
+
+CIM EXCERPT (most relevant pages, in document order):
+{text}
+"""
+
+CHUNK_PROMPT = """
+You are a top-tier private equity investment analyst. Below is part {index} of {total} of a Confidential Information Memorandum (CIM). Extract only what this part explicitly states or clearly implies. Do not hallucinate or fill in fields from outside this part.
+
+Return this JSON format (no markdown), using "" for anything this part doesn't cover:
+
+{schema}
+
+Financial figures matter most: copy numbers with their units and years exactly as written.
+
+CIM PART {index} OF {total}:
+{text}
+"""
+
+REDUCE_PROMPT = """
+You are a top-tier private equity investment analyst. The JSON objects below were extracted, in order, from consecutive parts of the same Confidential Information Memorandum (CIM). Merge them into one analysis of the whole document.
+
+Rules:
+- Prefer the most recent actual-year figures for "Actuals" and forward-looking figures for "Estimates".
+- Deduplicate THESIS and RED FLAGS; keep the most investment-relevant points.
+- Write SUMMARY for the whole document, not for one part.
+- Set confidence scores for the merged result; lower them where parts disagree.
+- Do not add anything that is not in the partial extractions.
+
+Return only this JSON format (no markdown):
+
+{schema}
+
+If a field is missing, use "" or "unknown" (not null).
+
+PARTIAL EXTRACTIONS:
+{partials}
+"""
+
+REVISION_PROMPT = """
+You are a top-tier private equity investment analyst. You analyzed an earlier version of a Confidential Information Memorandum (CIM); the seller has sent a revised version. Below are your previous analysis and the pages of the revised CIM that are new or changed. {removed} page(s) of the earlier version were removed or replaced.
+
+Update the analysis for the revised CIM. Return only a JSON object (no markdown) with the top-level sections of the schema below whose content changes because of these pages, each with its complete new value, and confidence scores adjusted if they change. Leave out sections that are unaffected; return {{}} if nothing changes. Do not hallucinate or guess beyond what's written.
+
+{schema}
+
+PREVIOUS ANALYSIS:
+{previous}
+
+NEW OR CHANGED PAGES:
+{text}
+"""
+
+
+def build_prompt(text):
+    return ANALYSIS_PROMPT.format(schema=ANALYSIS_SCHEMA, text=text)
+
+
+def estimate_tokens(text):
+    """Token count with the model's tokenizer (about 4 characters per token without it)."""
+    return count_tokens(text)
+
+
+# Where an oversized paragraph is split, when it has no line breaks left
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+")
+
+
+def chunk_pages(text_pages, max_tokens=ANALYSIS_CHUNK_TOKENS):
+    """Pack pages, in order, into chunks of at most `max_tokens` tokens.
+
+    Pages larger than a whole chunk are split on paragraph boundaries, then
+    sentences, then tokens, so nothing is dropped.
+    """
+    return [chunk for chunk, _ in _pack(text_pages, max_tokens, "\n\n")]
+
+
+def _pack(parts, max_tokens, joiner):
+    """Greedily join consecutive parts into (text, tokens) pieces of at most `max_tokens`.
+
+    Every part is tokenized once; a join costs one more token.
+    """
+    pieces = []
+    current, current_tokens = [], 0
+    for part in parts:
+        part_tokens = estimate_tokens(part)
+        split = _split_oversized(part, max_tokens) if part_tokens > max_tokens else [(part, part_tokens)]
+        for text, tokens in split:
+            if current and current_tokens + 1 + tokens > max_tokens:
+                pieces.append((joiner.join(current), current_tokens))
+                current, current_tokens = [], 0
+            current_tokens += tokens + (1 if current else 0)
+            current.append(text)
+    if current:
+        pieces.append((joiner.join(current), current_tokens))
+    return pieces
+
+
+def _split_oversized(text, max_tokens):
+    for split, joiner in ((str.splitlines, "\n"), (_SENTENCE_BREAK.split, " ")):
+        parts = [part for part in split(text) if part.strip()]
+        if len(parts) > 1:
+            return _pack(parts, max_tokens, joiner)
+    # One long run-on sentence (or a table flattened to one line)
+    return [(piece, estimate_tokens(piece)) for piece in split_to_tokens(text, max_tokens)]
+
+
+def _messages(prompt):
+    return [
+        {"role": "system", "content": "You are an investment analyst reviewing CIMs."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _reserved_tokens(prompt):
+    prompt_tokens = estimate_tokens(prompt)
+    PROMPT_TOKENS.observe(prompt_tokens)
+    return prompt_tokens + LLM_COMPLETION_TOKENS
+
+
+def _strip_fences(result):
+    # Remove markdown code block formatting if present
+    return re.sub(r"^```json|^```|```$", "", result.strip(), flags=re.MULTILINE).strip()
+
+
+async def _complete(prompt):
+    """One LLM call; returns the response with markdown fences stripped."""
+    try:
+        result = await governor.run(lambda: provider.complete(_messages(prompt)), _reserved_tokens(prompt))
+        return _strip_fences(result)
+    except Exception as e:
+        raise LLMAnalysisError(str(e)) from e
+
+
+async def _stream_complete(prompt):
+    """Streaming LLM call: yields text deltas as they arrive.
+
+    Closing the generator (e.g. when the client disconnects and the task is
+    cancelled) closes the upstream stream, which stops generation.
+    """
+    async def call():
+        return await provider.open_stream(_messages(prompt)), None
+
+    # Only opening the stream is retried; once tokens have gone out a failure is final
+    try:
+        stream = await governor.run(call, _reserved_tokens(prompt))
+    except Exception as e:
+        raise LLMAnalysisError(str(e)) from e
+    try:
+        async for delta in stream:
+            yield delta
+    except Exception as e:
+        raise LLMAnalysisError(str(e)) from e
+    finally:
+        await stream.aclose()
+
+
+async def run_llm_analysis(text):
+    """Send the extracted CIM text to the LLM and return the cleaned JSON string."""
+    return await _complete(build_prompt(text))
+
+
+async def run_revision_analysis(previous_summary, changed_pages, removed_count):
+    """Update a previous analysis from the changed pages of a revised CIM.
+
+    The model answers with only the sections that change, which are merged
+    into the previous analysis. Returns None if its answer isn't a JSON object.
+    """
+    previous = load_summary(previous_summary)
+    prompt = REVISION_PROMPT.format(
+        removed=removed_count, schema=ANALYSIS_SCHEMA, previous=json.dumps(previous), text="\n\n".join(changed_pages)
+    )
+    updates = load_summary(await _complete(prompt))
+    if updates is None:
+        return None
+    sections = json.loads(ANALYSIS_SCHEMA)
+    previous.update({key: value for key, value in updates.items() if key in sections})
+    return json.dumps(previous)
+
+
+async def run_chunked_analysis(text_pages, timings=None):
+    """Map-reduce analysis of the whole document.
+
+    Chunk-level extraction calls run concurrently (at most LLM_CONCURRENCY
+    at a time), then one reduce call merges the partial JSONs into the
+    standard schema. Wall-clock time is about two calls when the chunks fit
+    in LLM_CONCURRENCY and their reservations in the governor's burst;
+    otherwise the map calls go in waves, paced by LLM_TPM
+    (benchmarks/chunked_analysis_benchmark.py).
+    """
+    chunks = chunk_pages(text_pages)
+    if len(chunks) <= 1:
+        return await run_llm_analysis("\n\n".join(text_pages))
+
+    reduce_prompt = await _map_chunks(chunks, timings)
+    with stage(timings, "llm_reduce"):
+        return await _complete(reduce_prompt)
+
+
+async def _map_chunks(chunks, timings=None):
+    """Run the per-chunk extraction calls and return the reduce prompt that merges them."""
+    partials = [None] * len(chunks)
+    with stage(timings, "llm_map"):
+        async for index, partial in _extract_chunks(chunks):
+            partials[index - 1] = partial
+    return _reduce_prompt(partials)
+
+
+async def _extract_chunks(chunks):
+    """Yield (chunk number, partial JSON) as each extraction call finishes.
+
+    Closing the generator early cancels the calls still running.
+    """
+    semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+    async def extract_chunk(index, chunk):
+        async with semaphore:
+            prompt = CHUNK_PROMPT.format(index=index, total=len(chunks), schema=ANALYSIS_SCHEMA, text=chunk)
+            return index, await _complete(prompt)
+
+    tasks = [asyncio.ensure_future(extract_chunk(index, chunk)) for index, chunk in enumerate(chunks, start=1)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _reduce_prompt(partials):
+    numbered = "\n\n".join(f"PART {i}:\n{partial}" for i, partial in enumerate(partials, start=1))
+    return REDUCE_PROMPT.format(schema=ANALYSIS_SCHEMA, partials=numbered)
+
+
+async def stream_analysis(text_pages, timings=None):
+    """Streaming counterpart of the LLM step of `analyze_pdf`.
+
+    Yields ("token", text) for every delta, ("section", (key, value)) as
+    each top-level section of the JSON completes, and finally
+    ("result", cleaned JSON string). In chunked mode each map call's JSON
+    is yielded as ("partial", (chunk number, chunk count, JSON)) as soon as
+    it finishes, then the reduce call is streamed.
+    """
+    chunks = chunk_pages(text_pages) if ANALYSIS_MODE == "chunked" else []
+    start = time.perf_counter()
+    if len(chunks) > 1:
+        partials = [None] * len(chunks)
+        with stage(timings, "llm_map"):
+            async for index, partial in _extract_chunks(chunks):
+                if timings is not None and "llm_first_partial" not in timings:
+                    timings["llm_first_partial"] = round(time.perf_counter() - start, 4)
+                partials[index - 1] = partial
+                yield "partial", (index, len(chunks), partial)
+        prompt = _reduce_prompt(partials)
+        start = time.perf_counter()
+    else:
+        prompt = build_prompt("\n\n".join(text_pages))
+
+    parser = SectionParser()
+    pieces = []
+    with stage(timings, "llm_stream"):
+        async for delta in _stream_complete(prompt):
+            if timings is not None and not pieces:
+                timings["llm_first_token"] = round(time.perf_counter() - start, 4)
+            if not pieces:
+                STAGE_SECONDS.labels(stage="llm_first_token").observe(time.perf_counter() - start)
+            pieces.append(delta)
+            yield "token", delta
+            for section in parser.feed(delta):
+                yield "section", section
+    result = _strip_fences("".join(pieces))
+    if not result:
+        raise LLMAnalysisError("The model returned an empty response.")
+    yield "result", result
+
+
+async def prepare_pdf(pdf_path, content_type, timings=None, content_hash=None, stored_s3_url=None):
+    """The S3 + extraction half of the pipeline, run concurrently.
+
+    Returns a dict with the hash, S3 key/URL, the extracted text, the pages
+    to send to the LLM, and per-page extraction stats. Raises NoReadableContentError if there's
+    nothing worth sending to the LLM.
+    """
+    if not content_hash:
+        content_hash = await run_in_threadpool(hash_file, pdf_path)
+    s3_key = s3_key_for(content_hash)
+    chunked = ANALYSIS_MODE == "chunked"
+
+    async def store():
+        if stored_s3_url:
+            return stored_s3_url
+        with stage(timings, "s3_upload"):
+            return await run_in_threadpool(upload_file_to_s3, pdf_path, s3_key, content_type)
+
+    async def extract():
+        with stage(timings, "extract"):
+            return await extract_pages_parallel(
+                str(pdf_path), pdf_executor, max_pages=None if chunked else ANALYSIS_SCAN_PAGES,
+                page_timeout=PDF_PAGE_TIMEOUT, window=PDF_WORKERS * 2
+            )
+
+    # Upload to S3 (boto3 is blocking, so use the threadpool) while the PDF
+    # is parsed in the process pool
+    s3_url, (text_pages, extraction_stats) = await asyncio.gather(store(), extract())
+    PAGES_EXTRACTED.observe(extraction_stats["useful_pages"])
+    text = "\n\n".join(text_pages)
+    if not text.strip():
+        raise NoReadableContentError(
+            "File uploaded but no readable business content was found in the PDF."
+        )
+    pages = text_pages  # As extracted, before header stripping and selection
+    with stage(timings, "fingerprint"):
+        fingerprint = await run_in_threadpool(near_duplicates.fingerprint, pages)
+
+    # text_pages becomes what the LLM sees: without running headers/footers and,
+    # in single mode, only the most relevant pages that fit the token budget
+    with stage(timings, "select_pages"):
+        if chunked:
+            text_pages = await run_in_threadpool(strip_repeated_lines, text_pages)
+        else:
+            text_pages, selection = await run_in_threadpool(select_pages, text_pages)
+            useful = [p["page"] for p in extraction_stats["pages"] if p["status"] == "ok"]
+            selection["selected_pages"] = [useful[i - 1] for i in selection["selected_pages"]]
+            extraction_stats["selection"] = selection
+    return {
+        "content_hash": content_hash,
+        "s3_key": s3_key,
+        "s3_url": s3_url,
+        "text": text,
+        "pages": pages,
+        "text_pages": text_pages,
+        "fingerprint": fingerprint,
+        "extraction_stats": extraction_stats,
+    }
+
+
+async def analyze_pdf(pdf_path, content_type, timings=None, content_hash=None, stored_s3_url=None):
+    """Run the full S3 + extraction + LLM pipeline for one spooled PDF.
+
+    The PDF is stored under a content-addressed key; pass `stored_s3_url`
+    when those bytes are already in the bucket to skip the upload.
+    Returns a dict with the hash, S3 key/URL, the extracted text, per-page
+    extraction stats and the LLM result.
+    """
+    outcome = await prepare_pdf(pdf_path, content_type, timings, content_hash, stored_s3_url)
+    return await run_analysis(outcome, timings)
+
+
+async def run_analysis(outcome, timings=None, previous=None):
+    """The LLM half of the pipeline, for the output of `prepare_pdf`; sets outcome["result"].
+
+    `previous` is the user's earlier version of this CIM from
+    near_duplicates.find_previous_version. If no page changed its analysis
+    is reused as is; if only a few did, just those pages are sent, to update
+    the affected sections. The page diff and what was done with it go in
+    extraction_stats["revision"].
+    """
+    text_pages = outcome.pop("text_pages")
+    revision = None
+    if previous:
+        revision = near_duplicates.diff_pages(outcome["fingerprint"], previous)
+        changed = revision["changed_pages"]
+        if not changed and not revision["removed_pages"]:
+            revision["mode"] = "unchanged"
+        elif len(changed) <= REVISION_MAX_CHANGED_SHARE * revision["pages"] and \
+                load_summary(previous["summary_json"]) is not None:
+            revision["mode"] = "incremental"
+        else:
+            revision["mode"] = "full"
+        outcome["revision"] = revision
+        # Reported with PDF page numbers; the diff itself indexes the extracted pages
+        useful = [p["page"] for p in outcome["extraction_stats"]["pages"] if p["status"] == "ok"]
+        outcome["extraction_stats"]["revision"] = {
+            **revision,
+            **{key: [useful[i - 1] for i in revision[key]] for key in ("changed_pages", "revised_pages", "added_pages")},
+        }
+
+    with stage(timings, "llm"):
+        if revision and revision["mode"] == "unchanged":
+            outcome["result"] = previous["summary_json"]
+            return outcome
+        if revision and revision["mode"] == "incremental":
+            changed_pages, _ = await run_in_threadpool(
+                select_pages, [outcome["pages"][i - 1] for i in revision["changed_pages"]]
+            )
+            outcome["result"] = await run_revision_analysis(
+                previous["summary_json"], changed_pages, revision["removed_pages"]
+            )
+            if outcome["result"] is not None:
+                return outcome
+            # Unusable answer: analyze the whole document instead, and record that it was
+            revision["mode"] = outcome["extraction_stats"]["revision"]["mode"] = "full"
+        if ANALYSIS_MODE == "chunked":
+            outcome["result"] = await run_chunked_analysis(text_pages, timings)
+        else:
+            outcome["result"] = await run_llm_analysis("\n\n".join(text_pages))
+    return outcome
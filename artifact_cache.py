@@ -0,0 +1,100 @@
+"""
+Content-addressed cache of CIM artifacts.
+
+Every PDF is identified by the SHA-256 of its bytes. That key names the S3
+object (`cims/<sha256>.pdf`, so same-named files no longer overwrite each
+other) and indexes the extracted text and the LLM result, so known bytes
+never hit OpenAI twice. Cached payloads are evicted by age and by count;
+the artifact row and its S3 key are kept so re-analysis skips the upload.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+from models.cim_artifact import CimArtifact
+
+ARTIFACT_CACHE_MAX_ENTRIES = int(os.getenv("ARTIFACT_CACHE_MAX_ENTRIES", "5000"))
+ARTIFACT_CACHE_MAX_AGE_DAYS = int(os.getenv("ARTIFACT_CACHE_MAX_AGE_DAYS", "90"))
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def s3_key_for(content_hash):
+    return f"cims/{content_hash}.pdf"
+
+
+def _is_fresh(artifact, now):
+    if not artifact.summary_json or not artifact.analyzed_at:
+        return False
+    return artifact.analyzed_at >= now - timedelta(days=ARTIFACT_CACHE_MAX_AGE_DAYS)
+
+
+def get_artifact(db, content_hash):
+    return db.query(CimArtifact).filter(CimArtifact.sha256 == content_hash).first()
+
+
+def get_cached_analysis(db, content_hash, commit=True):
+    """Return the artifact if it holds a usable cached analysis, and count the hit.
+
+    Pass commit=False to leave the hit count to the caller's transaction.
+    """
+    artifact = get_artifact(db, content_hash)
+    now = datetime.utcnow()
+    if not artifact or not _is_fresh(artifact, now):
+        return None
+    artifact.last_used_at = now
+    artifact.hit_count = (artifact.hit_count or 0) + 1
+    if commit:
+        db.commit()
+    return artifact
+
+
+def store_artifact(db, content_hash, size_bytes, s3_key, s3_url, text, summary_json):
+    """Insert or refresh the artifact for these bytes after a pipeline run."""
+    now = datetime.utcnow()
+    artifact = get_artifact(db, content_hash)
+    if not artifact:
+        artifact = CimArtifact(sha256=content_hash, created_at=now, hit_count=0)
+        db.add(artifact)
+    artifact.size_bytes = size_bytes
+    artifact.s3_key = s3_key
+    artifact.s3_url = s3_url
+    artifact.extracted_text = text
+    artifact.summary_json = summary_json
+    artifact.analyzed_at = now
+    artifact.last_used_at = now
+    return artifact
+
+
+def evict_expired(db):
+    """Drop cached payloads that are too old or beyond the entry budget (LRU).
+
+    Returns the number of artifacts whose payload was cleared.
+    """
+    cleared = {"extracted_text": None, "summary_json": None, "analyzed_at": None}
+    cutoff = datetime.utcnow() - timedelta(days=ARTIFACT_CACHE_MAX_AGE_DAYS)
+    evicted = db.query(CimArtifact).filter(
+        CimArtifact.summary_json.isnot(None),
+        CimArtifact.last_used_at < cutoff
+    ).update(cleared, synchronize_session=False)
+
+    cached = db.query(CimArtifact).filter(CimArtifact.summary_json.isnot(None))
+    overflow = cached.count() - ARTIFACT_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        oldest = [
+            row.sha256 for row in cached.with_entities(CimArtifact.sha256)
+            .order_by(CimArtifact.last_used_at).limit(overflow)
+        ]
+        evicted += db.query(CimArtifact).filter(
+            CimArtifact.sha256.in_(oldest)
+        ).update(cleared, synchronize_session=False)
+
+    db.commit()
+    return evicted
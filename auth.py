@@ -1,15 +1,31 @@
-import requests
 from jose import jwt, JWTError, jwk
 from fastapi import Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from models.user import User
+import logging
 import os
+import time
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from jwks_cache import JWKSCache, VerifiedTokenCache
+from metrics import AUTH_SECONDS
+
+logger = logging.getLogger(__name__)
 
 # Your Clerk domain's JWKS URL
-CLERK_JWKS_URL = "https://neutral-porpoise-61.clerk.accounts.dev/.well-known/jwks.json"
+CLERK_ISSUER = "https://neutral-porpoise-61.clerk.accounts.dev"
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", f"{CLERK_ISSUER}/.well-known/jwks.json")
 ALGORITHM = "RS256"
 
+# JWKS keys are cached in-process by kid; verified payloads are cached until exp
+jwks_cache = JWKSCache(
+    CLERK_JWKS_URL,
+    ttl=int(os.getenv("JWKS_CACHE_TTL", "3600")),
+    refresh_ahead=int(os.getenv("JWKS_REFRESH_AHEAD", "300")),
+    timeout=float(os.getenv("JWKS_FETCH_TIMEOUT", "3")),
+)
+verified_tokens = VerifiedTokenCache(maxsize=int(os.getenv("VERIFIED_TOKEN_CACHE_SIZE", "1024")))
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -17,35 +33,39 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-def get_public_key():
-    """Fetch Clerk's public key (JWKS)."""
-    try:
-        jwks = requests.get(CLERK_JWKS_URL).json()
-        return jwt.algorithms.RSAAlgorithm.from_jwk(jwks['keys'][0])
-    except Exception as e:
-        print(f"Error fetching JWKS: {e}")
-        return None
+def get_public_key(kid: str):
+    """Look up Clerk's public key (JWK) for the given key id."""
+    return jwks_cache.get_key(kid)
 
 def verify_clerk_token(token: str):
     """Verify Clerk JWT token."""
+    cached = verified_tokens.get(token)
+    if cached:
+        return cached
+
     try:
-        public_key = get_public_key()
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") != ALGORITHM:
+            return None
+        public_key = get_public_key(header.get("kid"))
         if not public_key:
             return None
-            
+
         payload = jwt.decode(
             token,
             public_key,
             algorithms=[ALGORITHM],
-            audience="https://neutral-porpoise-61.clerk.accounts.dev",
-            issuer="https://neutral-porpoise-61.clerk.accounts.dev"
+            audience=CLERK_ISSUER,
+            issuer=CLERK_ISSUER
         )
+        verified_tokens.put(token, payload)
         return payload
     except JWTError as e:
-        print(f"JWT verification failed: {e}")
+        # Expected for every legacy HS256 token, so not worth more than debug
+        logger.debug("Clerk JWT rejected", extra={"error": str(e)})
         return None
-    except Exception as e:
-        print(f"Token verification error: {e}")
+    except Exception:
+        logger.exception("Clerk token verification error")
         return None
 
 def verify_custom_token(token: str):
@@ -56,34 +76,51 @@ def verify_custom_token(token: str):
     except JWTError:
         return None
 
-def get_current_user(request: Request):
-    """Get current user from either Clerk or custom JWT."""
+def clerk_key_needs_fetch(token: str):
+    """True if verifying this token would first have to download Clerk's JWKS."""
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
+        return False
+    return header.get("alg") == ALGORITHM and jwks_cache.needs_fetch(header.get("kid"))
+
+async def get_current_user(request: Request):
+    """Get current user from either Clerk or custom JWT.
+
+    Async so it doesn't take a threadpool thread per request; the only
+    blocking step, a JWKS download, is pushed to the threadpool.
+    """
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
 
     token = auth_header.split(" ")[1]
-    print(f"Received token: {token[:50]}...")  # Debug: print first 50 chars
-    
+    start = time.perf_counter()
+
     # Try Clerk JWT first
-    clerk_payload = verify_clerk_token(token)
+    if clerk_key_needs_fetch(token):
+        clerk_payload = await run_in_threadpool(verify_clerk_token, token)
+    else:
+        clerk_payload = verify_clerk_token(token)
     if clerk_payload:
         user_id = clerk_payload.get("sub") or clerk_payload.get("user_id")
         if user_id:
-            print(f"Valid Clerk token for user: {user_id}")
-            return User(id=user_id)
-    
+            return _authenticated(user_id, "clerk", start)
+
     # Fallback to custom JWT for backward compatibility
     custom_payload = verify_custom_token(token)
     if custom_payload:
         user_id = custom_payload.get("sub")
         if user_id:
-            print(f"Valid custom token for user: {user_id}")
-            return User(id=user_id)
-    
+            return _authenticated(user_id, "custom", start)
+
     # Fallback authentication for development
-    print("Using fallback authentication")
-    return User(id="test_user_123")
+    return _authenticated("test_user_123", "fallback", start)
+
+def _authenticated(user_id: str, method: str, start: float):
+    AUTH_SECONDS.labels(method=method, outcome="ok").observe(time.perf_counter() - start)
+    logger.debug("Authenticated request", extra={"user_id": user_id, "auth_method": method})
+    return User(id=user_id)
 
 # Old authentication functions for backward compatibility
 def hash_password(password: str):
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Backfill the typed columns on analysis_results (company_name, revenue,
+EBITDA, margin, year, confidences, counts) from existing summary_json blobs.
+
+Rows are processed in small id-ordered batches, each in its own short
+transaction, so the database is never locked for long and the app can keep
+serving requests. The script is resumable: it only touches rows whose
+summary_version is missing or older than the current parser, so it can be
+stopped and rerun at any time.
+
+Run `alembic upgrade head` first to add the columns.
+"""
+
+import argparse
+import time
+
+from sqlalchemy import or_
+
+from database import SessionLocal
+from models.user import User  # noqa: F401  registers the users table
+from models.analysis_result import AnalysisResult
+from summary_fields import extract_fields, SUMMARY_PARSER_VERSION
+import portfolio_stats
+
+
+def backfill_summary_fields(batch_size=500, pause=0.05):
+    """Parse summary_json for every stale row. Returns the number of rows updated."""
+    last_id = 0
+    updated = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.query(AnalysisResult.id, AnalysisResult.summary_json, *portfolio_stats.FACT_COLUMNS).filter(
+                AnalysisResult.id > last_id,
+                or_(
+                    AnalysisResult.summary_version.is_(None),
+                    AnalysisResult.summary_version < SUMMARY_PARSER_VERSION
+                )
+            ).order_by(AnalysisResult.id).limit(batch_size).all()
+            if not rows:
+                break
+
+            updates = [{"id": row.id, **extract_fields(row.summary_json)} for row in rows]
+            db.bulk_update_mappings(AnalysisResult, updates)
+            # Keep the analytics histograms in step with the re-parsed values
+            old_facts = [tuple(getattr(row, name) for name in portfolio_stats.FACT_NAMES) for row in rows]
+            new_facts = [
+                tuple(fields.get(name, old) for name, old in zip(portfolio_stats.FACT_NAMES, facts))
+                for fields, facts in zip(updates, old_facts)
+            ]
+            portfolio_stats.apply_changes(db, old_facts, new_facts)
+            db.commit()
+        finally:
+            db.close()
+
+        last_id = rows[-1].id
+        updated += len(rows)
+        print(f"✓ Backfilled {updated} rows (through id {last_id})")
+        # Give other writers a turn between batches
+        time.sleep(pause)
+
+    print(f"✓ Backfill complete: {updated} rows updated")
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill typed columns from summary_json.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between batches")
+    args = parser.parse_args()
+    backfill_summary_fields(args.batch_size, args.pause)
@@ -0,0 +1,79 @@
+"""
+Wall time of ANALYSIS_MODE=chunked against a single call, under the governor's limits.
+
+Runs the LLM half of the pipeline on a synthetic CIM's page texts with the
+fake provider (`--latency` seconds per call) and a fresh governor for each
+tokens-per-minute limit in `--tpm`:
+
+  single   the most relevant pages, in one call (ANALYSIS_MODE=single)
+  chunked  every page, map calls at most LLM_CONCURRENCY at a time, then a reduce call
+
+Map calls only overlap as far as the token bucket's burst (LLM_TPM for
+LLM_BURST_SECONDS) covers their reservations; past that they're paced by
+the per-minute limit, and chunked mode costs about as many minutes as the
+document has tokens per LLM_TPM.
+
+    python -m benchmarks.chunked_analysis_benchmark --pages 120 --tpm 30000,150000,800000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+
+def configure(latency):
+    # Must happen before analysis.py is imported
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "LLM_FAKE_PROFILE": "instant",
+        "LLM_FAKE_LATENCY": str(latency),
+        "LOG_LEVEL": "WARNING",
+    })
+
+
+async def timed(analysis, run):
+    calls = analysis.provider.calls
+    start = time.perf_counter()
+    result = await run()
+    if analysis.load_summary(result) is None:
+        raise RuntimeError("analysis didn't return a JSON object")
+    return round(time.perf_counter() - start, 2), analysis.provider.calls - calls
+
+
+async def run(args):
+    import analysis
+    from benchmarks.synthetic_pdf import make_page_texts
+    from llm_governor import LLMGovernor
+    from page_selection import select_pages
+
+    pages = make_page_texts(args.pages, seed=args.seed)[2:]
+    chunks = analysis.chunk_pages(pages)
+    selected, _ = select_pages(pages)
+    print(f"{args.pages} pages, {sum(map(analysis.estimate_tokens, pages))} tokens, {len(chunks)} chunks of "
+          f"<= {analysis.ANALYSIS_CHUNK_TOKENS} tokens, LLM_CONCURRENCY={analysis.LLM_CONCURRENCY}, "
+          f"{args.latency}s per call\n")
+    print(f"{'LLM_TPM':>10}{'burst tokens':>14}{'single s':>10}{'chunked s':>11}{'calls':>7}{'vs single':>11}")
+    for tpm in args.tpm:
+        analysis.governor = LLMGovernor(rpm=100000, tpm=tpm)
+        single, _ = await timed(analysis, lambda: analysis.run_llm_analysis("\n\n".join(selected)))
+        analysis.governor = LLMGovernor(rpm=100000, tpm=tpm)
+        chunked, calls = await timed(analysis, lambda: analysis.run_chunked_analysis(pages))
+        print(f"{tpm:>10}{round(analysis.governor.tokens.capacity):>14}{single:>10}{chunked:>11}{calls:>7}"
+              f"{chunked / single:>10.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=2.0, help="Seconds per fake LLM call")
+    parser.add_argument("--tpm", type=lambda value: [int(v) for v in value.split(",")],
+                        default=[30000, 150000, 800000], help="Comma-separated LLM_TPM values")
+    args = parser.parse_args()
+    configure(args.latency)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Database size and listing latency before and after compressing the results table.
+
+Seeds a throwaway SQLite database with `--rows` plain-text analyses (fake
+LLM summaries padded with benchmarks.synthetic_pdf prose, previews from
+synthetic pages), then measures the file size and the dashboard listing
+(one user's newest 50 results, with the fields the dashboard asks for)
+through the same query the API builds. It then runs the online migration (compress_results.py) while
+reader threads keep listing, VACUUMs, and measures again.
+
+    python -m benchmarks.compression_benchmark --rows 20000 --cache-mb 2
+
+`--cache-mb` sets SQLite's page cache per connection; keep it well under
+the table size to see the effect of fitting more rows per page.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+USERS = 50
+LISTING_LIMIT = 50
+# What cim-analyzer-frontend's Dashboard.js requests
+DASHBOARD_FIELDS = "filename,summary_json,user_rating,confidence_score"
+
+
+def summary_for(i, fake_analysis, pages):
+    summary = fake_analysis(f"benchmark document {i}")
+    rng = random.Random(i)
+    # Real outputs run to a few KB: several thesis points and red flags, a paragraph of summary
+    parsed = json.loads(summary)
+    sentences = [s.strip() + "." for page in pages for s in page.split(".") if len(s.split()) > 6]
+    parsed["THESIS"] += rng.sample(sentences, 4)
+    parsed["RED FLAGS"] += rng.sample(sentences, 3)
+    parsed["SUMMARY"] += " " + " ".join(rng.sample(sentences, 6))
+    return json.dumps(parsed)
+
+
+def seed(engine, rows):
+    from sqlalchemy import text
+    from benchmarks.synthetic_pdf import make_page_texts
+    from llm_providers import fake_analysis
+    from models.user import User
+
+    start = datetime(2024, 1, 1)
+    insert = text(
+        "INSERT INTO analysis_results (user_id, filename, preview_text, summary_json, timestamp, company_name) "
+        "VALUES (:user_id, :filename, :preview_text, :summary_json, :timestamp, :company_name)"
+    )
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{"id": f"user_{u}", "full_name": f"User {u}"} for u in range(USERS)])
+        batch = []
+        for i in range(rows):
+            pages = make_page_texts(6, seed=i, sentences_per_page=8)[2:]
+            # Plain text, as rows were stored before compression
+            batch.append({
+                "user_id": f"user_{i % USERS}",
+                "filename": f"cim_{i}.pdf",
+                "preview_text": "\n".join(pages)[:1000],
+                "summary_json": summary_for(i, fake_analysis, pages),
+                "timestamp": start + timedelta(minutes=i),
+                "company_name": f"Company {i}",
+            })
+            if len(batch) == 2000:
+                conn.execute(insert, batch)
+                batch = []
+        if batch:
+            conn.execute(insert, batch)
+
+
+def list_page(Session, user_id):
+    from routes.results import build_results_query, parse_fields
+    names = parse_fields(DASHBOARD_FIELDS)
+    db = Session()
+    try:
+        rows = db.execute(build_results_query(user_id, names, "timestamp", "desc", None, []).limit(LISTING_LIMIT)).all()
+        return [dict(zip(names, row)) for row in rows]
+    finally:
+        db.close()
+
+
+def measure_listing(Session, queries, seed_value=0):
+    rng = random.Random(seed_value)
+    samples = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        list_page(Session, f"user_{rng.randrange(USERS)}")
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 2),
+    }
+
+
+def file_mb(path):
+    return round(os.path.getsize(path) / 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--cache-mb", type=float, default=2, help="SQLite page cache per connection")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        # Must happen before database.py is imported
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+        from sqlalchemy import event, text
+        import zstandard
+        import compression
+        import compress_results
+        from database import SessionLocal, engine
+        from migrate_database import upgrade_database
+        from search_index import index_missing_results
+
+        @event.listens_for(engine, "connect")
+        def _cache_size(dbapi_connection, connection_record):
+            dbapi_connection.execute(f"PRAGMA cache_size=-{int(args.cache_mb * 1024)}")
+
+        upgrade_database()
+        print(f"seeding {args.rows} rows...")
+        seed(engine, args.rows)
+        with engine.begin() as conn:
+            index_missing_results(conn)
+
+        def vacuum():
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+                conn.execute(text("VACUUM"))
+
+        def column_bytes():
+            report = compress_results.storage_report()
+            return round(sum(stats["bytes"] for kinds in report.values() for stats in kinds.values()) / 1e6, 2)
+
+        vacuum()
+        before = {"db_mb": file_mb(path), "text_mb": column_bytes(), **measure_listing(SessionLocal, args.queries)}
+
+        # The migration runs online: keep listing while it works and report what readers saw
+        during, stop = [], threading.Event()
+
+        def reader():
+            rng = random.Random(1)
+            while not stop.is_set():
+                start = time.perf_counter()
+                list_page(SessionLocal, f"user_{rng.randrange(USERS)}")
+                during.append((time.perf_counter() - start) * 1000)
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        start = time.perf_counter()
+        compress_results.compress_results(batch_size=500, pause=0.01)
+        migration_seconds = time.perf_counter() - start
+        stop.set()
+        thread.join()
+
+        vacuum()
+        after = {"db_mb": file_mb(path), "text_mb": column_bytes(), **measure_listing(SessionLocal, args.queries)}
+
+        # How much the dictionary itself contributes, on a sample of summaries
+        with engine.connect() as conn:
+            sample = [row[0] for row in conn.execute(text(
+                "SELECT summary_json FROM analysis_results ORDER BY random() LIMIT 500"))]
+        sample = [compression.decompress(value) for value in sample]
+        plain = sum(len(value.encode()) for value in sample)
+        with_dict = sum(len(compression.compress(value)) for value in sample)
+        without_dict = sum(len(zstandard.ZstdCompressor(level=compression.COMPRESSION_LEVEL).compress(value.encode()))
+                           for value in sample)
+
+    during.sort()
+    print(f"\n{args.rows} rows, listing {LISTING_LIMIT} results ({DASHBOARD_FIELDS}), {args.cache_mb:g}MB page cache")
+    print(f"{'':<22}{'db MB':>10}{'text MB':>10}{'list p50 ms':>14}{'list p95 ms':>14}")
+    for label, stats in [("plain text", before), ("zstd + dictionary", after)]:
+        print(f"{label:<22}{stats['db_mb']:>10}{stats['text_mb']:>10}{stats['p50_ms']:>14}{stats['p95_ms']:>14}")
+    print(f"\nmigration: {migration_seconds:.1f}s; listing meanwhile p50 {statistics.median(during):.2f}ms, "
+          f"p95 {during[int(len(during) * 0.95) - 1]:.2f}ms over {len(during)} queries")
+    print(f"summary_json sample: {plain / without_dict:.1f}x with zstd alone, {plain / with_dict:.1f}x with the dictionary")
+
+
+if __name__ == "__main__":
+    main()
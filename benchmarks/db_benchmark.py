@@ -0,0 +1,168 @@
+"""
+Concurrent read/write benchmark for the results table.
+
+Reader threads run the dashboard query (one user's newest 50 results) while
+writer threads insert analyses, first against SQLite as the app used to
+configure it (rollback journal, no (user_id, timestamp) index) and then with
+the tuned engine from database.make_engine (WAL, synchronous=NORMAL, busy
+timeout, composite index).
+
+    python -m benchmarks.db_benchmark --rows 50000 --readers 4 --writers 2 --seconds 10
+
+Pass --url to run the tuned configuration against another database
+(e.g. Postgres); the baseline only applies to SQLite.
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import Base, make_engine
+from models.user import User
+from models.analysis_result import AnalysisResult
+
+USERS = 50
+
+
+def seed(engine, rows):
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{"id": f"user_{u}", "full_name": f"User {u}"} for u in range(USERS)])
+        batch = []
+        for i in range(rows):
+            batch.append({
+                "user_id": f"user_{i % USERS}",
+                "filename": f"cim_{i}.pdf",
+                "preview_text": "Revenue grew 18% year over year. " * 10,
+                "summary_json": '{"SUMMARY": "synthetic"}',
+                "timestamp": start + timedelta(minutes=i),
+            })
+            if len(batch) == 5000:
+                conn.execute(AnalysisResult.__table__.insert(), batch)
+                batch = []
+        if batch:
+            conn.execute(AnalysisResult.__table__.insert(), batch)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_workload(engine, readers, writers, seconds):
+    Session = sessionmaker(bind=engine)
+    stop = threading.Event()
+    read_ms, write_ms, errors = [], [], []
+    lock = threading.Lock()
+
+    def reader(seed_value):
+        rng = random.Random(seed_value)
+        while not stop.is_set():
+            db = Session()
+            start = time.perf_counter()
+            try:
+                db.query(AnalysisResult.id, AnalysisResult.filename, AnalysisResult.timestamp).filter(
+                    AnalysisResult.user_id == f"user_{rng.randrange(USERS)}"
+                ).order_by(AnalysisResult.timestamp.desc(), AnalysisResult.id.desc()).limit(50).all()
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    read_ms.append(elapsed)
+            except OperationalError as e:
+                with lock:
+                    errors.append(str(e.orig))
+            finally:
+                db.close()
+
+    def writer(seed_value):
+        rng = random.Random(seed_value)
+        while not stop.is_set():
+            db = Session()
+            start = time.perf_counter()
+            try:
+                db.add(AnalysisResult(
+                    user_id=f"user_{rng.randrange(USERS)}",
+                    filename="new.pdf",
+                    preview_text="Adjusted EBITDA margin of 24%. " * 10,
+                    summary_json='{"SUMMARY": "synthetic"}',
+                ))
+                db.commit()
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    write_ms.append(elapsed)
+            except OperationalError as e:
+                db.rollback()
+                with lock:
+                    errors.append(str(e.orig))
+            finally:
+                db.close()
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(100 + i,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "reads_per_sec": round(len(read_ms) / seconds, 1),
+        "read_p50_ms": round(statistics.median(read_ms), 2) if read_ms else 0.0,
+        "read_p95_ms": round(percentile(read_ms, 95), 2),
+        "read_p99_ms": round(percentile(read_ms, 99), 2),
+        "writes_per_sec": round(len(write_ms) / seconds, 1),
+        "write_p95_ms": round(percentile(write_ms, 95), 2),
+        "write_p99_ms": round(percentile(write_ms, 99), 2),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--url", help="run the tuned configuration against this database instead")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.url:
+            configs = [("tuned", args.url, True, False)]
+        else:
+            configs = [
+                ("baseline (rollback journal, no index)", f"sqlite:///{Path(tmp) / 'baseline.db'}", False, True),
+                ("tuned (WAL, NORMAL, index)", f"sqlite:///{Path(tmp) / 'tuned.db'}", True, False),
+            ]
+        for label, url, tuned, drop_index in configs:
+            engine = make_engine(url, tune_sqlite=tuned)
+            seed(engine, args.rows)
+            if drop_index:
+                with engine.begin() as conn:
+                    conn.execute(text("DROP INDEX ix_analysis_results_user_timestamp"))
+            print(f"running {label}...")
+            results.append((label, run_workload(engine, args.readers, args.writers, args.seconds)))
+            engine.dispose()
+
+    print(f"\n{args.rows} rows, {args.readers} readers, {args.writers} writers, {args.seconds:g}s each")
+    columns = list(results[0][1])
+    print(f"{'configuration':<40}" + "".join(f"{c:>16}" for c in columns))
+    for label, stats in results:
+        print(f"{label:<40}" + "".join(f"{stats[c]:>16}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Bytes through the API per upload: multipart /api/upload vs direct-to-S3.
+
+Runs the app in-process against a local moto S3 server (a real HTTP
+endpoint the client POSTs to, as it would to S3) with the fake LLM and a
+throwaway SQLite database. Every request body the API receives is counted.
+Each flow gets its own synthetic CIMs, so the artifact cache doesn't answer
+the second one:
+
+  multipart: POST /api/upload, the worker uploads the spooled PDF to S3
+  direct:    POST /api/upload/presign, the client POSTs the PDF to the
+             bucket, POST /api/upload/{id}/finalize, the worker fetches it
+
+Also sends a file over the size limit (without declaring its size to the
+presign endpoint) and one that isn't a PDF, and reports what stopped each:
+S3 enforces the POST policy's size range, and finalize checks the stored
+object's size and header again (moto doesn't enforce policy conditions, so
+here it's finalize).
+
+    pip install "moto[server]"
+    python -m benchmarks.direct_upload_benchmark --uploads 5 --pages 120
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+TEMP_DIR = tempfile.mkdtemp(prefix="cim-direct-")
+HEADERS = {"Authorization": "Bearer bench"}
+BUCKET = "cim-bench"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def configure(port, max_upload_mb):
+    # Must happen before the app (and analysis.py / ingest.py) is imported
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{Path(TEMP_DIR) / 'bench.db'}",
+        "JOBS_DIR": str(Path(TEMP_DIR) / "jobs"),
+        "JOB_POLL_INTERVAL": "0.02",
+        "LLM_PROVIDER": "fake",
+        "LLM_FAKE_PROFILE": "instant",
+        "LLM_RPM": "1000000",
+        "LLM_TPM": "1000000000",
+        "CLERK_JWKS_URL": "http://jwks.invalid/.well-known/jwks.json",
+        "S3_ENDPOINT_URL": f"http://127.0.0.1:{port}",
+        "S3_BUCKET_NAME": BUCKET,
+        "AWS_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "MAX_UPLOAD_MB": str(max_upload_mb),
+        "LOG_LEVEL": "WARNING",
+    })
+
+
+class CountBytesIn:
+    """ASGI middleware adding up the request body bytes the app receives."""
+
+    def __init__(self, app):
+        self.app = app
+        self.total = 0
+
+    async def __call__(self, scope, receive, send):
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                self.total += len(message.get("body", b""))
+            return message
+        await self.app(scope, counting_receive if scope["type"] == "http" else receive, send)
+
+
+async def wait_for(job_id):
+    from jobs import watch_jobs
+    async for job in watch_jobs([job_id], poll_interval=0.02, timeout=600):
+        return job
+
+
+async def multipart_upload(api, s3, name, pdf):
+    response = await api.post("/api/upload", headers=HEADERS, files={"file": (name, pdf, "application/pdf")})
+    response.raise_for_status()
+    return await wait_for(response.json()["job_id"])
+
+
+async def direct_upload(api, s3, name, pdf, content_type="application/pdf", declare_size=True):
+    request = {"filename": name, "size": len(pdf) if declare_size else None}
+    response = await api.post("/api/upload/presign", headers=HEADERS, json=request)
+    response.raise_for_status()
+    grant = response.json()
+    # Straight to the bucket; the API never sees these bytes
+    stored = await s3.post(grant["url"], data=grant["fields"], files={"file": (name, pdf, content_type)})
+    if stored.status_code >= 300:
+        return {"state": "rejected by S3", "status": stored.status_code}
+    response = await api.post(grant["finalize_url"], headers=HEADERS)
+    if response.status_code >= 400:
+        return {"state": "rejected by finalize", "status": response.status_code}
+    return await wait_for(response.json()["job_id"])
+
+
+async def run(args):
+    import analysis
+    from migrate_database import upgrade_database
+    upgrade_database()  # The app doesn't create its own schema
+    import main
+    from benchmarks.synthetic_pdf import make_cim_pdf
+    from database import async_engine, engine
+
+    analysis.s3_client.create_bucket(Bucket=BUCKET)
+    counter = CountBytesIn(main.app)
+    pdfs = [make_cim_pdf(pages=args.pages, seed=args.seed + i) for i in range(args.uploads * 2)]
+
+    results = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=counter), base_url="http://bench",
+                                 timeout=600) as api, httpx.AsyncClient(timeout=600) as s3:
+        main.job_pool.start()
+        try:
+            for label, flow, batch in [("multipart", multipart_upload, pdfs[:args.uploads]),
+                                       ("direct", direct_upload, pdfs[args.uploads:])]:
+                counter.total = 0
+                seconds, states = [], []
+                for i, pdf in enumerate(batch):
+                    start = time.perf_counter()
+                    job = await flow(api, s3, f"{label}_{i}.pdf", pdf)
+                    seconds.append(time.perf_counter() - start)
+                    states.append(job["state"])
+                results[label] = {
+                    "pdf_kb": round(statistics.mean(len(pdf) for pdf in batch) / 1024, 1),
+                    "api_bytes_in": counter.total // len(batch),
+                    "p50_s": round(statistics.median(seconds), 3),
+                    "succeeded": states.count("succeeded"),
+                }
+
+            # A client that doesn't declare the size (or lies about it) is stopped by the policy
+            too_big = await direct_upload(api, s3, "too_big.pdf", b"%PDF-1.4\n" + b"0" * (args.max_upload_mb << 20),
+                                          declare_size=False)
+            not_pdf = await direct_upload(api, s3, "not_a.pdf", b"<html>" + b" " * 4096 + b"</html>",
+                                          content_type="text/html")
+        finally:
+            await main.job_pool.stop()
+    await async_engine.dispose()
+    engine.dispose()
+    return results, too_big, not_pdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=5, help="PDFs per flow")
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-upload-mb", type=int, default=5, help="MAX_UPLOAD_MB for the run")
+    args = parser.parse_args()
+
+    from moto.server import ThreadedMotoServer
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    port = free_port()
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+    server.start()
+    configure(port, args.max_upload_mb)
+    try:
+        # The app's request logging would drown the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results, too_big, not_pdf = asyncio.run(run(args))
+    finally:
+        server.stop()
+
+    print(f"{'flow':<12}{'PDF KB':>10}{'API bytes in':>14}{'p50 s':>9}{'succeeded':>11}")
+    for label, stats in results.items():
+        print(f"{label:<12}{stats['pdf_kb']:>10}{stats['api_bytes_in']:>14}{stats['p50_s']:>9}"
+              f"{stats['succeeded']:>9}/{args.uploads}")
+    print(f"\nover {args.max_upload_mb}MB: {too_big['state']} ({too_big.get('status')}); "
+          f"not a PDF: {not_pdf['state']} ({not_pdf.get('status')})")
+
+
+if __name__ == "__main__":
+    main()
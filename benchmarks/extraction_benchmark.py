@@ -0,0 +1,68 @@
+"""
+Compare the serial PyPDF2 loop with the parallel page-level extraction engine.
+
+    python -m benchmarks.extraction_benchmark --pages 100 --workers 4
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from benchmarks.synthetic_pdf import make_cim_pdf
+from pdf_extraction import extract_text_pages, extract_pages_parallel
+
+
+def run_serial(pdf_path, max_pages):
+    start = time.perf_counter()
+    pages = extract_text_pages(pdf_path, max_pages=max_pages)
+    return time.perf_counter() - start, len(pages)
+
+
+def run_parallel(pdf_path, max_pages, workers, page_timeout):
+    async def go():
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Warm the pool so process start-up isn't counted
+            await asyncio.gather(*[
+                asyncio.get_running_loop().run_in_executor(executor, time.sleep, 0)
+                for _ in range(workers)
+            ])
+            start = time.perf_counter()
+            pages, stats = await extract_pages_parallel(
+                pdf_path, executor, max_pages=max_pages, page_timeout=page_timeout, window=workers * 2
+            )
+            return time.perf_counter() - start, len(pages), stats
+    return asyncio.run(go())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--page-timeout", type=float, default=2.0)
+    parser.add_argument("--pathological", type=int, nargs="*", default=[3, 7],
+                        help="0-based pages rendered glyph-by-glyph (slow to extract)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = str(Path(tmp) / "synthetic_cim.pdf")
+        Path(pdf_path).write_bytes(make_cim_pdf(args.pages, pathological_pages=set(args.pathological)))
+
+        print(f"{args.pages}-page document, {args.workers} workers, pathological pages {args.pathological}")
+        print(f"{'mode':<34}{'seconds':>10}{'useful pages':>14}")
+        for label, max_pages in [("first 10 useful pages", 10), ("whole document", args.pages)]:
+            serial_seconds, serial_count = run_serial(pdf_path, max_pages)
+            parallel_seconds, parallel_count, stats = run_parallel(
+                pdf_path, max_pages, args.workers, args.page_timeout
+            )
+            print(f"{'serial, ' + label:<34}{serial_seconds:>10.3f}{serial_count:>14}")
+            print(f"{'parallel, ' + label:<34}{parallel_seconds:>10.3f}{parallel_count:>14}")
+            slowest = sorted(stats["pages"], key=lambda p: p["seconds"], reverse=True)[:3]
+            print(f"  timed out: {stats['timed_out_pages']}, slowest pages: "
+                  + ", ".join(f"p{p['page']}={p['seconds']:.3f}s" for p in slowest))
+
+
+if __name__ == "__main__":
+    main()
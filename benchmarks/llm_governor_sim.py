@@ -0,0 +1,105 @@
+"""
+Simulated burst against a throttling fake LLM, with and without the governor.
+
+The fake enforces its own requests-per-minute limit and answers 429 with a
+Retry-After header past it, like OpenAI does. One user drops a batch of
+--batch calls, and --others users each submit two calls a moment later.
+
+  direct     calls go straight to the fake; a 429 is a failed analysis
+  governed   calls go through llm_governor.LLMGovernor with the same limit
+
+    python -m benchmarks.llm_governor_sim --rpm 600 --batch 50 --others 3
+
+Reports failures, 429s seen and completion latency for the batch user and
+for everyone else (the number fairness is about).
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+import openai
+
+from llm_governor import LLMGovernor, TokenBucket
+
+
+class ThrottlingLLM:
+    """Fake completion endpoint: `latency` seconds per call, 429 beyond `rpm`."""
+
+    def __init__(self, rpm, latency):
+        # Enforced per second, as OpenAI quantizes its per-minute limits
+        self.bucket = TokenBucket(rpm, burst_seconds=1)
+        self.latency = latency
+        self.throttled = 0
+
+    async def complete(self, prompt):
+        wait = self.bucket.wait_time(1)
+        if wait > 0:
+            self.throttled += 1
+            response = httpx.Response(429, headers={"retry-after": f"{wait:.3f}"},
+                                      request=httpx.Request("POST", "http://fake-llm/v1/chat/completions"))
+            raise openai.RateLimitError("Rate limit reached", response=response, body=None)
+        self.bucket.take(1)
+        await asyncio.sleep(self.latency)
+        return '{"SUMMARY": "synthetic"}', 500
+
+
+async def scenario(args, governed):
+    llm = ThrottlingLLM(args.rpm, args.latency)
+    governor = LLMGovernor(rpm=args.rpm, tpm=10 ** 9, max_retries=args.retries, backoff_base=0.2,
+                            burst_seconds=1)
+    latencies = {"batch": [], "others": []}
+    failures = {"batch": 0, "others": 0}
+
+    async def one_call(user, group, delay):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            if governed:
+                await governor.run(lambda: llm.complete("prompt"), tokens=500, user=user)
+            else:
+                await llm.complete("prompt")
+            latencies[group].append(time.perf_counter() - start)
+        except openai.RateLimitError:
+            failures[group] += 1
+
+    calls = [one_call("batch_user", "batch", 0) for _ in range(args.batch)]
+    for u in range(args.others):
+        calls += [one_call(f"user_{u}", "others", 0.1) for _ in range(2)]
+    start = time.perf_counter()
+    await asyncio.gather(*calls)
+    wall = time.perf_counter() - start
+
+    def summary(values):
+        if not values:
+            return "-"
+        ordered = sorted(values)
+        return f"p50 {statistics.median(ordered):.2f}s  max {ordered[-1]:.2f}s"
+
+    return {
+        "wall_s": round(wall, 2),
+        "failed": failures["batch"] + failures["others"],
+        "429s": llm.throttled,
+        "batch_user": summary(latencies["batch"]),
+        "other_users": summary(latencies["others"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rpm", type=float, default=600)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--others", type=int, default=3)
+    parser.add_argument("--retries", type=int, default=5)
+    args = parser.parse_args()
+
+    for label, governed in [("direct", False), ("governed", True)]:
+        # Fresh fake per run, so each starts with a full bucket
+        print(f"{label:<10}", asyncio.run(scenario(args, governed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Load tests run in-process (httpx ASGI transport, one worker).
+
+--mode results (default): the dashboard listing, async handler vs the old
+sync one. Fires bursts of concurrent GET requests and compares:
+
+  sync   the pre-async handler: `def` route on the sync Session, so every
+         request holds one of FastAPI's 40 threadpool threads
+  async  the real /api/results route on the AsyncSession
+
+    python -m benchmarks.load_test --rows 20000 --concurrency 10 100 --db-latency-ms 250
+
+--db-latency-ms adds a simulated round trip while each request holds its
+pooled connection (time.sleep on the sync path, asyncio.sleep on the async
+one), approximating a remote Postgres without needing one. The pool is
+sized with --pool-size (default 100) so the connection pool isn't the
+limit: the sync handler tops out at the 40 threadpool threads, the async
+one at the pool. "peak" is the most simulated round trips in flight at once. Pass --url
+to run against a real database instead of a temporary SQLite file.
+
+--mode uploads: whether uploads keep the event loop and threadpool free.
+Probes GET /api/test back to back while idle, then while --uploads
+synthetic CIMs are uploaded at once and analyzed (job workers, PDF
+process pool, S3 mocked with --s3-latency-ms per upload, fake LLM), and
+compares the probe latencies. --max-p95-ms exits 1 if the p95 under load
+is over it. The worst probe lands on the initial burst: Starlette parses
+multipart bodies on the event loop (direct-to-S3 uploads skip that).
+
+    python -m benchmarks.load_test --mode uploads --uploads 32 --pages 60 --max-p95-ms 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+TEMP_DIR = tempfile.mkdtemp(prefix="cim-load-")
+
+
+def configure(url, pool_size, job_workers=0):
+    # Must happen before the app (and database.py) is imported
+    os.environ["DATABASE_URL"] = url or f"sqlite:///{Path(TEMP_DIR) / 'load.db'}"
+    os.environ["DB_POOL_SIZE"] = str(pool_size)
+    os.environ["DB_MAX_OVERFLOW"] = "0"
+    os.environ["JOB_WORKERS"] = str(job_workers)
+    os.environ["JOBS_DIR"] = str(Path(TEMP_DIR) / "jobs")
+    os.environ["JOB_POLL_INTERVAL"] = "0.02"
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    for name, value in [("LLM_RPM", "1000000"), ("LLM_TPM", "1000000000"), ("S3_BUCKET_NAME", "load"),
+                        ("AWS_REGION", "us-east-1"), ("AWS_ACCESS_KEY_ID", "load"),
+                        ("AWS_SECRET_ACCESS_KEY", "load")]:
+        os.environ.setdefault(name, value)
+
+
+def seed(rows, users):
+    from datetime import datetime, timedelta
+    from database import engine
+    from models.user import User
+    from models.analysis_result import AnalysisResult
+    from search_index import index_missing_results
+
+    # Requests authenticate through the dev fallback, which maps to test_user_123
+    user_ids = ["test_user_123"] + [f"user_{u}" for u in range(1, users)]
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{"id": user_id, "full_name": user_id} for user_id in user_ids])
+        for offset in range(0, rows, 5000):
+            conn.execute(AnalysisResult.__table__.insert(), [{
+                "user_id": user_ids[i % users],
+                "filename": f"cim_{i}.pdf",
+                "preview_text": "Revenue grew 18% year over year. " * 10,
+                "summary_json": '{"SUMMARY": "synthetic"}',
+                "timestamp": start + timedelta(minutes=i),
+                "company_name": f"Company {i}",
+            } for i in range(offset, min(rows, offset + 5000))])
+        # Bulk inserts skip jobs._create_result, which indexes each new result for search
+        index_missing_results(conn)
+
+
+class InFlight:
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.current -= 1
+
+    def reset(self):
+        self.peak = 0
+
+
+in_flight = InFlight()
+
+
+def install_routes(app, latency):
+    """Add the sync baseline route and swap in sessions with simulated DB latency."""
+    from typing import Optional
+    from fastapi import Depends, Query, Request
+    from sqlalchemy.orm import Session
+    from auth import get_current_user
+    from database import SessionLocal, AsyncSessionLocal, get_db, get_async_db
+    from routes.results import (build_results_query, page_response, parse_fields, result_filters,
+                                DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+    def slow_get_db():
+        db = SessionLocal()
+        try:
+            db.connection()
+            with in_flight:
+                time.sleep(latency)
+            yield db
+        finally:
+            db.close()
+
+    async def slow_get_async_db():
+        async with AsyncSessionLocal() as db:
+            await db.connection()
+            with in_flight:
+                await asyncio.sleep(latency)
+            yield db
+
+    app.dependency_overrides[get_db] = slow_get_db
+    app.dependency_overrides[get_async_db] = slow_get_async_db
+
+    # The /api/results handler as it was before the async port
+    @app.get("/bench/results-sync")
+    def results_sync(
+        request: Request,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        fields: Optional[str] = None,
+        sort: str = "timestamp",
+        order: str = "desc",
+        filters: list = Depends(result_filters),
+        db: Session = Depends(get_db),
+        current_user=Depends(get_current_user),
+    ):
+        names = parse_fields(fields, sort)
+        query = build_results_query(current_user.id, names, sort, order, cursor, filters)
+        rows = db.execute(query.limit(limit + 1)).all()
+        return page_response(request, rows, names, sort, limit)
+
+
+async def burst(client, path, concurrency, requests_per_client):
+    latencies, errors = [], 0
+
+    async def one_client():
+        nonlocal errors
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            response = await client.get(path, params={"limit": 50, "fields": "filename,company_name"},
+                                        headers={"Authorization": "Bearer load-test"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one_client() for _ in range(concurrency)])
+    wall = time.perf_counter() - start
+    ordered = sorted(latencies)
+    return {
+        "req_per_sec": round(len(latencies) / wall, 1),
+        "p50_ms": round(statistics.median(ordered), 1),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1], 1),
+        "p99_ms": round(ordered[int(len(ordered) * 0.99) - 1], 1),
+        "errors": errors,
+    }
+
+
+async def run(args):
+    from migrate_database import upgrade_database
+    upgrade_database()  # The app doesn't create its own schema
+    import main
+    from database import engine, async_engine
+
+    seed(args.rows, args.users)
+    install_routes(main.app, args.db_latency_ms / 1000)
+    transport = httpx.ASGITransport(app=main.app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=120) as client:
+        for concurrency in args.concurrency:
+            for label, path in [("sync", "/bench/results-sync"), ("async", "/api/results")]:
+                # Warm-up so pool connections exist for both paths
+                await burst(client, path, min(concurrency, 10), 2)
+                in_flight.reset()
+                stats = await burst(client, path, concurrency, args.requests)
+                stats["peak"] = in_flight.peak
+                results.append((concurrency, label, stats))
+                print(f"  c={concurrency:<4} {label:<6} {stats}", file=sys.stderr)
+    await async_engine.dispose()
+    engine.dispose()
+    return results
+
+
+def latency_stats(samples):
+    ordered = sorted(samples)
+    return {
+        "probes": len(ordered),
+        "p50_ms": round(statistics.median(ordered), 2),
+        "p95_ms": round(ordered[int(len(ordered) * 0.95) - 1], 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+async def probe(client, stop=None, count=None):
+    """GET /api/test back to back until `stop` is set (or `count` times); returns latencies in ms."""
+    samples = []
+    while (stop is None or not stop.is_set()) and (count is None or len(samples) < count):
+        start = time.perf_counter()
+        response = await client.get("/api/test")
+        samples.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        await asyncio.sleep(0.005)
+    return samples
+
+
+async def run_uploads(args):
+    import analysis
+    from migrate_database import upgrade_database
+    upgrade_database()  # The app doesn't create its own schema
+    import main
+    from benchmarks.suite import mock_s3
+    from benchmarks.synthetic_pdf import make_cim_pdf
+    from database import engine, async_engine
+    from jobs import watch_jobs
+
+    mock_s3()
+    mocked_upload = analysis.s3_client.upload_file
+
+    def slow_upload(*a, **kwargs):
+        # A real PUT to S3 holds its threadpool thread for a round trip or more
+        time.sleep(args.s3_latency_ms / 1000)
+        mocked_upload(*a, **kwargs)
+
+    analysis.s3_client.upload_file = slow_upload
+    # A different seed per file, so the artifact cache doesn't answer them
+    pdfs = [make_cim_pdf(pages=args.pages, seed=i) for i in range(args.uploads + 1)]
+
+    def upload_request(client, i):
+        return client.build_request("POST", "/api/upload", headers={"Authorization": "Bearer load-test"},
+                                    files={"file": (f"load_{i}.pdf", pdfs[i], "application/pdf")})
+
+    async def upload(client, request):
+        response = await client.send(request)
+        response.raise_for_status()
+        return response.json()["job_id"]
+
+    async def finish(job_ids):
+        # One poll for all of them, so the benchmark's own polling doesn't load the event loop
+        return [job["state"] async for job in watch_jobs(job_ids, poll_interval=0.05, timeout=600)]
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=600) as client:
+        main.job_pool.start()
+        try:
+            # Warm-up: one upload spawns the PDF process pool, and first requests are slower
+            await finish([await upload(client, upload_request(client, args.uploads))])
+            await probe(client, count=20)
+            idle = await probe(client, count=args.probes)
+            # Encoded up front, so the client's own multipart encoding isn't counted against the app
+            requests = [upload_request(client, i) for i in range(args.uploads)]
+            stop = asyncio.Event()
+            prober = asyncio.create_task(probe(client, stop))
+            start = time.perf_counter()
+            job_ids = await asyncio.gather(*[upload(client, request) for request in requests])
+            states = await finish(job_ids)
+            wall = time.perf_counter() - start
+            stop.set()
+            loaded = await prober
+        finally:
+            await main.job_pool.stop()
+    await async_engine.dispose()
+    engine.dispose()
+    return latency_stats(idle), latency_stats(loaded), states, wall
+
+
+def main_uploads(args):
+    configure(args.url, args.pool_size, job_workers=args.workers)
+    idle, loaded, states, wall = asyncio.run(run_uploads(args))
+    print(f"\nGET /api/test while {args.uploads} {args.pages}-page uploads are analyzed "
+          f"({states.count('succeeded')} succeeded in {wall:.1f}s; {args.workers} job workers, "
+          f"{args.s3_latency_ms:g}ms S3 latency, fake LLM)")
+    print(f"{'':<10}" + "".join(f"{c:>10}" for c in idle))
+    for label, stats in [("idle", idle), ("uploads", loaded)]:
+        print(f"{label:<10}" + "".join(f"{stats[c]:>10}" for c in stats))
+    if args.max_p95_ms is not None and loaded["p95_ms"] > args.max_p95_ms:
+        print(f"\np95 under load {loaded['p95_ms']}ms is over --max-p95-ms {args.max_p95_ms:g}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["results", "uploads"], default="results")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 100])
+    parser.add_argument("--requests", type=int, default=10, help="requests per concurrent client")
+    parser.add_argument("--db-latency-ms", type=float, default=250.0)
+    parser.add_argument("--pool-size", type=int, default=100)
+    parser.add_argument("--url", help="database to test against (default: temporary SQLite file)")
+    parser.add_argument("--uploads", type=int, default=32, help="uploads in flight at once (--mode uploads)")
+    parser.add_argument("--pages", type=int, default=60, help="pages per synthetic CIM (--mode uploads)")
+    parser.add_argument("--workers", type=int, default=4, help="JOB_WORKERS (--mode uploads)")
+    parser.add_argument("--s3-latency-ms", type=float, default=200.0, help="simulated S3 upload (--mode uploads)")
+    parser.add_argument("--probes", type=int, default=200, help="idle /api/test probes (--mode uploads)")
+    parser.add_argument("--max-p95-ms", type=float, help="exit 1 if /api/test p95 under load exceeds this")
+    args = parser.parse_args()
+    if args.mode == "uploads":
+        return main_uploads(args)
+
+    configure(args.url, args.pool_size)
+    results = asyncio.run(run(args))
+
+    print(f"\n{args.rows} rows, {args.requests} requests per client, "
+          f"{args.db_latency_ms:g}ms simulated DB latency, pool of {args.pool_size}, one worker")
+    columns = list(results[0][2])
+    print(f"{'concurrency':<13}{'handler':<9}" + "".join(f"{c:>14}" for c in columns))
+    for concurrency, label, stats in results:
+        print(f"{concurrency:<13}{label:<9}" + "".join(f"{stats[c]:>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
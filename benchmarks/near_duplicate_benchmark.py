@@ -0,0 +1,109 @@
+"""
+Near-duplicate lookup latency as the corpus grows, and what a revision costs.
+
+Indexes `--sizes` synthetic CIM fingerprints (benchmarks.synthetic_pdf page
+texts, a different seed per document) in a throwaway SQLite database, then
+times near_duplicates.find_previous_version for a revised copy of one of
+them (a few pages edited, one inserted) at each size. With LSH the lookup
+reads a few index buckets, so its time should stay flat while the corpus
+grows tenfold.
+
+    python -m benchmarks.near_duplicate_benchmark --sizes 1000,10000 --pages 8
+
+Also reports how many prompt tokens the revision needs compared with a full
+analysis of the same document.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from benchmarks.synthetic_pdf import make_page_texts
+from database import Base, make_engine
+from models.user import User  # noqa: F401  registers the users table
+from models.analysis_result import AnalysisResult
+from models.cim_artifact import CimArtifact
+from models.cim_fingerprint import CimFingerprint, CimLshBucket
+import near_duplicates
+from page_selection import count_tokens, select_pages
+
+
+def revise(pages, edits):
+    revised = list(pages)
+    for i in range(edits):
+        index = 3 + i * 2
+        revised[index] = revised[index].replace("million", "mm", 2) + "\nFigures restated in the revised version."
+    revised.insert(len(pages) // 2, "SUBSEQUENT EVENTS\nThe company signed a new multi-year contract. " * 4)
+    return revised
+
+
+def index_documents(engine, start, stop, pages):
+    documents, buckets, results = [], [], []
+    for seed in range(start, stop):
+        fp = near_duplicates.fingerprint(make_page_texts(pages, seed=seed, sentences_per_page=10))
+        content_hash = f"{seed:064x}"
+        documents.append({
+            "content_hash": content_hash,
+            "signature": fp["signature"].tobytes(),
+            "page_signatures": fp["page_signatures"].tobytes(),
+            "page_hashes": json.dumps(fp["page_hashes"]),
+        })
+        buckets += [{"bucket": b, "content_hash": content_hash} for b in near_duplicates.band_buckets(fp["signature"])]
+        results.append({"user_id": "bench", "filename": f"{seed}.pdf", "summary_json": "{}", "content_hash": content_hash})
+    with engine.begin() as conn:
+        conn.execute(insert(CimArtifact), [{"sha256": d["content_hash"], "hit_count": 0} for d in documents])
+        conn.execute(insert(CimFingerprint), documents)
+        conn.execute(insert(CimLshBucket), buckets)
+        conn.execute(insert(AnalysisResult), results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="corpus sizes to measure, ascending")
+    parser.add_argument("--pages", type=int, default=8, help="pages per indexed document")
+    parser.add_argument("--edits", type=int, default=2, help="pages edited in the revision")
+    parser.add_argument("--lookups", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        original = make_page_texts(args.pages, seed=0, sentences_per_page=10)
+        revised_fp = near_duplicates.fingerprint(revise(original, args.edits))
+
+        indexed = 0
+        print(f"{'documents':>10} {'index s':>9} {'lookup p50 ms':>14} {'lookup p95 ms':>14} {'found':>6}")
+        for size in [int(s) for s in args.sizes.split(",")]:
+            start = time.perf_counter()
+            index_documents(engine, indexed, size, args.pages)
+            index_seconds = time.perf_counter() - start
+            indexed = size
+
+            samples, found = [], None
+            with Session(engine) as db:
+                for _ in range(args.lookups):
+                    start = time.perf_counter()
+                    found = near_duplicates.find_previous_version(db, "bench", "revised", revised_fp)
+                    samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            print(f"{size:>10} {index_seconds:>9.1f} {statistics.median(samples):>14.2f} "
+                  f"{samples[int(len(samples) * 0.95) - 1]:>14.2f} {str(bool(found and found['content_hash'] == f'{0:064x}')):>6}")
+
+        diff = near_duplicates.diff_pages(revised_fp, found)
+        revised = revise(original, args.edits)
+        full, _ = select_pages(revised)
+        changed, _ = select_pages([revised[i - 1] for i in diff["changed_pages"]])
+        print(f"\nrevision: similarity {diff['similarity']}, changed pages {diff['changed_pages']} "
+              f"(revised {diff['revised_pages']}, added {diff['added_pages']}), {diff['removed_pages']} removed")
+        print(f"prompt tokens: full analysis {count_tokens(chr(10).join(full))}, "
+              f"changed pages only {count_tokens(chr(10).join(changed))}")
+
+
+if __name__ == "__main__":
+    main()
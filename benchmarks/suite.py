@@ -0,0 +1,372 @@
+"""
+End-to-end benchmark suite: upload pipeline, results API and auth.
+
+Runs the real app in-process (httpx ASGI transport, one worker) against a
+temporary SQLite database, with S3 mocked out and LLM_PROVIDER=fake, and
+reports for every scenario the p50/p95/p99 latency, throughput and peak
+RSS (API process and PDF worker processes), plus the upload pipeline's
+per-stage timings. Results go to a JSON file; `compare` diffs two of them
+and exits non-zero when something regressed past the threshold.
+
+    python -m benchmarks.suite run --output bench-main.json
+    python -m benchmarks.suite run --scenarios upload --uploads 40 --pages 60 --pathological 1
+    python -m benchmarks.suite compare bench-main.json bench-branch.json --threshold 15
+
+Scenarios:
+  upload    POST /api/upload of synthetic CIMs (benchmarks.synthetic_pdf), timed
+            until each job has succeeded; stages come from the job's stage_timings
+  results   GET /api/results (default page, narrow fields, filtered + sorted)
+            and /api/results/search over --rows seeded analyses
+  auth      an authenticated no-op route with a fresh Clerk RS256 token per request,
+            a reused (cached) one, and a legacy HS256 token; JWKS is served locally
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+SCENARIOS = ["upload", "results", "auth"]
+TEMP_DIR = tempfile.mkdtemp(prefix="cim-bench-")
+AUTH_PATH = "/api/llm/queue"
+FALLBACK_HEADERS = {"Authorization": "Bearer bench"}
+
+# Metrics where a bigger number is worse, and the rest where it's better
+LOWER_IS_BETTER = ["p50_ms", "p95_ms", "p99_ms", "peak_rss_mb"]
+HIGHER_IS_BETTER = ["throughput_per_s"]
+
+
+def configure(args):
+    # Must happen before the app (and database.py / analysis.py) is imported
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(TEMP_DIR) / 'bench.db'}"
+    os.environ["JOBS_DIR"] = str(Path(TEMP_DIR) / "jobs")
+    os.environ["JOB_WORKERS"] = str(args.workers)
+    os.environ["JOB_POLL_INTERVAL"] = "0.02"
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["LLM_FAKE_PROFILE"] = args.llm_profile
+    os.environ["CLERK_JWKS_URL"] = "http://jwks.invalid/.well-known/jwks.json"
+    for name, value in [("LLM_RPM", "1000000"), ("LLM_TPM", "1000000000"), ("S3_BUCKET_NAME", "bench"),
+                        ("AWS_REGION", "us-east-1"), ("AWS_ACCESS_KEY_ID", "bench"),
+                        ("AWS_SECRET_ACCESS_KEY", "bench")]:
+        os.environ.setdefault(name, value)
+
+
+# --- measurement -------------------------------------------------------------
+
+def _proc_status_kb(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss(pids=()):
+    """Reset the kernel's high-water mark (Linux), so each scenario reports its own peak."""
+    for pid in ["self", *pids]:
+        with contextlib.suppress(OSError):
+            with open(f"/proc/{pid}/clear_refs", "w") as f:
+                f.write("5")
+
+
+def peak_rss_mb(pids=()):
+    own = _proc_status_kb("self", "VmHWM")
+    if own is None:
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB on Linux, lifetime peak
+    workers = [kb for kb in (_proc_status_kb(pid, "VmHWM") for pid in pids) if kb]
+    return round(own / 1024, 1), round(max(workers) / 1024, 1) if workers else None
+
+
+def pdf_worker_pids():
+    from analysis import pdf_executor
+    return list(getattr(pdf_executor, "_processes", None) or {})
+
+
+def summarize(latencies_ms, wall, errors=0):
+    ordered = sorted(latencies_ms)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2) if ordered else 0.0
+
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(len(ordered) / wall, 2) if wall else 0.0,
+        "p50_ms": round(statistics.median(ordered), 2) if ordered else 0.0,
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+
+async def measure(name, scenario, results):
+    """Run one scenario coroutine, adding peak RSS to the stats it returns."""
+    pids = pdf_worker_pids()
+    reset_peak_rss(pids)
+    print(f"running {name}...", file=sys.stderr)
+    stats = await scenario()
+    stats["peak_rss_mb"], stats["pdf_worker_peak_rss_mb"] = peak_rss_mb(pdf_worker_pids())
+    results[name] = stats
+    print(f"  {name}: " + ", ".join(f"{key}={stats[key]}" for key in
+                                    ["requests", "errors", "throughput_per_s", "p50_ms", "p95_ms", "p99_ms",
+                                     "peak_rss_mb"]), file=sys.stderr)
+
+
+async def fire(concurrency, total, request):
+    """Run `request(i)` for i in range(total) from `concurrency` clients; returns summary stats."""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def client():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                ok = await request(i)
+            except Exception as e:
+                print(f"request failed: {e}", file=sys.stderr)
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+# --- scenarios ---------------------------------------------------------------
+
+def mock_s3():
+    import analysis
+
+    def upload_file(path, bucket, key, **kwargs):
+        # Read the file like the transfer manager would, without the network
+        with open(path, "rb") as f:
+            while f.read(8 * 1024 * 1024):
+                pass
+
+    analysis.s3_client.upload_file = upload_file
+
+
+def synthetic_pdfs(args):
+    from benchmarks.synthetic_pdf import make_cim_pdf
+    pathological = tuple(range(2, 2 + args.pathological))
+    # A different seed per file, so the artifact cache doesn't answer them
+    return [make_cim_pdf(pages=args.pages, sentences_per_page=args.density, table_every=args.table_every,
+                         table_rows=args.table_rows, pathological_pages=pathological, seed=args.seed + i)
+            for i in range(args.uploads)]
+
+
+async def upload_scenario(client, args):
+    from jobs import watch_jobs
+    pdfs = synthetic_pdfs(args)
+    stage_seconds = {}
+
+    async def request(i):
+        response = await client.post("/api/upload", headers=FALLBACK_HEADERS,
+                                     files={"file": (f"bench_{i}.pdf", pdfs[i], "application/pdf")})
+        if response.status_code != 202:
+            return False
+        async for job in watch_jobs([response.json()["job_id"]], poll_interval=0.02, timeout=600):
+            for stage, seconds in job["stage_timings"].items():
+                stage_seconds.setdefault(stage, []).append(seconds * 1000)
+            return job["state"] == "succeeded"
+        return False
+
+    stats = await fire(args.concurrency, len(pdfs), request)
+    stats["stages"] = {stage: {key: value for key, value in summarize(values, 1).items()
+                               if key in ("p50_ms", "p95_ms", "p99_ms")}
+                       for stage, values in sorted(stage_seconds.items())}
+    return stats
+
+
+def results_requests():
+    return {
+        "results_list": ("/api/results", {"limit": 50}),
+        "results_list_narrow": ("/api/results", {"limit": 50, "fields": "filename,company_name,user_rating"}),
+        "results_filtered": ("/api/results", {"limit": 50, "sort": "revenue", "min_revenue": 1000000,
+                                              "fields": "filename,revenue"}),
+        "results_search": ("/api/results/search", {"q": "revenue", "limit": 20}),
+    }
+
+
+async def auth_requests(client, args):
+    """Clerk tokens signed with a local RSA key whose JWKS the cache is primed with."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jose import jwk, jwt
+    import auth
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    public_pem = key.public_key().public_bytes(serialization.Encoding.PEM,
+                                               serialization.PublicFormat.SubjectPublicKeyInfo)
+    public_jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": "bench", "use": "sig"}
+    public_jwk = {k: v.decode() if isinstance(v, bytes) else v for k, v in public_jwk.items()}
+    auth.jwks_cache._fetch = lambda: {"bench": public_jwk}
+    auth.jwks_cache.refresh()
+
+    def clerk_token(i):
+        claims = {"sub": f"user_{i % 50}", "iss": auth.CLERK_ISSUER, "aud": auth.CLERK_ISSUER,
+                  "exp": int(time.time()) + 3600, "jti": str(i)}
+        return jwt.encode(claims, private_pem, algorithm="RS256", headers={"kid": "bench"})
+
+    fresh = [clerk_token(i) for i in range(args.requests)]
+    reused = clerk_token(-1)
+    custom = auth.create_access_token({"sub": "legacy@example.com"})
+    return {
+        "auth_clerk_fresh": lambda i: fresh[i],
+        "auth_clerk_cached": lambda i: reused,
+        "auth_custom_hs256": lambda i: custom,
+    }
+
+
+# --- runner ------------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_suite(args):
+    from migrate_database import upgrade_database
+    upgrade_database()  # The app doesn't create its own schema
+    import main
+    from database import engine, async_engine
+
+    mock_s3()
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        if "upload" in args.scenarios:
+            main.job_pool.start()
+            try:
+                await measure("upload", lambda: upload_scenario(client, args), results)
+            finally:
+                await main.job_pool.stop()
+
+        if "results" in args.scenarios:
+            from benchmarks.load_test import seed
+            seed(args.rows, 20)
+            for name, (path, params) in results_requests().items():
+                async def request(i, path=path, params=params):
+                    response = await client.get(path, params=params, headers=FALLBACK_HEADERS)
+                    return response.status_code == 200
+                await measure(name, lambda: fire(args.concurrency, args.requests, request), results)
+
+        if "auth" in args.scenarios:
+            for name, token_for in (await auth_requests(client, args)).items():
+                async def request(i, token_for=token_for):
+                    response = await client.get(AUTH_PATH, headers={"Authorization": f"Bearer {token_for(i)}"})
+                    return response.status_code == 200
+                await measure(name, lambda: fire(args.concurrency, args.requests, request), results)
+
+    await async_engine.dispose()
+    engine.dispose()
+    return results
+
+
+def run(args):
+    configure(args)
+    # The app's request logging (auth prints every token) would drown the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = asyncio.run(run_suite(args))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("command", "func", "output")},
+        "scenarios": results,
+    }
+    print(json.dumps(report["scenarios"], indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2) + "\n")
+        print(f"wrote {args.output}", file=sys.stderr)
+
+
+def compare(args):
+    """Print per-metric changes between two runs; exit 1 if any got worse by more than --threshold %."""
+    old, new = (json.loads(Path(path).read_text()) for path in (args.baseline, args.candidate))
+    print(f"baseline {old['meta'].get('commit')}  ->  candidate {new['meta'].get('commit')}")
+    regressions = []
+    rows = []
+    for name in sorted(set(old["scenarios"]) & set(new["scenarios"])):
+        before, after = old["scenarios"][name], new["scenarios"][name]
+        rows.append((name, before, after, LOWER_IS_BETTER + HIGHER_IS_BETTER))
+        # Pipeline stages are compared on their p95
+        for stage in sorted(set(before.get("stages") or {}) & set(after.get("stages") or {})):
+            rows.append((f"{name}:{stage}", before["stages"][stage], after["stages"][stage], ["p95_ms"]))
+    for name, before, after, metrics in rows:
+        for metric in metrics:
+            a, b = before.get(metric), after.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a * 100
+            worse = change > args.threshold if metric in LOWER_IS_BETTER else -change > args.threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"{name:<22}{metric:<18}{a:>12}{b:>12}{change:>+9.1f}%{flag}")
+            if worse:
+                regressions.append((name, metric))
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:g}%")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the scenarios and write a JSON report")
+    run_parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    run_parser.add_argument("--output", help="JSON file to write the results to")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--requests", type=int, default=200, help="requests per results/auth scenario")
+    run_parser.add_argument("--rows", type=int, default=20000, help="analyses seeded for the results scenarios")
+    run_parser.add_argument("--uploads", type=int, default=16)
+    run_parser.add_argument("--pages", type=int, default=40)
+    run_parser.add_argument("--density", type=int, default=18, help="sentences per page")
+    run_parser.add_argument("--table-every", type=int, default=5)
+    run_parser.add_argument("--table-rows", type=int, default=8)
+    run_parser.add_argument("--pathological", type=int, default=0, help="slow-to-parse pages per PDF")
+    run_parser.add_argument("--workers", type=int, default=2, help="JOB_WORKERS")
+    run_parser.add_argument("--llm-profile", default="fast", help="LLM_FAKE_PROFILE")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="diff two JSON reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=10.0, help="percent change that counts")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Synthetic CIM PDFs for benchmarks.
+
+Writes plain PDF 1.4 by hand (Helvetica text only) so the benchmarks need
+nothing beyond what the app already installs.
+"""
+
+import random
+
+SECTIONS = [
+    "Executive Summary",
+    "Company Overview",
+    "Products and Services",
+    "Customers and Markets",
+    "Management Team",
+    "Historical Financial Performance",
+    "Projected Financial Performance",
+    "Investment Highlights",
+    "Key Risks",
+]
+
+SENTENCES = [
+    "The Company is a leading provider of mission-critical software to mid-market manufacturers.",
+    "Revenue grew from ${rev1}M in {y1} to ${rev2}M in {y2}, a compound annual growth rate of {cagr}%.",
+    "Adjusted EBITDA was ${ebitda}M in {y2}, representing a margin of {margin}%.",
+    "Recurring revenue accounts for {recurring}% of total revenue with net retention above {nrr}%.",
+    "The top ten customers represent {conc}% of revenue and the largest customer {top}%.",
+    "Free cash flow conversion has averaged {fcf}% of EBITDA over the last three years.",
+    "Management believes the business can expand into adjacent verticals through add-on acquisitions.",
+    "Capital expenditures were ${capex}M in {y2}, or {capex_pct}% of revenue.",
+    "The Company operates {sites} facilities and employs approximately {employees} people.",
+    "Gross margin improved by {gm_bps} basis points driven by pricing and procurement initiatives.",
+]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text, width=90):
+    lines = []
+    for paragraph in text.split("\n"):
+        while len(paragraph) > width:
+            cut = paragraph.rfind(" ", 0, width)
+            cut = cut if cut > 0 else width
+            lines.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        lines.append(paragraph)
+    return lines
+
+
+def _text_stream(lines):
+    ops = ["BT /F1 9 Tf 50 760 Td 11 TL"]
+    for line in lines:
+        ops.append(f"({_escape(line)}) Tj T*")
+    ops.append("ET")
+    return "\n".join(ops)
+
+
+def _pathological_stream(ops=40000):
+    """A page drawn one glyph at a time; slow for PyPDF2 to extract."""
+    out = ["BT /F1 6 Tf 20 780 Td"]
+    for i in range(ops):
+        out.append(f"1 0 Td ({chr(65 + i % 26)}) Tj")
+        if i % 90 == 89:
+            out.append("-90 -7 Td")
+    out.append("ET")
+    return "\n".join(out)
+
+
+def _fill(sentence, rng):
+    y2 = rng.randint(2019, 2024)
+    rev1 = rng.randint(20, 200)
+    return sentence.format(
+        rev1=rev1, rev2=int(rev1 * rng.uniform(1.1, 1.8)), y1=y2 - 3, y2=y2,
+        cagr=rng.randint(5, 30), ebitda=rng.randint(5, 60), margin=rng.randint(10, 40),
+        recurring=rng.randint(40, 95), nrr=rng.randint(95, 125), conc=rng.randint(15, 60),
+        top=rng.randint(3, 15), fcf=rng.randint(50, 95), capex=rng.randint(1, 10),
+        capex_pct=rng.randint(1, 8), sites=rng.randint(2, 20), employees=rng.randint(50, 2000),
+        gm_bps=rng.randint(50, 400),
+    )
+
+
+def _table(rng, rows=8):
+    years = [2021, 2022, 2023, 2024]
+    lines = ["($ in millions)       " + "   ".join(f"FY{y}" for y in years)]
+    for label in ["Revenue", "Gross Profit", "Adj. EBITDA", "Capex", "Free Cash Flow",
+                  "Net Debt", "Headcount", "Customers"][:rows]:
+        base = rng.uniform(5, 150)
+        values = "   ".join(f"{base * (1 + 0.1 * i):6.1f}" for i in range(len(years)))
+        lines.append(f"{label:<22}{values}")
+    return "\n".join(lines)
+
+
+def make_page_texts(pages=100, sentences_per_page=18, table_every=5, seed=0, table_rows=8):
+    """Build the text of each page: a cover, a confidentiality notice, then
+    prose sections with a financial table (`table_rows` lines) every
+    `table_every` pages."""
+    rng = random.Random(seed)
+    texts = ["PROJECT ATLAS\nConfidential Information Memorandum", "CONFIDENTIAL\n" + (
+        "This Memorandum has been prepared solely for the use of prospective acquirers. " * 6)]
+    for i in range(2, pages):
+        title = SECTIONS[i % len(SECTIONS)]
+        body = " ".join(_fill(rng.choice(SENTENCES), rng) for _ in range(sentences_per_page))
+        text = f"{title}\n{body}"
+        if table_every and i % table_every == 0:
+            text += "\n" + _table(rng, table_rows)
+        text += f"\nProject Atlas | Confidential | Page {i + 1}"
+        texts.append(text)
+    return texts[:pages]
+
+
+def build_pdf(page_texts, pathological_pages=()):
+    """Render page texts to PDF bytes. Pages listed in `pathological_pages`
+    (0-based) are replaced with a glyph-by-glyph page that is slow to extract."""
+    objects = [None, None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for i, text in enumerate(page_texts):
+        stream = _pathological_stream() if i in pathological_pages else _text_stream(_wrap(text))
+        content_id = len(objects) + 2
+        page_refs.append(len(objects) + 1)
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        objects.append(f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream")
+    objects[0] = "<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def make_cim_pdf(pages=100, sentences_per_page=18, table_every=5, pathological_pages=(), seed=0, table_rows=8):
+    return build_pdf(make_page_texts(pages, sentences_per_page, table_every, seed, table_rows), pathological_pages)
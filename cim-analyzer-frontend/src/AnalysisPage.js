@@ -81,15 +81,13 @@ export default function AnalysisPage() {
         const jwt = await getToken();
         if (!jwt) throw new Error("No Clerk JWT found");
         
-        const res = await fetch(`http://127.0.0.1:8000/api/results`, {
+        const res = await fetch(`http://127.0.0.1:8000/api/results/${id}`, {
           headers: { Authorization: `Bearer ${jwt}` },
         });
         
         if (!res.ok) throw new Error(`Server error: ${res.status}`);
         
-        const data = await res.json();
-        const found = data.find((r) => String(r.id) === String(id));
-        setResult(found);
+        setResult(await res.json());
       } catch (error) {
         console.error("Error fetching analysis:", error);
       }
@@ -2,18 +2,9 @@ import React, { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import { useAuth } from "@clerk/clerk-react";
 
-// Helper to get a clean, short title for each CIM
-function getCimTitle(summaryJson, fallback) {
-  let summary;
-  try {
-    summary = typeof summaryJson === "string" ? JSON.parse(summaryJson) : summaryJson;
-  } catch {
-    return fallback;
-  }
-  const name = summary?.["COMPANY INFO"]?.Name || "Unknown Company";
-  const desc = summary?.["COMPANY INFO"]?.Description || "";
-  const subtitle = desc.split(" ").slice(0, 6).join(" ") + (desc.split(" ").length > 6 ? "..." : "");
-  return `${name} – ${subtitle}`;
+// Helper to get a clean, short title for each CIM (company_name is parsed from the summary when it's saved)
+function getCimTitle(result) {
+  return result.company_name ? `${result.company_name} – ${result.filename}` : result.filename;
 }
 
 function Dashboard() {
@@ -21,6 +12,7 @@ function Dashboard() {
   const [file, setFile] = useState(null);
   const [response, setResponse] = useState(null);
   const [results, setResults] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [ratings, setRatings] = useState({});
   const [confidences, setConfidences] = useState({});
   const navigate = useNavigate();
@@ -60,8 +52,12 @@ function Dashboard() {
 
       if (!res.ok) throw new Error(`Server error: ${res.status}`);
 
-      const result = await res.json();
-      setResponse(result);
+      const job = await res.json();
+      setResponse(job);
+      const finished = job.state === "succeeded" ? job : await waitForJob(job.job_id);
+      if (finished.state === "failed") {
+        setResponse({ error: finished.error || "Analysis failed. Please try again." });
+      }
       fetchResults();
     } catch (error) {
       setResponse({ error: "Upload failed. Please try again." });
@@ -70,11 +66,33 @@ function Dashboard() {
     }
   };
 
-  const fetchResults = async () => {
+  // Poll the analysis job until a worker finishes it
+  const waitForJob = async (jobId) => {
+    while (true) {
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      const jwt = await getToken();
+      const res = await fetch(`http://127.0.0.1:8000/api/jobs/${jobId}`, {
+        headers: {
+          Authorization: `Bearer ${jwt}`,
+        },
+      });
+      if (!res.ok) throw new Error(`Server error: ${res.status}`);
+      const job = await res.json();
+      if (job.state === "succeeded" || job.state === "failed") return job;
+    }
+  };
+
+  // Light columns only; the full summary is fetched by the analysis page
+  const LIST_FIELDS = "filename,company_name,user_rating,confidence_score";
+
+  // Fetch a page of results (newest first); pass a cursor to append the next page
+  const fetchResults = async (cursor = null) => {
     try {
       const jwt = await getToken();
       if (!jwt) throw new Error("No Clerk JWT found");
-      const res = await fetch("http://127.0.0.1:8000/api/results", {
+      const params = new URLSearchParams({ fields: LIST_FIELDS });
+      if (cursor) params.set("cursor", cursor);
+      const res = await fetch(`http://127.0.0.1:8000/api/results?${params}`, {
         headers: {
           Authorization: `Bearer ${jwt}`,
         },
@@ -85,14 +103,14 @@ function Dashboard() {
         return;
       }
 
-      const data = await res.json();
-      // Sort by recency (most recent first)
-      data.sort((a, b) => new Date(b.timestamp) - new Date(a.timestamp));
-      setResults(data);
+      const page = await res.json();
+      const data = page.items;
+      setResults((prev) => (cursor ? [...prev, ...data] : data));
+      setNextCursor(page.next_cursor);
       
       // Load existing ratings and confidence values
-      const ratingsData = {};
-      const confidencesData = {};
+      const ratingsData = cursor ? { ...ratings } : {};
+      const confidencesData = cursor ? { ...confidences } : {};
       
       data.forEach(result => {
         if (result.user_rating) {
@@ -273,9 +291,9 @@ function Dashboard() {
                   <div className="flex-1 min-w-0 text-left">
                     <h3
                       className="font-bold text-lg mb-1 truncate"
-                      title={getCimTitle(res.summary_json, res.filename)}
+                      title={getCimTitle(res)}
                     >
-                      {getCimTitle(res.summary_json, res.filename)}
+                      {getCimTitle(res)}
                     </h3>
                     <p className="text-xs text-gray-500 mb-2 truncate">
                       {new Date(res.timestamp).toLocaleString()}
@@ -346,6 +364,14 @@ function Dashboard() {
           ) : (
             <div className="text-gray-500 text-center py-8">No CIMs uploaded yet. Upload your first CIM to get started!</div>
           )}
+          {nextCursor && (
+            <button
+              onClick={() => fetchResults(nextCursor)}
+              className="mt-4 text-blue-600 hover:underline"
+            >
+              Load more
+            </button>
+          )}
         </div>
       </div>
     </div>
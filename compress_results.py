@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Compress analysis_results.summary_json and preview_text in place (SQLite).
+
+Trains a zstd dictionary on the stored analyses if there isn't one yet (or
+with --train, a fresh one from the latest rows), then rewrites every value
+that isn't already compressed with the newest dictionary. New results are
+compressed as they're written; this is for rows from before, and for moving
+old rows onto a retrained dictionary.
+
+Like backfill_summary_fields.py it works in small id-ordered batches, each
+in its own short transaction, so the app keeps serving requests, and it can
+be stopped and rerun. The file only shrinks after a VACUUM (--vacuum, which
+locks the database while it runs). --decompress turns everything back into
+plain text.
+"""
+
+import argparse
+import time
+
+from sqlalchemy import Text, bindparam, select, text, type_coerce, update
+
+import compression
+from database import SessionLocal, engine
+from models.user import User  # noqa: F401  registers the users table
+from models.analysis_result import AnalysisResult
+
+# Fewer rows than this don't make a useful dictionary
+MIN_TRAINING_ROWS = 100
+
+COLUMNS = ["summary_json", "preview_text"]
+
+
+def _raw(column):
+    # Stored value as-is (zstd bytes or plain text), skipping CompressedText's decompression
+    return type_coerce(getattr(AnalysisResult, column), Text).label(column)
+
+
+def train(db, sample_rows=2000):
+    """Train and store a dictionary from the latest rows. Returns its id, or None if there's too little data."""
+    rows = db.execute(select(AnalysisResult.summary_json, AnalysisResult.preview_text)
+                      .order_by(AnalysisResult.id.desc()).limit(sample_rows)).all()
+    if len(rows) < MIN_TRAINING_ROWS:
+        print(f"Only {len(rows)} results; need {MIN_TRAINING_ROWS} to train a dictionary, compressing without one")
+        return None
+    dict_id = compression.train_dictionary(db, [value for row in rows for value in row])
+    print(f"✓ Trained dictionary {dict_id} on {len(rows)} results")
+    return dict_id
+
+
+def _rewrite(encode, batch_size, pause, verb):
+    """Replace each stored value with encode(value), batch by batch. Returns the number of rows updated."""
+    statement = update(AnalysisResult.__table__).where(AnalysisResult.__table__.c.id == bindparam("row_id")).values(
+        {column: bindparam(column, type_=Text) for column in COLUMNS}
+    )
+    last_id = 0
+    updated = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.execute(select(AnalysisResult.id, *[_raw(column) for column in COLUMNS]).where(
+                AnalysisResult.id > last_id
+            ).order_by(AnalysisResult.id).limit(batch_size)).all()
+            if not rows:
+                break
+
+            changes = []
+            for row in rows:
+                values = {"row_id": row.id}
+                values.update({column: encode(getattr(row, column)) for column in COLUMNS})
+                # encode returns the stored object itself when there's nothing to do
+                if any(values[column] is not getattr(row, column) for column in COLUMNS):
+                    changes.append(values)
+            if changes:
+                db.execute(statement, changes)
+            db.commit()
+        finally:
+            db.close()
+
+        last_id = rows[-1].id
+        updated += len(changes)
+        print(f"✓ {verb} {updated} rows (through id {last_id})")
+        # Give other writers a turn between batches
+        time.sleep(pause)
+
+    print(f"✓ Done: {updated} rows {verb.lower()}")
+    return updated
+
+
+def compress_results(batch_size=500, pause=0.05, retrain=False, sample_rows=2000):
+    """Rewrite every value not compressed with the active dictionary. Returns the number of rows updated."""
+    if engine.dialect.name != "sqlite":
+        print("Nothing to do: compressed columns are only used on SQLite (Postgres compresses them with TOAST)")
+        return 0
+    compression.load_dictionaries(engine)
+    db = SessionLocal()
+    try:
+        if retrain or not compression.active_dictionary_id():
+            train(db, sample_rows)
+    finally:
+        db.close()
+    active = compression.active_dictionary_id()
+
+    def encode(stored):
+        if stored is None or compression.dictionary_id(stored) == active:
+            return stored
+        return compression.compress(compression.decompress(stored))
+
+    return _rewrite(encode, batch_size, pause, "Compressed")
+
+
+def decompress_results(batch_size=500, pause=0.05):
+    """Store every value as plain text again (before downgrading past the dictionaries table)."""
+    compression.load_dictionaries(engine)
+    return _rewrite(compression.decompress, batch_size, pause, "Decompressed")
+
+
+def storage_report():
+    """{column: {"text"/"blob"/"null": {"rows", "bytes"}}}: how each column is stored and its size."""
+    with engine.connect() as conn:
+        report = {}
+        for column in COLUMNS:
+            counts = conn.execute(text(
+                f"SELECT typeof({column}), count(*), coalesce(sum(length(CAST({column} AS BLOB))), 0) "
+                f"FROM analysis_results GROUP BY 1"
+            )).all()
+            report[column] = {kind: {"rows": rows, "bytes": size} for kind, rows, size in counts}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compress summary_json and preview_text with a trained zstd dictionary.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.05, help="Seconds to sleep between batches")
+    parser.add_argument("--train", action="store_true", help="Train a new dictionary first, even if there is one")
+    parser.add_argument("--samples", type=int, default=2000, help="Latest results to train on")
+    parser.add_argument("--decompress", action="store_true", help="Store everything as plain text again")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to return the space to the OS")
+    args = parser.parse_args()
+    compression.CompressionDictionary.__table__.create(engine, checkfirst=True)
+    if args.decompress:
+        decompress_results(args.batch_size, args.pause)
+    else:
+        compress_results(args.batch_size, args.pause, args.train, args.samples)
+    if args.vacuum and engine.dialect.name == "sqlite":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+        print("✓ Vacuumed")
+    for column, kinds in storage_report().items():
+        print(f"{column}: " + ", ".join(f"{kind} {stats['rows']} rows / {stats['bytes']} bytes"
+                                         for kind, stats in kinds.items()))
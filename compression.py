@@ -0,0 +1,168 @@
+"""
+Transparent zstd compression for the large text columns of analysis_results.
+
+`CompressedText` is a column type that stores a str as a zstd frame,
+compressed with a dictionary trained on this database's own analyses
+(`python compress_results.py --train`). LLM outputs share most of their
+keys and phrasing, so a dictionary shrinks a 2-3KB summary several times
+more than zstd alone.
+
+Each frame names its dictionary in the header, and all dictionaries are
+kept in `compression_dictionaries`, so retraining never strands old rows;
+new writes use the newest dictionary. Values that are still plain text
+(written before compression, or not worth compressing) are read as they
+are, which is what lets compress_results.py convert a live table in
+batches.
+
+SQLite only: on Postgres the column stays text, because TOAST already
+compresses large values and the search index reads them in SQL. On SQLite
+the search index is written from Python with the plain text, so no SQL
+ever needs to decompress a value (see search_index.py).
+"""
+
+import os
+import threading
+
+from sqlalchemy import Text, select
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # Optional: without it values are stored as plain text
+    zstandard = None
+
+from models.compression_dictionary import CompressionDictionary
+
+COMPRESSION_LEVEL = int(os.getenv("ZSTD_LEVEL", "9"))
+DICTIONARY_SIZE = int(os.getenv("ZSTD_DICTIONARY_SIZE", str(64 * 1024)))
+# Values shorter than this aren't worth a frame header
+MIN_COMPRESS_BYTES = 64
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+_dictionaries = {}  # dict_id -> zstandard.ZstdCompressionDict
+_active_id = None  # Dictionary for new writes; None compresses without one
+_source = None  # Engine to fetch dictionaries this process hasn't seen yet
+_lock = threading.Lock()
+_local = threading.local()  # Compressors and decompressors aren't thread-safe
+
+
+def is_compressed(value):
+    return isinstance(value, (bytes, bytearray, memoryview)) and bytes(value[:4]) == ZSTD_MAGIC
+
+
+def dictionary_id(value):
+    """Dictionary a stored value was compressed with: None for plain text, 0 for no dictionary."""
+    if not is_compressed(value):
+        return None
+    return zstandard.get_frame_parameters(bytes(value)).dict_id
+
+
+def load_dictionaries(engine):
+    """Load every stored dictionary and make the newest one active.
+
+    Called at startup; `engine` is also where dictionaries trained later by
+    another process are fetched from when a value needs one.
+    """
+    global _active_id, _source
+    _source = engine
+    if zstandard is None:
+        return
+    with engine.connect() as conn:
+        rows = conn.execute(select(CompressionDictionary.dict_id, CompressionDictionary.data)
+                            .order_by(CompressionDictionary.created_at, CompressionDictionary.dict_id)).all()
+    with _lock:
+        for dict_id, data in rows:
+            _dictionaries.setdefault(dict_id, _make_dictionary(data))
+        _active_id = rows[-1].dict_id if rows else None
+
+
+def train_dictionary(db, samples):
+    """Train a dictionary on a list of strings, store it and make it active. Commits."""
+    global _active_id
+    encoded = [sample.encode() for sample in samples if sample]
+    trained = zstandard.train_dictionary(DICTIONARY_SIZE, encoded, level=COMPRESSION_LEVEL)
+    db.merge(CompressionDictionary(dict_id=trained.dict_id(), data=trained.as_bytes(), sample_count=len(encoded)))
+    db.commit()
+    with _lock:
+        _dictionaries[trained.dict_id()] = _make_dictionary(trained.as_bytes())
+        _active_id = trained.dict_id()
+    return trained.dict_id()
+
+
+def active_dictionary_id():
+    return _active_id or 0
+
+
+def _make_dictionary(data):
+    dictionary = zstandard.ZstdCompressionDict(data)
+    dictionary.precompute_compress(level=COMPRESSION_LEVEL)
+    return dictionary
+
+
+def _dictionary(dict_id):
+    if dict_id not in _dictionaries and _source is None:
+        from database import engine
+        load_dictionaries(engine)
+    if dict_id not in _dictionaries:
+        # Trained by another process since we loaded; a one-off small read
+        with _source.connect() as conn:
+            data = conn.scalar(select(CompressionDictionary.data).where(CompressionDictionary.dict_id == dict_id))
+        if data is None:
+            raise LookupError(f"zstd dictionary {dict_id} is missing from compression_dictionaries")
+        with _lock:
+            _dictionaries.setdefault(dict_id, _make_dictionary(data))
+    return _dictionaries[dict_id]
+
+
+def _codec(kind, dict_id):
+    key = (kind, dict_id)
+    codec = _local.__dict__.get(key)
+    if codec is None:
+        dictionary = _dictionary(dict_id) if dict_id else None
+        if kind == "c":
+            codec = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dictionary)
+        else:
+            codec = zstandard.ZstdDecompressor(dict_data=dictionary)
+        _local.__dict__[key] = codec
+    return codec
+
+
+def compress(text):
+    """bytes to store for `text`, or the text itself if compressing doesn't pay."""
+    if text is None or zstandard is None:
+        return text
+    raw = text.encode()
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return text
+    frame = _codec("c", active_dictionary_id()).compress(raw)
+    return frame if len(frame) < len(raw) else text
+
+
+def decompress(value):
+    """The text of a stored value, compressed or not."""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value[:4] != ZSTD_MAGIC:
+        return value.decode()
+    return _codec("d", zstandard.get_frame_parameters(value).dict_id).decompress(value).decode()
+
+
+class CompressedText(TypeDecorator):
+    """Text column stored as a zstd frame on SQLite; reads return plain str.
+
+    The column is still declared TEXT: SQLite keeps each value's own type,
+    so compressed (BLOB) and not-yet-compressed (TEXT) rows can sit side by
+    side and no table rebuild is needed.
+    """
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if dialect.name != "sqlite":
+            return value
+        return compress(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress(value)
@@ -1,14 +1,103 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from dotenv import load_dotenv
 import os
 
-# Use SQLite for development
-DATABASE_URL = "sqlite:///./cim_analyzer.db"
+load_dotenv()
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# SQLite for development; set DATABASE_URL (e.g. postgresql://postgres:password@db:5432/cimdb) for Postgres
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cim_analyzer.db")
+
+# SQLite tuning
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Postgres connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+
+def _tune_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers carry on while a writer commits; NORMAL skips the per-commit fsync
+    # of the WAL (still crash-safe, a power cut can lose the last commits)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+def _pool_options(overrides):
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    options.update(overrides)
+    return options
+
+
+def make_engine(url=DATABASE_URL, tune_sqlite=True, **kwargs):
+    """Create an engine with the settings for its backend.
+
+    SQLite gets WAL, synchronous=NORMAL and a busy timeout on every
+    connection (`tune_sqlite=False` leaves the defaults, for benchmarks).
+    Postgres gets a sized pool with pre-ping so connections dropped by the
+    server are replaced instead of failing a request.
+    """
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        options = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+        options.update(kwargs)
+        engine = create_engine(url, connect_args={"check_same_thread": False}, **options)
+        if tune_sqlite:
+            event.listen(engine, "connect", _tune_sqlite)
+        return engine
+    return create_engine(url, **_pool_options(kwargs))
+
+
+# Async drivers for the same databases, used by request handlers that await the DB
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def to_async_url(url):
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db, postgresql://... -> postgresql+asyncpg://..."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def make_async_engine(url=DATABASE_URL, tune_sqlite=True, **kwargs):
+    """Async counterpart of make_engine, with the same SQLite pragmas and Postgres pool settings."""
+    async_url = to_async_url(url)
+    if make_url(async_url).get_backend_name() == "sqlite":
+        # aiosqlite defaults to NullPool (a new connection and thread per checkout); pool them instead
+        options = {"poolclass": AsyncAdaptedQueuePool, "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+        options.update(kwargs)
+        engine = create_async_engine(async_url, **options)
+        if tune_sqlite:
+            event.listen(engine.sync_engine, "connect", _tune_sqlite)
+        return engine
+    return create_async_engine(async_url, **_pool_options(kwargs))
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+async_engine = make_async_engine()
+# expire_on_commit=False: attributes stay readable after commit without an implicit (sync) reload
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession,
+                                       autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 # Dependency
@@ -18,3 +107,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Async dependency, for handlers that shouldn't hold a threadpool thread while the DB works
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,194 @@
+"""
+Stream analysis results out as CSV, NDJSON or Parquet.
+
+Rows come off a server-side cursor (`yield_per`) in batches of
+EXPORT_BATCH_ROWS and each batch is encoded and sent before the next is
+fetched, so memory stays flat however many results a user has. The
+summary_json blob is flattened into one `summary.*` column per field of the
+analysis schema (lists joined with "; "), the same columns for every row.
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Integer
+
+from analysis import ANALYSIS_SCHEMA
+from database import AsyncSessionLocal
+from models.analysis_result import AnalysisResult
+from summary_fields import load_summary
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for format=parquet
+    pa = pq = None
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "500"))
+LIST_SEPARATOR = "; "
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def _paths(node, prefix=()):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _paths(value, prefix + (key,))
+    else:
+        yield prefix
+
+
+# ("FINANCIALS", "Actuals", "revenue") -> "summary.FINANCIALS.Actuals.revenue"
+SUMMARY_PATHS = list(_paths(json.loads(ANALYSIS_SCHEMA)))
+SUMMARY_COLUMNS = ["summary." + ".".join(path) for path in SUMMARY_PATHS]
+
+
+def _flat_value(value):
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(str(item) for item in value if item not in ("", None))
+    if isinstance(value, dict):
+        return json.dumps(value)
+    if value is None or value == "":
+        return None
+    return str(value)
+
+
+def flatten_summary(summary_json):
+    """Values for SUMMARY_COLUMNS, in order (None where the analysis lacks a field)."""
+    summary = load_summary(summary_json) or {}
+    values = []
+    for path in SUMMARY_PATHS:
+        node = summary
+        for key in path:
+            node = node.get(key) if isinstance(node, dict) else None
+        values.append(_flat_value(node))
+    return values
+
+
+class _CsvEncoder:
+    def __init__(self, columns):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.columns = columns
+
+    def _drain(self):
+        data = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+    def start(self):
+        self.writer.writerow(self.columns)
+        return self._drain()
+
+    def encode(self, rows):
+        self.writer.writerows(rows)
+        return self._drain()
+
+    def finish(self):
+        return b""
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns):
+        self.columns = columns
+
+    def start(self):
+        return b""
+
+    def encode(self, rows):
+        lines = [
+            json.dumps(dict(zip(self.columns, row)), default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+            for row in rows
+        ]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def finish(self):
+        return b""
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that keeps what the Parquet writer wrote until it is drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(column):
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    return pa.string()
+
+
+class _ParquetEncoder:
+    """One row group per batch, written to the response as soon as it's encoded."""
+
+    def __init__(self, columns):
+        table_columns = AnalysisResult.__table__.columns
+        self.schema = pa.schema([
+            (name, _arrow_type(table_columns[name]) if name in table_columns else pa.string())
+            for name in columns
+        ])
+        self.sink = _ChunkSink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema, compression="snappy")
+
+    def start(self):
+        return self.sink.drain()
+
+    def encode(self, rows):
+        arrays = [list(column) for column in zip(*rows)]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        return self.sink.drain()
+
+    def finish(self):
+        self.writer.close()  # writes the footer
+        return self.sink.drain()
+
+
+ENCODERS = {"csv": _CsvEncoder, "ndjson": _NdjsonEncoder, "parquet": _ParquetEncoder}
+
+
+async def stream_export(query, names, fmt, batch_rows=EXPORT_BATCH_ROWS):
+    """Yield the encoded bytes of `query`'s rows (columns `names`, including summary_json).
+
+    Runs in its own session, which lives exactly as long as the response.
+    """
+    summary_index = names.index("summary_json")
+    columns = [name for name in names if name != "summary_json"] + SUMMARY_COLUMNS
+    encoder = ENCODERS[fmt](columns)
+    # The header goes out before the query runs
+    yield encoder.start()
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_rows))
+        async for partition in result.partitions():
+            rows = []
+            for row in partition:
+                values = list(row)
+                summary_json = values.pop(summary_index)
+                rows.append(values + flatten_summary(summary_json))
+            yield encoder.encode(rows)
+    yield encoder.finish()
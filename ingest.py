@@ -0,0 +1,273 @@
+"""
+Streamed, memory-bounded upload ingestion.
+
+Multipart uploads are parsed straight off the request stream: each file
+part is written to its own spool file and hashed as its bytes arrive, and
+the request is abandoned as soon as it passes the size limit, whether or
+not it declared a Content-Length. Nothing is buffered or copied first, so
+an upload never needs more than one chunk in memory and is written to disk
+once, no matter how large the PDF is.
+
+Clients can also skip the API entirely for the bytes: they get a presigned
+POST for a per-upload key under DIRECT_UPLOAD_PREFIX, send the PDF straight
+to the bucket, and ask the API to finalize it.
+"""
+
+import hashlib
+import os
+import tempfile
+import zipfile
+from pathlib import Path, PurePath, PurePosixPath
+
+from fastapi.concurrency import run_in_threadpool
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "100"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+MAX_BATCH_UPLOAD_MB = int(os.getenv("MAX_BATCH_UPLOAD_MB", "1000"))
+MAX_BATCH_UPLOAD_BYTES = MAX_BATCH_UPLOAD_MB * 1024 * 1024
+# Direct-to-S3 uploads wait here until a worker fetches them; add a bucket lifecycle
+# rule expiring this prefix after a day to clear uploads that are never finalized
+DIRECT_UPLOAD_PREFIX = os.getenv("DIRECT_UPLOAD_PREFIX", "incoming/")
+DIRECT_UPLOAD_EXPIRES = int(os.getenv("DIRECT_UPLOAD_EXPIRES", "900"))  # Seconds the presigned POST is valid
+# Room for multipart boundaries and headers on top of the files themselves
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """The upload went past MAX_UPLOAD_BYTES and was discarded."""
+
+
+class EmptyUploadError(Exception):
+    """The upload had no bytes."""
+
+
+class MultipartUploadError(Exception):
+    """The request body isn't a multipart form we can read."""
+
+
+def _spool(source, dest_dir, max_bytes):
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"File too large (limit {max_bytes // (1024 * 1024)}MB)")
+                digest.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise EmptyUploadError("Uploaded file is empty.")
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return Path(tmp_path), digest.hexdigest(), size
+
+
+class SpooledPart:
+    """One file from a multipart upload: spooled to `path`, or refused with `error`."""
+
+    def __init__(self, filename, content_type, max_bytes):
+        self.filename = filename
+        self.content_type = content_type
+        self.max_bytes = max_bytes
+        self.path = None
+        self.sha256 = None
+        self.size = 0
+        self.error = None
+        self._digest = hashlib.sha256()
+        self._out = None
+
+    def open(self, dest_dir):
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+        self.path = Path(tmp_path)
+        self._out = os.fdopen(fd, "wb")
+
+    def write(self, data):
+        if self.error:
+            return  # Refused: let the rest of it go by
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.fail(UploadTooLargeError(f"File too large (limit {self.max_bytes // (1024 * 1024)}MB)"))
+            return
+        self._digest.update(data)
+        self._out.write(data)
+
+    def finish(self):
+        if not self.error and self.size == 0:
+            self.fail(EmptyUploadError("Uploaded file is empty."))
+        if self._out:
+            self._out.close()
+            self._out = None
+        if not self.error:
+            self.sha256 = self._digest.hexdigest()
+
+    def fail(self, error):
+        self.error = error
+        self.discard()
+
+    def discard(self):
+        if self._out:
+            self._out.close()
+            self._out = None
+        if self.path:
+            self.path.unlink(missing_ok=True)
+            self.path = None
+
+
+class _MultipartSpooler:
+    """python-multipart callbacks that send each file part of `field` to a SpooledPart."""
+
+    def __init__(self, dest_dir, field, max_files, accept):
+        self.dest_dir = dest_dir
+        self.field = field
+        self.max_files = max_files
+        self.accept = accept
+        self.parts = []
+        self._part = None
+        self._headers = {}
+        self._header_name = self._header_value = b""
+
+    def on_part_begin(self):
+        self._part = None
+        self._headers = {}
+
+    def on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name", b"").decode("latin-1") != self.field or b"filename" not in options:
+            return  # Not one of our files: its bytes are skipped
+        if len(self.parts) >= self.max_files:
+            raise MultipartUploadError(f"Too many files (at most {self.max_files} per upload).")
+        filename = PurePath(options[b"filename"].decode("utf-8", "replace")).name
+        content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+        try:
+            max_bytes = self.accept(filename)
+        except ValueError as e:
+            part = SpooledPart(filename, content_type, 0)
+            part.error = e
+        else:
+            part = SpooledPart(filename, content_type, max_bytes)
+            part.open(self.dest_dir)
+        self.parts.append(part)
+        self._part = part
+
+    def on_part_data(self, data, start, end):
+        if self._part:
+            self._part.write(data[start:end])
+
+    def on_part_end(self):
+        if self._part:
+            self._part.finish()
+            self._part = None
+
+    def callbacks(self):
+        return {name: getattr(self, name) for name in (
+            "on_part_begin", "on_header_field", "on_header_value", "on_header_end",
+            "on_headers_finished", "on_part_data", "on_part_end",
+        )}
+
+
+async def spool_multipart(request, dest_dir, field="file", max_files=1,
+                          max_request_bytes=MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+                          accept=lambda filename: MAX_UPLOAD_BYTES):
+    """Parse a multipart/form-data request off its stream, spooling each file of `field` under `dest_dir`.
+
+    `accept(filename)` returns the most bytes that file may have, or raises
+    ValueError to refuse it unread. Returns a SpooledPart per file, in
+    order; a file over its limit or empty gets `error` instead of a `path`,
+    and the others carry on. Raises UploadTooLargeError as soon as the body
+    passes `max_request_bytes` and MultipartUploadError for a malformed
+    form, with nothing left on disk. The caller owns the spooled files and
+    must move or delete them.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise MultipartUploadError("Expected a multipart/form-data upload.")
+    spooler = _MultipartSpooler(Path(dest_dir), field, max_files, accept)
+    parser = MultipartParser(options[b"boundary"], spooler.callbacks())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadTooLargeError(f"File too large (limit {max_request_bytes // (1024 * 1024)}MB)")
+            if chunk:
+                # Parsing runs the file writes, so it stays off the event loop
+                await run_in_threadpool(parser.write, chunk)
+        parser.finalize()
+        if spooler._part:
+            raise MultipartUploadError("The upload ended in the middle of a file.")
+    except MultipartParseError as e:
+        _discard(spooler.parts)
+        raise MultipartUploadError(f"Malformed multipart upload: {e}") from e
+    except BaseException:
+        _discard(spooler.parts)
+        raise
+    return spooler.parts
+
+
+def _discard(parts):
+    for part in parts:
+        part.discard()
+
+
+def spool_zip_members(source, dest_dir, max_bytes=MAX_UPLOAD_BYTES, max_files=BATCH_MAX_FILES):
+    """Stream each PDF out of a zip archive into its own spool file.
+
+    Members are decompressed one at a time through the same chunked copy as
+    a plain upload, so nothing is extracted that isn't a PDF and a member
+    that inflates past `max_bytes` is dropped as soon as it does. Returns a
+    list of (filename, (path, sha256, size) or None, error or None) in
+    archive order. Raises zipfile.BadZipFile if `source` isn't a zip.
+    """
+    entries = []
+    spooled = 0
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            name = PurePosixPath(info.filename).name
+            if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                continue
+            if not name.lower().endswith(".pdf"):
+                entries.append((name, None, "Only PDF files are allowed."))
+                continue
+            if spooled >= max_files:
+                entries.append((name, None, f"Batch limit of {max_files} files reached."))
+                continue
+            if info.file_size > max_bytes:
+                entries.append((name, None, f"File too large (limit {max_bytes // (1024 * 1024)}MB)"))
+                continue
+            try:
+                with archive.open(info) as member:
+                    entries.append((name, _spool(member, Path(dest_dir), max_bytes), None))
+                spooled += 1
+            except (UploadTooLargeError, EmptyUploadError) as e:
+                entries.append((name, None, str(e)))
+            except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError) as e:
+                # Corrupt, encrypted or unsupported member: skip it, keep the rest
+                entries.append((name, None, f"Could not read from archive: {e}"))
+    return entries
+
+
+def direct_upload_key(user_id, upload_id):
+    """The S3 key a user's direct upload goes to; finalizing only looks under the caller's own prefix."""
+    return f"{DIRECT_UPLOAD_PREFIX}{user_id}/{upload_id}.pdf"
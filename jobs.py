@@ -0,0 +1,646 @@
+"""
+Persistent analysis job queue.
+
+Uploads are spooled to disk (or, for direct-to-S3 uploads, left in the
+bucket for the worker to fetch) and recorded as `AnalysisJob` rows. A pool of
+async workers claims queued jobs with a compare-and-set UPDATE, so a job is
+never picked up twice, and runs them through the analysis pipeline. Jobs
+live in the database, so they survive a process restart: a running job
+renews its lease every JOB_LEASE_SECONDS / 3, and one whose lease has gone
+stale (the worker died mid-run) is requeued by the next claim.
+
+Run extra workers outside the API process with `python jobs.py`.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, func
+
+from database import SessionLocal
+from models.analysis_job import AnalysisJob
+from models.analysis_result import AnalysisResult
+import analysis
+import artifact_cache
+import near_duplicates
+import portfolio_stats
+import search_index
+from llm_governor import llm_user
+from summary_fields import extract_fields
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+# Running jobs renew their lease this often, so only a dead worker's jobs go stale
+JOB_HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 3
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOBS_DIR = Path(os.getenv("JOBS_DIR", "uploads/jobs"))
+# Most jobs one user can have running at once, so one big batch can't take every worker (0 = no cap)
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "2"))
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "1.0"))
+BATCH_WATCH_TIMEOUT = float(os.getenv("BATCH_WATCH_TIMEOUT", "1800"))
+
+
+def _create_result(db, user_id, filename, text, summary_json, content_hash, previous_version_id=None):
+    fields = extract_fields(summary_json)
+    analysis_result = AnalysisResult(
+        filename=filename,
+        preview_text=(text or "")[:1000],
+        summary_json=summary_json,
+        user_id=user_id,
+        content_hash=content_hash,
+        previous_version_id=previous_version_id,
+        confidence_score=fields["ai_confidence"],
+        **fields,
+    )
+    db.add(analysis_result)
+    db.flush()
+    portfolio_stats.apply_changes(db, added=[portfolio_stats.facts(analysis_result)])
+    search_index.index_result(db, analysis_result)
+    return analysis_result
+
+
+def enqueue_job(db, user_id, filename, content_type, spool_path, content_hash,
+                idempotency_key=None, force=False):
+    """Queue an analysis job for a PDF already spooled to `spool_path`.
+
+    The job takes ownership of the spool file: it is moved into JOBS_DIR,
+    or deleted when the job doesn't need it. If the same user already submitted a job with this idempotency key, that
+    job is returned instead, so client retries don't create duplicates. If
+    these exact bytes were analyzed before (and `force` is not set), the
+    cached analysis is copied into a new AnalysisResult for this user and
+    the job is returned already succeeded.
+    """
+    existing = find_idempotent_job(db, user_id, idempotency_key)
+    if existing:
+        Path(spool_path).unlink(missing_ok=True)
+        return existing
+
+    job = _add_job(db, user_id, filename, content_type, spool_path, content_hash,
+                   idempotency_key=idempotency_key, force=force)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def enqueue_upload(db, user_id, filename, upload_key, idempotency_key=None, force=False):
+    """Queue an analysis job for a PDF the client uploaded straight to S3.
+
+    Nothing is read here: the worker fetches the object (`_fetch_upload`),
+    so the PDF bytes never pass through the API. Idempotent on the key like
+    `enqueue_job`; the artifact cache is checked once the worker knows the hash.
+    """
+    existing = find_idempotent_job(db, user_id, idempotency_key)
+    if existing:
+        return existing
+
+    job = AnalysisJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        content_type="application/pdf",
+        upload_key=upload_key,
+        force_reanalysis=force,
+        idempotency_key=idempotency_key,
+        state="queued",
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def find_idempotent_job(db, user_id, idempotency_key):
+    """The user's job submitted with this idempotency key, if any."""
+    if not idempotency_key:
+        return None
+    return db.query(AnalysisJob).filter(
+        AnalysisJob.user_id == user_id,
+        AnalysisJob.idempotency_key == idempotency_key
+    ).first()
+
+
+def enqueue_batch(db, user_id, files, batch_id, force=False):
+    """Queue a job for each spooled (filename, content_type, spool_path, content_hash).
+
+    Everything goes in with a single commit (one multi-row INSERT rather
+    than a commit and refresh per file). Returns a list of (filename, job
+    summary dict or None, error or None) in input order; a file whose spool
+    can't be moved into place is reported and the rest still go in.
+    """
+    entries = []
+    for filename, content_type, spool_path, content_hash in files:
+        try:
+            job = _add_job(db, user_id, filename, content_type, spool_path, content_hash,
+                           force=force, batch_id=batch_id)
+        except OSError as e:
+            Path(spool_path).unlink(missing_ok=True)
+            entries.append((filename, None, f"Could not queue file: {e}"))
+            continue
+        # Read before commit expires the objects, so no per-job refresh afterwards
+        summary = {"job_id": job.id, "state": job.state, "result_id": job.result_id}
+        entries.append((filename, summary, None))
+    db.commit()
+    return entries
+
+
+def _add_job(db, user_id, filename, content_type, spool_path, content_hash,
+             idempotency_key=None, force=False, batch_id=None):
+    """Build the job (and its result on a cache hit) in the current transaction."""
+    timings = {}
+    job_id = uuid.uuid4().hex
+    job = AnalysisJob(
+        id=job_id,
+        user_id=user_id,
+        filename=filename,
+        content_type=content_type,
+        content_hash=content_hash,
+        force_reanalysis=force,
+        idempotency_key=idempotency_key,
+        batch_id=batch_id,
+        state="queued",
+    )
+
+    cached = None if force else artifact_cache.get_cached_analysis(db, content_hash, commit=False)
+    if cached:
+        with analysis.stage(timings, "cache_hit"):
+            analysis_result = _create_result(
+                db, user_id, filename, cached.extracted_text, cached.summary_json, content_hash
+            )
+        now = datetime.utcnow()
+        job.state = "succeeded"
+        job.result_id = analysis_result.id
+        job.started_at = now
+        job.finished_at = now
+        job.stage_timings = json.dumps(timings)
+        Path(spool_path).unlink(missing_ok=True)
+    else:
+        JOBS_DIR.mkdir(parents=True, exist_ok=True)
+        pdf_path = JOBS_DIR / f"{job_id}.pdf"
+        os.replace(spool_path, pdf_path)
+        job.pdf_path = str(pdf_path)
+
+    db.add(job)
+    return job
+
+
+def _claimable(now):
+    stale = now - timedelta(seconds=JOB_LEASE_SECONDS)
+    return or_(
+        AnalysisJob.state == "queued",
+        and_(AnalysisJob.state == "running", AnalysisJob.locked_at < stale),
+    )
+
+
+def _users_at_cap(db, now):
+    """Users already running JOB_MAX_PER_USER live jobs."""
+    stale = now - timedelta(seconds=JOB_LEASE_SECONDS)
+    return db.query(AnalysisJob.user_id).filter(
+        AnalysisJob.state == "running",
+        AnalysisJob.locked_at >= stale
+    ).group_by(AnalysisJob.user_id).having(func.count() >= JOB_MAX_PER_USER)
+
+
+def _claim_conditions(db, now):
+    conditions = [_claimable(now)]
+    if JOB_MAX_PER_USER > 0:
+        conditions.append(AnalysisJob.user_id.notin_(_users_at_cap(db, now)))
+    return conditions
+
+
+def claim_next_job(worker_id):
+    """Atomically move the oldest claimable job to `running`. Returns its id or None.
+
+    Jobs of users already at JOB_MAX_PER_USER are passed over, so other
+    users' uploads keep moving while one user's batch is being worked on.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        candidate = db.query(AnalysisJob.id).filter(*_claim_conditions(db, now)).order_by(
+            AnalysisJob.created_at
+        ).limit(1).scalar()
+        if not candidate:
+            return None
+
+        # Compare-and-set: only one worker can flip this row, the rest see rowcount 0
+        claimed = db.query(AnalysisJob).filter(
+            AnalysisJob.id == candidate,
+            *_claim_conditions(db, now)
+        ).update(
+            {
+                AnalysisJob.state: "running",
+                AnalysisJob.locked_by: worker_id,
+                AnalysisJob.locked_at: now,
+                AnalysisJob.started_at: now,
+                AnalysisJob.attempts: AnalysisJob.attempts + 1,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+        return candidate if claimed else None
+    finally:
+        db.close()
+
+
+def _update_job(job_id, worker_id, **fields):
+    """Update a job this worker still holds the lease on. Returns False if it lost it."""
+    db = SessionLocal()
+    try:
+        fields.setdefault("locked_at", datetime.utcnow())
+        updated = db.query(AnalysisJob).filter(
+            AnalysisJob.id == job_id,
+            AnalysisJob.locked_by == worker_id,
+            AnalysisJob.state == "running"
+        ).update(
+            {getattr(AnalysisJob, name): value for name, value in fields.items()},
+            synchronize_session=False,
+        )
+        db.commit()
+        return bool(updated)
+    finally:
+        db.close()
+
+
+def _load_job(job_id):
+    db = SessionLocal()
+    try:
+        return db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
+    finally:
+        db.close()
+
+
+def lookup_artifact(content_hash, use_cache):
+    """Return ((text, summary_json) or None, S3 URL if the bytes are already stored)."""
+    if not content_hash:
+        return None, None
+    db = SessionLocal()
+    try:
+        if use_cache:
+            cached = artifact_cache.get_cached_analysis(db, content_hash)
+            if cached:
+                return (cached.extracted_text, cached.summary_json), cached.s3_url
+        artifact = artifact_cache.get_artifact(db, content_hash)
+        return None, artifact.s3_url if artifact and artifact.s3_key else None
+    finally:
+        db.close()
+
+
+def find_previous_version(user_id, content_hash, fingerprint):
+    """The user's earlier version of this CIM, if they analyzed one (see near_duplicates)."""
+    db = SessionLocal()
+    try:
+        return near_duplicates.find_previous_version(db, user_id, content_hash, fingerprint)
+    finally:
+        db.close()
+
+
+def _finish_job(job_id, worker_id, timings, text, result, outcome=None):
+    """Write the AnalysisResult row and mark the job succeeded in one transaction.
+
+    `outcome` is the fresh pipeline output, which also refreshes the shared artifact.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(AnalysisJob).filter(
+            AnalysisJob.id == job_id,
+            AnalysisJob.locked_by == worker_id,
+            AnalysisJob.state == "running"
+        ).first()
+        if not job:
+            return None
+
+        if outcome:
+            job.content_hash = outcome["content_hash"]
+            artifact_cache.store_artifact(
+                db, outcome["content_hash"], _spooled_size(job), outcome["s3_key"],
+                outcome["s3_url"], text, result
+            )
+            db.flush()
+            near_duplicates.store_fingerprint(db, outcome["content_hash"], outcome["fingerprint"])
+        previous_version_id = (outcome or {}).get("revision", {}).get("previous_result_id")
+        analysis_result = _create_result(
+            db, job.user_id, job.filename, text, result, job.content_hash, previous_version_id
+        )
+
+        now = datetime.utcnow()
+        job.state = "succeeded"
+        job.result_id = analysis_result.id
+        job.stage_timings = json.dumps(timings)
+        if outcome:
+            job.extraction_stats = json.dumps(outcome["extraction_stats"])
+        job.finished_at = now
+        job.locked_at = now
+        with analysis.stage(None, "result_commit"):
+            db.commit()
+        if outcome:
+            artifact_cache.evict_expired(db)
+        return analysis_result.id
+    finally:
+        db.close()
+
+
+def record_analysis(user_id, filename, text, summary_json, content_hash, outcome=None, size_bytes=None):
+    """Write the AnalysisResult for an analysis run outside the queue (the SSE endpoint).
+
+    `outcome` is the fresh pipeline output, which also refreshes the shared
+    artifact and, if the user analyzed an earlier version of this CIM, links
+    the result to it, as in `_finish_job`. Returns the new result id.
+    """
+    db = SessionLocal()
+    try:
+        previous_version_id = None
+        if outcome:
+            previous = near_duplicates.find_previous_version(db, user_id, content_hash, outcome["fingerprint"])
+            previous_version_id = previous["result_id"] if previous else None
+            artifact_cache.store_artifact(
+                db, content_hash, size_bytes, outcome["s3_key"], outcome["s3_url"], text, summary_json
+            )
+            db.flush()
+            near_duplicates.store_fingerprint(db, content_hash, outcome["fingerprint"])
+        result_id = _create_result(
+            db, user_id, filename, text, summary_json, content_hash, previous_version_id
+        ).id
+        db.commit()
+        if outcome:
+            artifact_cache.evict_expired(db)
+        return result_id
+    finally:
+        db.close()
+
+
+def _fetch_upload(job, worker_id, timings):
+    """Turn a direct upload into a spooled job. Returns the PDF's S3 URL.
+
+    Downloads the object next to the spooled PDFs (concurrent ranged GETs
+    for big files) and hashes it, then moves it to its content-addressed
+    key with a server-side copy, unless those bytes are stored already.
+    From then on the job is like any other, so retries don't fetch again.
+    """
+    JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    pdf_path = JOBS_DIR / f"{job.id}.pdf"
+    with analysis.stage(timings, "s3_fetch"):
+        analysis.download_file_from_s3(job.upload_key, pdf_path)
+        content_hash = artifact_cache.hash_file(pdf_path)
+    _, s3_url = lookup_artifact(content_hash, False)
+    if not s3_url:
+        with analysis.stage(timings, "s3_copy"):
+            s3_url = analysis.copy_s3_object(job.upload_key, artifact_cache.s3_key_for(content_hash))
+    if not _update_job(job.id, worker_id, pdf_path=str(pdf_path), content_hash=content_hash, upload_key=None):
+        pdf_path.unlink(missing_ok=True)
+        raise RuntimeError("Lost the lease on the job while fetching its upload")
+    analysis.delete_s3_object(job.upload_key)
+    job.pdf_path, job.content_hash, job.upload_key = str(pdf_path), content_hash, None
+    return s3_url
+
+
+def _spooled_size(job):
+    try:
+        return Path(job.pdf_path).stat().st_size
+    except (OSError, TypeError):
+        return None
+
+
+def _remove_spooled_pdf(job):
+    try:
+        Path(job.pdf_path).unlink()
+    except (OSError, TypeError):
+        pass
+    if job.upload_key:
+        # A direct upload that never got fetched
+        try:
+            analysis.delete_s3_object(job.upload_key)
+        except Exception as e:
+            logger.warning("Could not delete upload", extra={"job_id": job.id, "error": str(e)})
+
+
+async def _keep_lease(job_id, worker_id, work):
+    """Renew the job's lease every JOB_HEARTBEAT_SECONDS while `work` runs.
+
+    If the lease is gone (it expired and another worker claimed the job),
+    cancels `work` and returns True, so this worker stops paying for it.
+    """
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            held = await run_in_threadpool(_update_job, job_id, worker_id)
+        except Exception:
+            logger.exception("Could not renew job lease", extra={"job_id": job_id, "worker_id": worker_id})
+            continue
+        if not held:
+            logger.warning("Lost the lease on a running job, abandoning it",
+                           extra={"job_id": job_id, "worker_id": worker_id})
+            work.cancel()
+            return True
+
+
+async def process_job(job_id, worker_id):
+    """Run one claimed job, keeping its lease alive for as long as it runs."""
+    work = asyncio.create_task(_run_job(job_id, worker_id))
+    heartbeat = asyncio.create_task(_keep_lease(job_id, worker_id, work))
+    try:
+        await work
+    except asyncio.CancelledError:
+        if heartbeat.done() and not heartbeat.cancelled() and heartbeat.result():
+            return  # The job is someone else's now
+        raise
+    finally:
+        heartbeat.cancel()
+
+
+async def _run_job(job_id, worker_id):
+    """Run one claimed job through the pipeline and record the outcome."""
+    job = await run_in_threadpool(_load_job, job_id)
+    if not job:
+        return
+
+    timings = {}
+    # LLM calls made for this job queue under its user's share of the rate limits
+    llm_user.set(job.user_id)
+    if job.attempts > JOB_MAX_ATTEMPTS:
+        await run_in_threadpool(
+            _update_job, job_id, worker_id,
+            state="failed", error="Exceeded maximum attempts", finished_at=datetime.utcnow()
+        )
+        await run_in_threadpool(_remove_spooled_pdf, job)
+        return
+
+    try:
+        uploaded_s3_url = None
+        if job.upload_key:
+            uploaded_s3_url = await run_in_threadpool(_fetch_upload, job, worker_id, timings)
+        # Another job may have analyzed the same bytes since this one was queued
+        cached, stored_s3_url = await run_in_threadpool(
+            lookup_artifact, job.content_hash, not job.force_reanalysis
+        )
+        stored_s3_url = stored_s3_url or uploaded_s3_url
+        if cached:
+            timings["cache_hit"] = 0.0
+            text, summary_json = cached
+            result_id = await run_in_threadpool(
+                _finish_job, job_id, worker_id, timings, text, summary_json
+            )
+        else:
+            outcome = await analysis.prepare_pdf(
+                job.pdf_path, job.content_type, timings,
+                content_hash=job.content_hash, stored_s3_url=stored_s3_url
+            )
+            # A revision of a CIM this user already analyzed only needs its changed pages analyzed
+            with analysis.stage(timings, "version_lookup"):
+                previous = await run_in_threadpool(
+                    find_previous_version, job.user_id, outcome["content_hash"], outcome["fingerprint"]
+                )
+            outcome = await analysis.run_analysis(outcome, timings, previous)
+            result_id = await run_in_threadpool(
+                _finish_job, job_id, worker_id, timings, outcome["text"], outcome["result"], outcome
+            )
+        if result_id is not None:
+            await run_in_threadpool(_remove_spooled_pdf, job)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job straight back instead of waiting for the lease to expire
+        await run_in_threadpool(
+            _update_job, job_id, worker_id,
+            state="queued", locked_by=None, locked_at=None, attempts=max(job.attempts - 1, 0)
+        )
+        raise
+    except analysis.NoReadableContentError as e:
+        await run_in_threadpool(
+            _update_job, job_id, worker_id,
+            state="failed", error=str(e), stage_timings=json.dumps(timings),
+            finished_at=datetime.utcnow()
+        )
+        await run_in_threadpool(_remove_spooled_pdf, job)
+    except Exception as e:
+        logger.warning("Job failed", extra={"job_id": job_id, "attempt": job.attempts, "error": str(e)})
+        if job.attempts < JOB_MAX_ATTEMPTS:
+            # Hand it back to the queue for another worker
+            await run_in_threadpool(
+                _update_job, job_id, worker_id,
+                state="queued", error=str(e), stage_timings=json.dumps(timings),
+                locked_by=None, locked_at=None
+            )
+        else:
+            await run_in_threadpool(
+                _update_job, job_id, worker_id,
+                state="failed", error=str(e), stage_timings=json.dumps(timings),
+                finished_at=datetime.utcnow()
+            )
+            await run_in_threadpool(_remove_spooled_pdf, job)
+
+
+async def worker_loop(worker_id, stop_event):
+    while not stop_event.is_set():
+        try:
+            job_id = await run_in_threadpool(claim_next_job, worker_id)
+        except Exception:
+            logger.exception("Worker could not claim a job", extra={"worker_id": worker_id})
+            job_id = None
+
+        if job_id:
+            await process_job(job_id, worker_id)
+            continue
+
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+class JobWorkerPool:
+    """A fixed number of worker tasks draining the job queue on the current event loop."""
+
+    def __init__(self, size=JOB_WORKERS):
+        self.size = size
+        self._stop_event = None
+        self._tasks = []
+
+    def start(self):
+        self._stop_event = asyncio.Event()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = [
+            asyncio.create_task(worker_loop(f"{prefix}:{i}", self._stop_event))
+            for i in range(self.size)
+        ]
+
+    async def stop(self):
+        if not self._tasks:
+            return
+        self._stop_event.set()
+        # In-flight jobs are requeued by process_job when cancelled
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def _load_finished_jobs(job_ids):
+    db = SessionLocal()
+    try:
+        return db.query(AnalysisJob).filter(
+            AnalysisJob.id.in_(job_ids),
+            AnalysisJob.state.in_(["succeeded", "failed"])
+        ).all()
+    finally:
+        db.close()
+
+
+async def watch_jobs(job_ids, poll_interval=BATCH_POLL_INTERVAL, timeout=BATCH_WATCH_TIMEOUT):
+    """Yield each job (as a dict) as soon as it has succeeded or failed.
+
+    One query per poll covers every job still pending. Stops when all are
+    done or after `timeout` seconds; the jobs themselves keep running.
+    """
+    pending = set(job_ids)
+    deadline = time.monotonic() + timeout
+    while pending:
+        for job in await run_in_threadpool(_load_finished_jobs, list(pending)):
+            pending.discard(job.id)
+            yield job_to_dict(job)
+        if not pending or time.monotonic() >= deadline:
+            return
+        await asyncio.sleep(poll_interval)
+
+
+def job_to_dict(job):
+    return {
+        "job_id": job.id,
+        "batch_id": job.batch_id,
+        "filename": job.filename,
+        "state": job.state,
+        "attempts": job.attempts,
+        "error": job.error,
+        "stage_timings": json.loads(job.stage_timings) if job.stage_timings else {},
+        "extraction_stats": json.loads(job.extraction_stats) if job.extraction_stats else None,
+        "result_id": job.result_id,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+async def run_workers(size=JOB_WORKERS):
+    pool = JobWorkerPool(size)
+    pool.start()
+    try:
+        await asyncio.gather(*pool._tasks)
+    finally:
+        await pool.stop()
+
+
+if __name__ == "__main__":
+    from log_config import configure_logging
+    configure_logging()
+    from database import engine
+    from compression import load_dictionaries
+    load_dictionaries(engine)
+    asyncio.run(run_workers())
@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSCache:
+    """In-process store of Clerk's signing keys, indexed by `kid`.
+
+    Keys are served from memory until `ttl` runs out. Inside the last
+    `refresh_ahead` seconds a lookup kicks off a background refresh so
+    requests never wait on the JWKS endpoint. An unknown `kid` triggers
+    one synchronous refetch (rate limited by `min_refetch_interval`) to
+    pick up rotated keys. Threads that need a refetch at the same time
+    share one request: the rest wait for it rather than sending their own.
+    If the endpoint is slow or down, the last good key set keeps being
+    served.
+    """
+
+    def __init__(self, url, ttl=3600, refresh_ahead=300, timeout=3.0,
+                 min_refetch_interval=30):
+        self.url = url
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.timeout = timeout
+        self.min_refetch_interval = min_refetch_interval
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._attempts = 0  # Finished fetches, successful or not
+        self._lock = threading.Lock()
+        # Held for the duration of a fetch; never taken while holding _lock
+        self._fetch_lock = threading.Lock()
+        self._refreshing = False
+
+    def _fetch(self):
+        response = requests.get(self.url, timeout=self.timeout)
+        response.raise_for_status()
+        keys = {}
+        for key in response.json().get("keys", []):
+            kid = key.get("kid")
+            if kid:
+                keys[kid] = key
+        return keys
+
+    def refresh(self):
+        """Fetch the key set now. Returns True on success."""
+        with self._fetch_lock:
+            return self._refresh_locked()
+
+    def _refresh_once(self, attempts_seen):
+        """Refresh, unless a fetch finished since the caller saw `attempts_seen` (it then uses that one's keys)."""
+        with self._fetch_lock:
+            with self._lock:
+                if self._attempts != attempts_seen:
+                    return
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        with self._lock:
+            self._last_attempt = time.monotonic()
+        try:
+            keys = self._fetch()
+        except Exception as e:
+            logger.warning("JWKS fetch failed", extra={"url": self.url, "error": str(e)})
+            keys = None
+        with self._lock:
+            self._attempts += 1
+            if keys is None:
+                return False
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+        return True
+
+    def _refresh_in_background(self, attempts_seen):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._refresh_once(attempts_seen)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="jwks-refresh", daemon=True).start()
+
+    def needs_fetch(self, kid):
+        """True if `get_key(kid)` would block on a synchronous refetch."""
+        now = time.monotonic()
+        with self._lock:
+            can_refetch = now - self._last_attempt >= self.min_refetch_interval
+            if not self._keys:
+                return True
+            if now - self._fetched_at >= self.ttl:
+                return can_refetch
+            return kid not in self._keys and can_refetch
+
+    def get_key(self, kid):
+        """Return the JWK dict for `kid`, or None if it can't be found."""
+        now = time.monotonic()
+        with self._lock:
+            age = now - self._fetched_at
+            key = self._keys.get(kid)
+            have_keys = bool(self._keys)
+            attempts_seen = self._attempts
+            can_refetch = now - self._last_attempt >= self.min_refetch_interval
+
+        if not have_keys or age >= self.ttl:
+            # Expired: try a synchronous refresh, keep serving stale keys if it fails
+            if have_keys and not can_refetch:
+                return key
+            self._refresh_once(attempts_seen)
+        elif key is None:
+            # Unknown kid: the signing key was probably rotated, refetch once
+            if not can_refetch:
+                return None
+            self._refresh_once(attempts_seen)
+        else:
+            if age >= self.ttl - self.refresh_ahead:
+                self._refresh_in_background(attempts_seen)
+            return key
+
+        with self._lock:
+            return self._keys.get(kid)
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of already-verified token payloads.
+
+    Entries live until the token's own `exp` claim, so a cached token is
+    never accepted after it would have failed verification.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return payload
+
+    def put(self, token, payload):
+        exp = payload.get("exp")
+        if not exp or exp <= time.time():
+            return
+        with self._lock:
+            self._entries[token] = (payload, exp)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,270 @@
+"""
+Shared governor for LLM calls.
+
+Every call goes through `governor.run(...)`, which:
+
+- waits for room in a requests-per-minute and a tokens-per-minute token
+  bucket instead of failing (callers queue; nothing is dropped),
+- hands out that room fairly: each user has their own FIFO queue and the
+  queues are served round-robin, so one user's batch of 50 CIMs can't
+  starve everyone else; a call too big for the tokens available now is
+  passed over for smaller ones behind it, for up to LLM_MAX_BYPASS_SECONDS,
+- retries transient errors (429, 5xx, timeouts, dropped connections) with
+  jittered exponential backoff, honoring the server's Retry-After.
+
+The buckets are per process; with several API processes or `python jobs.py`
+workers, divide the account's limits between them (LLM_RPM / LLM_TPM).
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import openai
+
+from metrics import LLM_CALLS, LLM_QUEUE_DEPTH, LLM_TOKENS
+
+logger = logging.getLogger(__name__)
+
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "30000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+# How many seconds of budget may be spent in one burst. OpenAI enforces its per-minute
+# limits over shorter windows, so letting a whole minute go out at once still gets 429s.
+LLM_BURST_SECONDS = float(os.getenv("LLM_BURST_SECONDS", "10"))
+# ...but at least this many tokens, so the largest single call fits in one burst. The default
+# covers a chunked-mode map call (ANALYSIS_CHUNK_TOKENS 6000 + instructions + LLM_COMPLETION_TOKENS
+# 1000); a call bigger than the bucket has to wait for it to fill, then leaves it overdrawn.
+LLM_MIN_BURST_TOKENS = float(os.getenv("LLM_MIN_BURST_TOKENS", "8000"))
+# How long a large call may be passed over for smaller ones that fit the token bucket. After
+# that nothing goes ahead of it, so the bucket fills up for it instead of being drained by others.
+LLM_MAX_BYPASS_SECONDS = float(os.getenv("LLM_MAX_BYPASS_SECONDS", "30"))
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Who the current LLM calls are for; set once per job/request, inherited by gathered tasks
+llm_user = ContextVar("llm_user", default=None)
+
+
+class TokenBucket:
+    """`per_minute` units refilled continuously, holding `burst_seconds` worth (at least `min_capacity`).
+
+    The level may go negative when a call used more than was reserved for
+    it; later calls then wait for the debt to refill.
+    """
+
+    def __init__(self, per_minute, burst_seconds=LLM_BURST_SECONDS, min_capacity=1.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(min_capacity, self.rate * burst_seconds)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill()
+        # A single call bigger than the whole bucket only needs it full
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= amount
+
+
+def is_transient(error):
+    if isinstance(error, openai.APIConnectionError):  # includes timeouts
+        return True
+    return getattr(error, "status_code", None) in RETRY_STATUSES
+
+
+def retry_after_seconds(error):
+    """The delay the server asked for via retry-after-ms / Retry-After, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            retry_at = parsedate_to_datetime(value)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMGovernor:
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX, burst_seconds=LLM_BURST_SECONDS,
+                 min_burst_tokens=LLM_MIN_BURST_TOKENS, max_bypass_seconds=LLM_MAX_BYPASS_SECONDS):
+        self.requests = TokenBucket(rpm, burst_seconds)
+        self.tokens = TokenBucket(tpm, burst_seconds, min_burst_tokens)
+        self.max_retries = max_retries
+        self.max_bypass_seconds = max_bypass_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # user -> deque of (future, tokens, enqueued_at); OrderedDict order is the round-robin order
+        self._queues = OrderedDict()
+        self._timer = None
+        self._paused_until = 0.0
+        self._waits = deque(maxlen=1000)
+        self._counters = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0}
+
+    async def acquire(self, tokens, user=None):
+        """Wait for this user's turn and for room in both buckets, then reserve it."""
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append((future, tokens, time.monotonic()))
+        self._grant()
+        try:
+            await future
+        except asyncio.CancelledError:
+            self._forget(user, future)
+            raise
+
+    def _forget(self, user, future):
+        queue = self._queues.get(user)
+        if queue:
+            for entry in queue:
+                if entry[0] is future:
+                    queue.remove(entry)
+                    break
+            if not queue:
+                del self._queues[user]
+        self._grant()
+
+    def _grant(self):
+        """Release queued calls round-robin across users while the buckets allow.
+
+        Each user's calls go in order, but a user whose next call doesn't fit
+        the tokens available now is skipped for the first one in the rotation
+        that does, until the oldest waiting call has been waiting
+        max_bypass_seconds; then it's the only one that may go.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while True:
+            heads = []
+            for user, queue in list(self._queues.items()):
+                while queue and queue[0][0].done():  # cancelled while waiting
+                    queue.popleft()
+                if queue:
+                    heads.append((user, queue[0]))
+                else:
+                    del self._queues[user]
+            if not heads:
+                return
+
+            now = time.monotonic()
+            wait = max(self.requests.wait_time(1), self._paused_until - now)
+            if wait <= 0:
+                oldest = min(heads, key=lambda head: head[1][2])
+                if now - oldest[1][2] >= self.max_bypass_seconds:
+                    heads = [oldest]
+                token_waits = [self.tokens.wait_time(tokens) for _, (_, tokens, _) in heads]
+                wait = min(token_waits)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._grant)
+                return
+
+            user, (future, tokens, enqueued_at) = heads[token_waits.index(0.0)]
+            queue = self._queues.pop(user)
+            queue.popleft()
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self._waits.append(now - enqueued_at)
+            future.set_result(None)
+            # Move this user to the back of the rotation (or drop them if they're done)
+            if queue:
+                self._queues[user] = queue
+
+    def settle(self, reserved, used):
+        """Charge the difference once the real token usage of a call is known."""
+        if used is not None:
+            self.tokens.take(used - reserved)
+            LLM_TOKENS.observe(used)
+
+    def throttle(self, delay):
+        """The provider said slow down: hold every queued call for `delay` and empty the request bucket."""
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.requests.take(max(self.requests.level, 0))
+
+    def backoff(self, attempt, error):
+        delay = retry_after_seconds(error)
+        if delay is None:
+            # Full jitter: uniform over [0, base * 2^attempt], capped
+            return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        # Wait at least as long as asked, spread a little so the retries don't all land together
+        return min(delay * random.uniform(1.0, 1.2), self.backoff_max)
+
+    async def run(self, call, tokens, user=None):
+        """Run `call()` (a coroutine factory) under the budgets, retrying transient errors.
+
+        `tokens` is the estimated prompt + completion size reserved up front.
+        `call` returns (result, tokens_used or None); the usage corrects the reservation.
+        Defaults `user` to the llm_user context variable.
+        """
+        if user is None:
+            user = llm_user.get()
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(tokens, user)
+            self._counters["calls"] += 1
+            try:
+                result, used = await call()
+            except Exception as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    self._counters["failed"] += 1
+                    LLM_CALLS.labels(outcome="failed").inc()
+                    raise
+                self._counters["retries"] += 1
+                delay = self.backoff(attempt, e)
+                if getattr(e, "status_code", None) == 429:
+                    self._counters["throttled"] += 1
+                    self.throttle(delay)
+                LLM_CALLS.labels(outcome="retried").inc()
+                logger.warning("LLM call failed, retrying", extra={
+                    "error": e.__class__.__name__, "attempt": attempt + 1, "delay_s": round(delay, 2), "user": user,
+                })
+                await asyncio.sleep(delay)
+                continue
+            LLM_CALLS.labels(outcome="ok").inc()
+            self.settle(tokens, used)
+            return result
+
+    def stats(self):
+        waits = sorted(self._waits)
+
+        def pct(p):
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 3) if waits else 0.0
+
+        return {
+            "queue_depth": sum(len(queue) for queue in self._queues.values()),
+            "queued_by_user": {str(user): len(queue) for user, queue in self._queues.items()},
+            "wait_seconds": {"p50": pct(0.5), "p95": pct(0.95), "max": round(waits[-1], 3) if waits else 0.0,
+                             "samples": len(waits)},
+            "available_requests": round(self.requests.level, 1),
+            "available_tokens": round(self.tokens.level),
+            **self._counters,
+        }
+
+
+governor = LLMGovernor()
+LLM_QUEUE_DEPTH.set_function(lambda: sum(len(queue) for queue in governor._queues.values()))
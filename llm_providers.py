@@ -0,0 +1,207 @@
+"""
+LLM backends the analysis pipeline can call, chosen with LLM_PROVIDER.
+
+  openai   GPT-4o through the OpenAI API (default)
+  fake     a local stand-in that answers with schema-valid JSON after a
+           configurable delay, for offline runs and load tests
+
+A provider has two coroutines: `complete(messages)` returning
+(text, tokens used or None) and `open_stream(messages)` returning an async
+iterator of text deltas with an `aclose()` that stops generation. Errors
+are raised as-is; retrying is the governor's job.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+
+import httpx
+import openai
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+OPENAI_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.4"))
+
+# name -> (latency seconds, jitter seconds, error rate, streamed tokens per second)
+FAKE_PROFILES = {
+    "instant": (0.0, 0.0, 0.0, 0),
+    "fast": (0.2, 0.05, 0.0, 500),
+    "gpt-4o": (6.0, 2.0, 0.0, 60),
+    "flaky": (6.0, 2.0, 0.1, 60),
+    "overloaded": (10.0, 5.0, 0.3, 40),
+}
+LLM_FAKE_PROFILE = os.getenv("LLM_FAKE_PROFILE", "fast")
+
+
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, api_key=None, model=OPENAI_MODEL, temperature=OPENAI_TEMPERATURE):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.model = model
+        self.temperature = temperature
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use, so the app starts (and the fake can be used) without a key
+        if self._client is None:
+            if not self.api_key:
+                raise RuntimeError("Missing OPENAI_API_KEY in environment variables.")
+            # Retries are left to the governor, which also respects the rate limits while waiting
+            self._client = openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        return self._client
+
+    async def complete(self, messages):
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=messages, temperature=self.temperature,
+        )
+        usage = getattr(response, "usage", None)
+        return response.choices[0].message.content, getattr(usage, "total_tokens", None)
+
+    async def open_stream(self, messages):
+        stream = await self.client.chat.completions.create(
+            model=self.model, messages=messages, temperature=self.temperature, stream=True,
+        )
+        return _OpenAIStream(stream)
+
+
+class _OpenAIStream:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __aiter__(self):
+        return self._deltas()
+
+    async def _deltas(self):
+        async for chunk in self.stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def aclose(self):
+        # Closing the HTTP response makes OpenAI stop generating
+        await self.stream.response.aclose()
+
+
+class FakeLLMProvider:
+    """Deterministic stand-in: same prompt, same answer; delays and failures drawn from a seeded RNG.
+
+    Errors are the OpenAI SDK's own 429/500 exceptions, so the governor's
+    retry path is exercised exactly as in production.
+    """
+    name = "fake"
+
+    def __init__(self, profile=LLM_FAKE_PROFILE, latency=None, jitter=None, error_rate=None,
+                 tokens_per_second=None, seed=None):
+        if profile not in FAKE_PROFILES:
+            raise ValueError(f"Unknown LLM_FAKE_PROFILE {profile!r} (expected one of {', '.join(FAKE_PROFILES)})")
+        base = FAKE_PROFILES[profile]
+        self.latency = _setting(latency, "LLM_FAKE_LATENCY", base[0])
+        self.jitter = _setting(jitter, "LLM_FAKE_JITTER", base[1])
+        self.error_rate = _setting(error_rate, "LLM_FAKE_ERROR_RATE", base[2])
+        self.tokens_per_second = _setting(tokens_per_second, "LLM_FAKE_TOKENS_PER_SECOND", base[3])
+        self.rng = random.Random(_setting(seed, "LLM_FAKE_SEED", 0))
+        self.calls = 0
+
+    def _delay(self):
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def _maybe_fail(self):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            status = self.rng.choice([429, 500])
+            request = httpx.Request("POST", "http://fake-llm/v1/chat/completions")
+            response = httpx.Response(status, headers={"retry-after": "1"} if status == 429 else {},
+                                      request=request)
+            error = openai.RateLimitError if status == 429 else openai.InternalServerError
+            raise error(f"Fake LLM error {status}", response=response, body=None)
+
+    async def complete(self, messages):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        text = fake_analysis(messages[-1]["content"])
+        return text, _tokens(messages) + len(text) // 4
+
+    async def open_stream(self, messages):
+        self.calls += 1
+        # Time to first token is the part the latency profile describes
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        return _FakeStream(fake_analysis(messages[-1]["content"]), self.tokens_per_second)
+
+
+class _FakeStream:
+    def __init__(self, text, tokens_per_second):
+        self.text = text
+        self.tokens_per_second = tokens_per_second
+        self.closed = False
+
+    def __aiter__(self):
+        return self._deltas()
+
+    async def _deltas(self):
+        # ~4 characters per token
+        for start in range(0, len(self.text), 4):
+            if self.closed:
+                return
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield self.text[start:start + 4]
+
+    async def aclose(self):
+        self.closed = True
+
+
+def _setting(value, env_name, default):
+    if value is not None:
+        return value
+    return type(default)(os.getenv(env_name, default))
+
+
+def _tokens(messages):
+    return sum(len(message["content"]) for message in messages) // 4
+
+
+def fake_analysis(prompt):
+    """A schema-valid analysis whose values are derived from a hash of the prompt."""
+    digest = hashlib.sha256(prompt.encode("utf-8", "ignore")).digest()
+    rng = random.Random(digest)
+    revenue = rng.randint(20, 400)
+    margin = rng.randint(8, 40)
+    year = rng.randint(2019, 2024)
+    name = f"Company {digest.hex()[:6].upper()}"
+    return json.dumps({
+        "COMPANY INFO": {"Name": name, "Description": f"{name} is a synthetic business used for testing."},
+        "FINANCIALS": {
+            "Actuals": {
+                "revenue": f"${revenue}M", "EBITDA": f"${round(revenue * margin / 100, 1)}M",
+                "year": str(year), "margin": f"{margin}%", "FCF": f"${round(revenue * margin / 200, 1)}M",
+            },
+            "Estimates": {
+                "forward revenue": f"${round(revenue * 1.15)}M", "EBITDA": f"${round(revenue * 1.15 * margin / 100, 1)}M",
+                "capex": f"${rng.randint(1, 20)}M", "capex/revenue": f"{rng.randint(1, 8)}%",
+            },
+        },
+        "THESIS": [f"Recurring revenue of {rng.randint(40, 95)}%", "Fragmented market with add-on opportunities"],
+        "RED FLAGS": [f"Top customer is {rng.randint(5, 30)}% of revenue"],
+        "SUMMARY": f"{name} generated ${revenue}M of revenue in {year} at a {margin}% EBITDA margin.",
+        "confidence_score": rng.randint(50, 95),
+        "confidence_breakdown": {
+            "COMPANY INFO": rng.randint(50, 100), "FINANCIALS": rng.randint(50, 100),
+            "THESIS": rng.randint(50, 100), "RED FLAGS": rng.randint(50, 100), "SUMMARY": rng.randint(50, 100),
+        },
+        "flagged_fields": [],
+        "low_confidence_flags": "",
+    })
+
+
+PROVIDERS = {"openai": OpenAIProvider, "fake": FakeLLMProvider}
+
+
+def get_provider(name=LLM_PROVIDER, **options):
+    cls = PROVIDERS.get(name)
+    if cls is None:
+        raise ValueError(f"Unknown LLM_PROVIDER {name!r} (expected one of {', '.join(PROVIDERS)})")
+    return cls(**options)
@@ -1,36 +1,66 @@
-from fastapi import FastAPI, File, UploadFile, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, Request, HTTPException, Depends, Header
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path, PurePath
 from sqlalchemy.orm import Session
+from typing import Optional
+import json
+import logging
 import os
-from PyPDF2 import PdfReader
+import uuid
+import zipfile
 from dotenv import load_dotenv
-from openai import OpenAI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from jose import JWTError, jwt
+from pydantic import BaseModel, Field
 import re
-import boto3
 import requests
 
-from routes import auth_routes, results
-from models.user import Base, User
-from database import engine, SessionLocal
+from routes import auth_routes, results, job_routes, analytics_routes
+from models.user import User
+from database import engine, SessionLocal, async_engine
+from compression import load_dictionaries
 from auth import get_current_user
 from models.analysis_result import AnalysisResult
+from models.analysis_job import AnalysisJob
+import analysis
+from analysis import pdf_executor
+from summary_fields import load_summary
+from llm_governor import llm_user
+from log_config import configure_logging
+import metrics
+from metrics import stage
+from jobs import (enqueue_job, enqueue_batch, enqueue_upload, find_idempotent_job, watch_jobs, lookup_artifact,
+                  record_analysis, JobWorkerPool, JOBS_DIR)
+from ingest import (spool_multipart, spool_zip_members, UploadTooLargeError, MultipartUploadError,
+                    MAX_UPLOAD_BYTES, MAX_UPLOAD_MB, BATCH_MAX_FILES, MAX_BATCH_UPLOAD_BYTES, MAX_BATCH_UPLOAD_MB,
+                    MULTIPART_OVERHEAD_BYTES, DIRECT_UPLOAD_EXPIRES, direct_upload_key)
 
-# Database table creation
-Base.metadata.create_all(bind=engine)
+# The schema comes from `alembic upgrade head` (see migrate_database.py)
+load_dictionaries(engine)
 
 # Load environment variables
 load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise RuntimeError("Missing OPENAI_API_KEY in environment variables.")
-client = OpenAI(api_key=api_key)
+configure_logging()
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Workers that drain the analysis job queue (JOB_WORKERS=0 to run them elsewhere)
+job_pool = JobWorkerPool()
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_pool.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await job_pool.stop()
+    await async_engine.dispose()
+    pdf_executor.shutdown(wait=False, cancel_futures=True)
 
 # CORS for frontend
 app.add_middleware(
@@ -72,6 +102,12 @@ app.include_router(auth_routes.router)
 # Include results routes
 app.include_router(results.router)
 
+# Include analysis job routes
+app.include_router(job_routes.router)
+
+# Include portfolio analytics routes
+app.include_router(analytics_routes.router)
+
 # Dependency for DB session
 def get_db():
     db = SessionLocal()
@@ -85,151 +121,347 @@ def get_db():
 def test_route():
     return {"message": "Python backend is working!"}
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, headers={"Content-Type": content_type})
+
 # File upload
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-load_dotenv()
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse uploads whose declared size is over the limit before the body is read.
 
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_REGION = os.getenv("AWS_REGION")
-S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
+    Bodies without a Content-Length (chunked) are cut off by spool_multipart
+    as soon as they pass the limit.
+    """
+    if request.method == "POST" and request.url.path.startswith("/api/upload"):
+        if request.url.path == "/api/upload/batch":
+            limit_bytes, limit_mb = MAX_BATCH_UPLOAD_BYTES, MAX_BATCH_UPLOAD_MB
+        else:
+            limit_bytes, limit_mb = MAX_UPLOAD_BYTES, MAX_UPLOAD_MB
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and \
+                int(content_length) > limit_bytes + MULTIPART_OVERHEAD_BYTES:
+            return JSONResponse(status_code=413, content={"detail": f"File too large (limit {limit_mb}MB)"})
+    return await call_next(request)
 
-s3_client = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY_ID,
-    aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION,
-)
+def multipart_body(field, many=False):
+    """OpenAPI request body for an endpoint that parses its multipart upload itself."""
+    schema = {"type": "string", "format": "binary"}
+    if many:
+        schema = {"type": "array", "items": schema}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": [field], "properties": {field: schema},
+    }}}}}
 
-def upload_file_to_s3(file_bytes, filename, content_type):
-    s3_client.put_object(
-        Bucket=S3_BUCKET_NAME,
-        Key=filename,
-        Body=file_bytes,
-        ContentType=content_type,
-    )
-    return f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{filename}"
+def _accept_pdf(filename):
+    error = _pdf_filename_error(filename)
+    if error:
+        raise ValueError(error)
+    return MAX_UPLOAD_BYTES
 
-@app.post("/api/upload")
+def _upload_error(error):
+    return HTTPException(status_code=413 if isinstance(error, UploadTooLargeError) else 400, detail=str(error))
+
+async def receive_pdf(request: Request):
+    """Spool the one PDF of a multipart upload as it streams in, or raise the HTTPException refusing it."""
+    try:
+        parts = await spool_multipart(request, JOBS_DIR, accept=_accept_pdf)
+    except (UploadTooLargeError, MultipartUploadError) as e:
+        raise _upload_error(e)
+    if not parts:
+        raise HTTPException(status_code=400, detail="No file in upload.")
+    if parts[0].error:
+        raise _upload_error(parts[0].error)
+    return parts[0]
+
+@app.post("/api/upload", status_code=202, openapi_extra=multipart_body("file"))
 async def upload_file(
-    file: UploadFile = File(...),
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, max_length=100),
+    force: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Stream the body to disk as it arrives, hashing as it goes
+    with stage(None, "upload_spool"):
+        upload = await receive_pdf(request)
+
+    # Queue the spooled PDF; the worker pool runs S3 + extraction + LLM.
+    # Known bytes are answered from the artifact cache unless force=true.
+    try:
+        with stage(None, "enqueue"):
+            job = await run_in_threadpool(
+                enqueue_job, db, current_user.id, upload.filename, upload.content_type, upload.path,
+                upload.sha256, idempotency_key, force
+            )
+    except Exception:
+        upload.path.unlink(missing_ok=True)
+        raise
+    return queued_job_response(job)
+
+def queued_job_response(job):
+    cached = job.state == "succeeded"
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "state": job.state,
+        "result_id": job.result_id,
+        "cached": cached,
+        "status_url": f"/api/jobs/{job.id}",
+        "message": "Analysis loaded from cache." if cached else "File uploaded and queued for analysis.",
+    }
+
+class DirectUploadRequest(BaseModel):
+    filename: str = Field(..., max_length=255)
+    size: Optional[int] = Field(None, ge=1)  # Optional: lets an oversized file be refused before it's sent
+
+# A PDF's header has to start within its first 1024 bytes
+PDF_HEADER_WINDOW = 1024
+
+@app.post("/api/upload/presign")
+async def presign_upload(
+    body: DirectUploadRequest,
+    current_user: User = Depends(get_current_user)
+):
+    """Start a direct-to-S3 upload, so the PDF doesn't pass through the API.
+
+    Returns a presigned POST: send `fields` and then the PDF as `file`
+    (multipart/form-data) to `url` within `expires_in` seconds, then call
+    `finalize_url`. S3 enforces the size limit and the application/pdf
+    content type itself.
+    """
+    safe_filename = PurePath(body.filename).name
+    error = _pdf_filename_error(safe_filename)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    if body.size and body.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File too large (limit {MAX_UPLOAD_MB}MB)")
+
+    upload_id = uuid.uuid4().hex
+    post = await run_in_threadpool(
+        analysis.presign_pdf_upload, direct_upload_key(current_user.id, upload_id), safe_filename,
+        MAX_UPLOAD_BYTES, DIRECT_UPLOAD_EXPIRES
+    )
+    return {
+        "upload_id": upload_id,
+        "url": post["url"],
+        "fields": post["fields"],
+        "max_bytes": MAX_UPLOAD_BYTES,
+        "expires_in": DIRECT_UPLOAD_EXPIRES,
+        "finalize_url": f"/api/upload/{upload_id}/finalize",
+    }
+
+@app.post("/api/upload/{upload_id}/finalize", status_code=202)
+async def finalize_upload(
+    upload_id: str,
+    idempotency_key: Optional[str] = Header(None, max_length=100),
+    force: bool = False,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    
-    safe_filename = PurePath(file.filename).name
-    if not safe_filename.lower().endswith(".pdf"):
-        raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
-    if len(safe_filename) > 100:
-        raise HTTPException(status_code=400, detail="Filename is too long.")
-
-    contents = await file.read()
-    if len(contents) > 5 * 1024 * 1024:
-        raise HTTPException(status_code=400, detail="File too large (limit 5MB)")
-
-    # Upload to S3
-    s3_url = upload_file_to_s3(contents, safe_filename, file.content_type)
-
-    # Read PDF from bytes (not from file_location)
-    from io import BytesIO
-    reader = PdfReader(BytesIO(contents))
-    text_pages = []
-    for page in reader.pages:
-        text = page.extract_text()
-        if text:
-            clean = text.strip()
-            if len(clean) > 100 and not clean.lower().startswith("confidential"):
-                text_pages.append(clean)
-            if len(text_pages) >= 10:
-                break
-    text = "\n\n".join(text_pages)
-    if not text.strip():
-        raise HTTPException(
-            status_code=400,
-            detail="File uploaded but no readable business content was found in the PDF."
+    """Queue the analysis of a direct upload; the response is the same as /api/upload's.
+
+    Only the object's metadata and its first bytes (a ranged read, to check
+    it's a PDF) are read here; a job worker fetches the rest. Calling it
+    again for the same upload returns the same job.
+    """
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found.")
+    idempotency_key = idempotency_key or f"upload-{upload_id}"
+    job = await run_in_threadpool(find_idempotent_job, db, current_user.id, idempotency_key)
+    if job:
+        return queued_job_response(job)
+
+    key = direct_upload_key(current_user.id, upload_id)
+    with stage(None, "upload_verify"):
+        head = await run_in_threadpool(analysis.head_s3_object, key)
+        if head is None:
+            raise HTTPException(status_code=404, detail="Upload not found. It may have expired; request a new one.")
+        header = await run_in_threadpool(analysis.read_s3_range, key, 0, min(head["size"], PDF_HEADER_WINDOW))
+    if head["size"] > MAX_UPLOAD_BYTES or b"%PDF-" not in header:
+        await run_in_threadpool(analysis.delete_s3_object, key)
+        if head["size"] > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"File too large (limit {MAX_UPLOAD_MB}MB)")
+        raise HTTPException(status_code=400, detail="The uploaded file is not a PDF.")
+
+    filename = head["filename"] if not _pdf_filename_error(head["filename"]) else f"{upload_id}.pdf"
+    with stage(None, "enqueue"):
+        job = await run_in_threadpool(
+            enqueue_upload, db, current_user.id, filename, key, idempotency_key, force
         )
+    return queued_job_response(job)
+
+def _pdf_filename_error(filename):
+    if not filename.lower().endswith(".pdf"):
+        return "Only PDF files are allowed."
+    if len(filename) > 100:
+        return "Filename is too long."
+    return None
+
+def _accept_batch_file(filename):
+    # A zip of PDFs is only taken on its own, which upload_batch checks once it has every file
+    if filename.lower().endswith(".zip"):
+        return MAX_BATCH_UPLOAD_BYTES
+    return _accept_pdf(filename)
 
-    prompt = f"""
-You are a top-tier private equity investment analyst. Extract only clear, actionable, investment-focused insights from the Confidential Information Memorandum (CIM) excerpt below. Do not hallucinate or guess beyond what's written. Return only what is explicitly stated or clearly implied.
-
-Summarize in this JSON format (no markdown):
-
-{{
-  "COMPANY INFO": {{
-    "Name": "",
-    "Description": ""
-  }},
-  "FINANCIALS": {{
-    "Actuals": {{
-      "revenue": "", 
-      "EBITDA": "", 
-      "year": "", 
-      "margin": "", 
-      "FCF": ""
-    }},
-    "Estimates": {{
-      "forward revenue": "", 
-      "EBITDA": "", 
-      "capex": "", 
-      "capex/revenue": ""
-    }}
-  }},
-  "THESIS": ["Key investment thesis points as bullet points"],
-  "RED FLAGS": ["Key risks or concerns as bullet points"],
-  "SUMMARY": "Concise, plain-English summary of the CIM excerpt.",
-  "confidence_score": 0,
-  "confidence_breakdown": {{
-    "COMPANY INFO": 0,
-    "FINANCIALS": 0,
-    "THESIS": 0,
-    "RED FLAGS": 0,
-    "SUMMARY": 0
-  }},
-  "flagged_fields": [],
-  "low_confidence_flags": ""
-}}
-
-If a field is missing, use "" or "unknown" (not null). Be concise and factual. Focus on what a private equity team would want to know for a quick investment meeting.
-
-CIM EXCERPT (first 10 pages):
-{text[:10000]}
-"""
+@app.post("/api/upload/batch", openapi_extra=multipart_body("files", many=True))
+async def upload_batch(
+    request: Request,
+    force: bool = False,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue several PDFs, or one zip of PDFs, and stream the outcome per file.
 
+    The response is NDJSON: a `batch` line, a `failed` line for every file
+    that was rejected, a `queued` line per accepted file, then a `succeeded`
+    or `failed` line for each file as its analysis finishes, and a final
+    `done` line. Files run on the job workers, which cap concurrency overall
+    and per user; one bad file doesn't affect the others. If the stream is
+    dropped, `GET /api/batches/{batch_id}` has the same per-file status.
+    """
+    batch_id = uuid.uuid4().hex
+    spooled, rejected = [], []
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are an investment analyst reviewing CIMs."},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.4,
+        parts = await spool_multipart(
+            request, JOBS_DIR, field="files", max_files=BATCH_MAX_FILES,
+            max_request_bytes=MAX_BATCH_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES, accept=_accept_batch_file
         )
-        result = response.choices[0].message.content.strip()
-        # Remove markdown code block formatting if present
-        result = re.sub(r"^```json|^```|```$", "", result, flags=re.MULTILINE).strip()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OpenAI analysis failed: {str(e)}")
-
-    # Store result in DB
-    analysis = AnalysisResult(
-        filename=safe_filename,
-        preview_text=text[:1000],
-        summary_json=result,
-        user_id=current_user.id,
-    )
-    db.add(analysis)
-    db.commit()
-    db.refresh(analysis)
+    except (UploadTooLargeError, MultipartUploadError) as e:
+        raise _upload_error(e)
 
-    return {
-        "filename": safe_filename,
-        "message": "File uploaded and analyzed!",
-        "preview_text": text[:300],
-        "llm_analysis": result,
-        "note": "This is a first-pass summary and investment memo by GPT-4o."
-    }
+    if len(parts) == 1 and parts[0].filename.lower().endswith(".zip"):
+        archive = parts[0]
+        if archive.error:
+            raise _upload_error(archive.error)
+        try:
+            members = await run_in_threadpool(spool_zip_members, archive.path, JOBS_DIR)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Not a valid zip archive.")
+        finally:
+            archive.discard()
+        for name, spool, error in members:
+            error = error or _pdf_filename_error(name)
+            if error:
+                if spool:
+                    spool[0].unlink(missing_ok=True)
+                rejected.append((name, error))
+            else:
+                spooled.append((name, "application/pdf", spool[0], spool[1]))
+    else:
+        for part in parts:
+            if not part.error and part.filename.lower().endswith(".zip"):
+                part.fail(ValueError("Only PDF files are allowed."))
+            if part.error:
+                rejected.append((part.filename, str(part.error)))
+            else:
+                spooled.append((part.filename, part.content_type, part.path, part.sha256))
+
+    if not spooled and not rejected:
+        raise HTTPException(status_code=400, detail="No files in upload.")
+
+    try:
+        queued = await run_in_threadpool(enqueue_batch, db, current_user.id, spooled, batch_id, force)
+    except Exception:
+        for _, _, spool_path, _ in spooled:
+            spool_path.unlink(missing_ok=True)
+        raise
+    rejected += [(name, error) for name, job, error in queued if error]
+    jobs = [(name, job) for name, job, error in queued if job]
+
+    def line(event, **fields):
+        return json.dumps(jsonable_encoder({"event": event, **fields})) + "\n"
+
+    async def events():
+        yield line("batch", batch_id=batch_id, files=len(jobs) + len(rejected),
+                   status_url=f"/api/batches/{batch_id}")
+        for name, error in rejected:
+            yield line("failed", filename=name, job_id=None, error=error)
+        for name, job in jobs:
+            yield line("queued", filename=name, cached=job["state"] == "succeeded", **job)
+        counts = {"succeeded": 0, "failed": len(rejected)}
+        async for job in watch_jobs([job["job_id"] for _, job in jobs]):
+            counts[job["state"]] += 1
+            yield line(job["state"], **job)
+        yield line("done", batch_id=batch_id, pending=len(jobs) + len(rejected) - sum(counts.values()), **counts)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers={"X-Batch-Id": batch_id})
+
+@app.post("/api/upload/stream", openapi_extra=multipart_body("file"))
+async def upload_stream(
+    request: Request,
+    force: bool = False,
+    current_user: User = Depends(get_current_user)
+):
+    """Analyze one PDF inside the request and stream progress as Server-Sent Events.
+
+    Events: `stage` (uploaded, extracted), in chunked mode `partial` with
+    each chunk's extraction as it finishes, `token` for every LLM delta,
+    `section` as each top-level section of the JSON completes, then `result`
+    with the saved result id, or `error`. If the client disconnects the
+    upstream LLM call is cancelled and nothing is saved.
+    """
+    upload = await receive_pdf(request)
+    safe_filename, spool_path, content_hash, size_bytes = upload.filename, upload.path, upload.sha256, upload.size
+
+    def sse(event, data):
+        return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+    async def events():
+        timings = {}
+        llm_user.set(current_user.id)
+        try:
+            yield sse("stage", {"stage": "uploaded", "filename": safe_filename, "content_hash": content_hash})
+            cached, stored_s3_url = await run_in_threadpool(lookup_artifact, content_hash, not force)
+            if cached:
+                text, summary_json = cached
+                result_id = await run_in_threadpool(
+                    record_analysis, current_user.id, safe_filename, text, summary_json, content_hash
+                )
+                yield sse("result", {"result_id": result_id, "cached": True, "summary": load_summary(summary_json)})
+                return
+
+            outcome = await analysis.prepare_pdf(
+                spool_path, upload.content_type, timings, content_hash=content_hash, stored_s3_url=stored_s3_url
+            )
+            yield sse("stage", {"stage": "extracted", **outcome["extraction_stats"]})
+
+            summary_json = None
+            async for kind, payload in analysis.stream_analysis(outcome.pop("text_pages"), timings):
+                if kind == "token":
+                    yield sse("token", {"text": payload})
+                elif kind == "partial":
+                    part, total, partial_json = payload
+                    yield sse("partial", {"part": part, "total": total, "summary": load_summary(partial_json)})
+                elif kind == "section":
+                    yield sse("section", {"name": payload[0], "value": payload[1]})
+                else:
+                    summary_json = payload
+
+            result_id = await run_in_threadpool(
+                record_analysis, current_user.id, safe_filename, outcome["text"], summary_json,
+                content_hash, outcome, size_bytes
+            )
+            yield sse("result", {"result_id": result_id, "cached": False,
+                                 "summary": load_summary(summary_json), "stage_timings": timings})
+        except analysis.NoReadableContentError as e:
+            yield sse("error", {"detail": str(e)})
+        except analysis.LLMAnalysisError as e:
+            yield sse("error", {"detail": f"Analysis failed: {e}"})
+        except Exception:
+            # The 200 and the headers are long gone, so this is the only way the client hears of it
+            logger.exception("Streaming analysis failed", extra={"content_hash": content_hash})
+            yield sse("error", {"detail": "Analysis failed: internal error"})
+        finally:
+            spool_path.unlink(missing_ok=True)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # Mount static frontend
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -0,0 +1,75 @@
+"""
+Prometheus metrics and timing spans, exported at GET /metrics.
+
+`stage(timings, name)` is the span used around every step of the upload
+pipeline: it records into the cim_stage_seconds histogram and, when given a
+timings dict, into the job's stage_timings too. `timed(histogram, **labels)`
+does the same for any other histogram (DB queries, auth).
+
+Metrics live in this process's registry; with several uvicorn workers each
+one serves its own numbers (scrape them individually or set up
+prometheus_client's multiprocess mode).
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+
+STAGE_SECONDS = Histogram(
+    "cim_stage_seconds", "Time spent in each stage of the upload and analysis pipeline",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+AUTH_SECONDS = Histogram(
+    "cim_auth_seconds", "Time to authenticate a request, by token type and outcome",
+    ["method", "outcome"], buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    "cim_db_query_seconds", "Results API database queries", ["query"], buckets=LATENCY_BUCKETS,
+)
+PAGES_EXTRACTED = Histogram(
+    "cim_pages_extracted", "Useful pages extracted per PDF", buckets=(1, 2, 5, 10, 20, 40, 80, 160, 320, 640),
+)
+PROMPT_TOKENS = Histogram("cim_prompt_tokens", "Tokens per LLM prompt", buckets=TOKEN_BUCKETS)
+LLM_TOKENS = Histogram(
+    "cim_llm_tokens", "Tokens used per LLM call (prompt + completion, as reported by the provider)",
+    buckets=TOKEN_BUCKETS,
+)
+LLM_CALLS = Counter("cim_llm_calls", "LLM call attempts by outcome", ["outcome"])
+LLM_QUEUE_DEPTH = Gauge("cim_llm_queue_depth", "LLM calls waiting for rate-limit budget")
+
+
+@contextmanager
+def timed(histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if labels:
+            histogram = histogram.labels(**labels)
+        histogram.observe(time.perf_counter() - start)
+
+
+@contextmanager
+def stage(timings, name):
+    """Record the wall-clock seconds spent in a pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        if timings is not None:
+            timings[name] = round(elapsed, 4)
+        logger.debug("stage finished", extra={"stage": name, "seconds": round(elapsed, 4)})
+
+
+def render():
+    """(body, content type) of the current metrics in Prometheus text format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Index, UniqueConstraint
+from datetime import datetime
+from database import Base
+
+class AnalysisJob(Base):
+    __tablename__ = "analysis_jobs"
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    user_id = Column(String, ForeignKey("users.id"), index=True)
+    filename = Column(String(100))
+    content_type = Column(String(100))
+    pdf_path = Column(String)  # Spooled PDF on local disk until the job finishes
+    upload_key = Column(String, nullable=True)  # Direct-to-S3 upload the worker still has to fetch
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the PDF bytes
+    force_reanalysis = Column(Boolean, default=False, nullable=False)  # Bypass the artifact cache
+    idempotency_key = Column(String(100), nullable=True)
+    batch_id = Column(String(32), nullable=True, index=True)  # Set for jobs created by /api/upload/batch
+    state = Column(String(20), default="queued", nullable=False)  # queued, running, succeeded, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    stage_timings = Column(Text, nullable=True)  # JSON: stage name -> seconds
+    extraction_stats = Column(Text, nullable=True)  # JSON: per-page extraction timings and outcomes
+    locked_by = Column(String(100), nullable=True)
+    locked_at = Column(DateTime, nullable=True)  # Lease heartbeat, stale leases get requeued
+    result_id = Column(Integer, ForeignKey("analysis_results.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_analysis_jobs_state_created_at", "state", "created_at"),
+        UniqueConstraint("user_id", "idempotency_key", name="uq_analysis_jobs_user_idempotency_key"),
+    )
@@ -1,17 +1,53 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Index
+from sqlalchemy.orm import relationship, deferred
 from datetime import datetime
 from database import Base
+from compression import CompressedText
+from models.cim_artifact import CimArtifact
 
 class AnalysisResult(Base):
     __tablename__ = "analysis_results"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, ForeignKey("users.id"))  # Changed to String to match User.id
     filename = Column(String(100))
-    preview_text = Column(Text)
-    summary_json = Column(Text)
+    # zstd-compressed on SQLite (compression.py). Deferred: loading a result for a rating
+    # or a delete doesn't read or decompress them; use undefer_group("text") to include them
+    preview_text = deferred(Column(CompressedText), group="text")
+    summary_json = deferred(Column(CompressedText), group="text")
     timestamp = Column(DateTime, default=datetime.utcnow)
     user_rating = Column(Float, nullable=True)  # User rating (1-5)
     confidence_score = Column(Float, nullable=True)  # AI confidence score
+    content_hash = Column(String(64), ForeignKey("cim_artifacts.sha256"), nullable=True, index=True)  # Shared PDF artifact
+
+    # Typed values parsed from summary_json at write time (see summary_fields.py)
+    company_name = Column(String(200), nullable=True)
+    revenue = Column(Float, nullable=True)  # USD
+    ebitda = Column(Float, nullable=True)  # USD
+    ebitda_margin = Column(Float, nullable=True)  # Percent, e.g. 24.5
+    fiscal_year = Column(Integer, nullable=True)
+    thesis_count = Column(Integer, nullable=True)
+    red_flag_count = Column(Integer, nullable=True)
+    ai_confidence = Column(Float, nullable=True)  # LLM's overall confidence (0-1)
+    confidence_company_info = Column(Float, nullable=True)
+    confidence_financials = Column(Float, nullable=True)
+    confidence_thesis = Column(Float, nullable=True)
+    confidence_red_flags = Column(Float, nullable=True)
+    confidence_summary = Column(Float, nullable=True)
+    summary_version = Column(Integer, nullable=True)  # Parser version that filled the columns above
+    previous_version_id = Column(Integer, ForeignKey("analysis_results.id", ondelete="SET NULL"), nullable=True, index=True)  # Earlier version of the same CIM (near_duplicates.py)
 
     user = relationship("User", back_populates="results")
+
+    __table_args__ = (
+        # The dashboard's default listing: one user's results, newest first
+        Index("ix_analysis_results_user_timestamp", "user_id", "timestamp"),
+        Index("ix_analysis_results_user_rating", "user_id", "user_rating"),
+        Index("ix_analysis_results_user_confidence", "user_id", "confidence_score"),
+        Index("ix_analysis_results_user_company_name", "user_id", "company_name"),
+        Index("ix_analysis_results_user_revenue", "user_id", "revenue"),
+        Index("ix_analysis_results_user_ebitda", "user_id", "ebitda"),
+        Index("ix_analysis_results_user_ebitda_margin", "user_id", "ebitda_margin"),
+        Index("ix_analysis_results_user_fiscal_year", "user_id", "fiscal_year"),
+        # Near-duplicate lookups: is this LSH candidate one of the user's documents?
+        Index("ix_analysis_results_content_hash_user", "content_hash", "user_id"),
+    )
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from datetime import datetime
+from database import Base
+
+class CimArtifact(Base):
+    """One stored PDF, keyed by the SHA-256 of its bytes and shared by every
+    user who uploads the same file."""
+    __tablename__ = "cim_artifacts"
+    sha256 = Column(String(64), primary_key=True)
+    s3_key = Column(String, nullable=True)
+    s3_url = Column(String, nullable=True)
+    size_bytes = Column(Integer, nullable=True)
+    extracted_text = Column(Text, nullable=True)  # Cleared on eviction
+    summary_json = Column(Text, nullable=True)  # Cached LLM result, cleared on eviction
+    created_at = Column(DateTime, default=datetime.utcnow)
+    analyzed_at = Column(DateTime, nullable=True)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+    hit_count = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Text, DateTime, LargeBinary, ForeignKey
+from datetime import datetime
+from database import Base
+
+class CimFingerprint(Base):
+    """MinHash signatures of one stored PDF's extracted pages (see near_duplicates.py)."""
+    __tablename__ = "cim_fingerprints"
+    content_hash = Column(String(64), ForeignKey("cim_artifacts.sha256"), primary_key=True)
+    signature = Column(LargeBinary, nullable=False)  # Whole-document MinHash, NUM_PERM uint32s
+    page_signatures = Column(LargeBinary, nullable=False)  # One MinHash per page, pages x NUM_PERM uint32s
+    page_hashes = Column(Text, nullable=False)  # JSON list of per-page hashes of the normalized text
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CimLshBucket(Base):
+    """LSH band bucket -> document; documents sharing a bucket are near-duplicate candidates."""
+    __tablename__ = "cim_lsh_buckets"
+    bucket = Column(String(24), primary_key=True)  # "<band>:<hash of the band's rows>"
+    content_hash = Column(String(64), ForeignKey("cim_artifacts.sha256"), primary_key=True)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, LargeBinary, DateTime
+from datetime import datetime
+from database import Base
+
+class CompressionDictionary(Base):
+    """A zstd dictionary trained on stored analyses (see compression.py).
+
+    Kept forever: every compressed value names the dictionary it needs in
+    its frame header. The newest one is used for new writes."""
+    __tablename__ = "compression_dictionaries"
+    dict_id = Column(Integer, primary_key=True, autoincrement=False)  # zstd's own id, as written in the frames
+    data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Float
+from database import Base
+
+class PortfolioStat(Base):
+    """One histogram bin of one metric over a user's results, grouped by the
+    quarter they were screened in and their rating bucket.
+
+    Maintained incrementally by portfolio_stats.apply_changes whenever a
+    result is created, re-rated or deleted."""
+    __tablename__ = "portfolio_stats"
+    user_id = Column(String, primary_key=True)
+    quarter = Column(String(6), primary_key=True)  # "2026Q4", from the result timestamp
+    rating_bucket = Column(String(8), primary_key=True)  # "1".."5" or "unrated"
+    metric = Column(String(32), primary_key=True)
+    bin = Column(Integer, primary_key=True)  # Index into portfolio_stats.METRICS edges
+    count = Column(Integer, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0.0)  # Sum of the values in the bin, for exact means
@@ -0,0 +1,180 @@
+"""
+Near-duplicate CIMs: find the earlier version of a revised document.
+
+Every analyzed PDF gets a fingerprint of its extracted pages: a MinHash
+signature per page (NUM_PERM minimums over hashed word 5-grams) and the
+document's signature, which is the element-wise minimum of its pages'
+(the MinHash of all of its shingles). The document signature is split into
+LSH_BANDS bands; each band is hashed into a bucket in `cim_lsh_buckets`.
+Two documents with Jaccard similarity s share at least one bucket with
+probability 1 - (1 - s^rows)^bands, about 0.99 at s=0.85 and 0.02 at
+s=0.4 with the defaults, so a lookup is a handful of indexed bucket reads
+plus a comparison with a few candidates, however large the corpus.
+
+Pages are compared by an exact hash of their normalized text (running
+headers/footers and page numbers removed), so any edit to a page marks it
+changed; the page signatures tell a revised page from an inserted one.
+"""
+
+import hashlib
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+from sqlalchemy import exists, func
+
+from models.analysis_result import AnalysisResult
+from models.cim_fingerprint import CimFingerprint, CimLshBucket
+from page_selection import strip_repeated_lines
+
+NUM_PERM = 128
+LSH_BANDS = 16  # x 8 rows; similarity threshold around (1/16)^(1/8) = 0.71
+SHINGLE_WORDS = 5
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.7"))
+NEAR_DUPLICATE_CANDIDATES = int(os.getenv("NEAR_DUPLICATE_CANDIDATES", "20"))
+# A changed page at least this similar to a page that disappeared is a revision of it
+PAGE_REVISION_THRESHOLD = 0.5
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240601)  # Fixed: signatures are stored and compared across processes
+_A = _rng.randint(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_EMPTY = np.full(NUM_PERM, _PRIME, dtype=np.uint32)
+
+_PAGE_NUMBER_LINE = re.compile(r"^\s*(page\s*)?\d+(\s*(of|/)\s*\d+)?\s*$", re.IGNORECASE | re.MULTILINE)
+
+
+def normalize_page(text):
+    return " ".join(_PAGE_NUMBER_LINE.sub("", text).lower().split())
+
+
+def minhash(text):
+    """NUM_PERM-value MinHash signature of a normalized page's word 5-grams."""
+    words = text.split()
+    if not words:
+        return _EMPTY.copy()
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles)) % _PRIME
+    # (a * x + b) mod p for every permutation and shingle; a, x < 2^31 so it fits in uint64
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def fingerprint(pages):
+    """Fingerprint of a document's extracted pages: page hashes, page signatures, document signature."""
+    normalized = [normalize_page(page) for page in strip_repeated_lines(pages)]
+    page_signatures = np.array([minhash(page) for page in normalized], dtype=np.uint32).reshape(-1, NUM_PERM)
+    signature = page_signatures.min(axis=0) if len(page_signatures) else _EMPTY.copy()
+    return {
+        "page_hashes": [hashlib.sha1(page.encode()).hexdigest()[:16] for page in normalized],
+        "page_signatures": page_signatures,
+        "signature": signature,
+    }
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+def band_buckets(signature):
+    rows = NUM_PERM // LSH_BANDS
+    return [
+        f"{band}:{hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(LSH_BANDS)
+    ]
+
+
+def store_fingerprint(db, content_hash, fp):
+    """Index a document's fingerprint (once per content hash), in the caller's transaction."""
+    if db.get(CimFingerprint, content_hash):
+        return
+    db.add(CimFingerprint(
+        content_hash=content_hash,
+        signature=fp["signature"].tobytes(),
+        page_signatures=fp["page_signatures"].tobytes(),
+        page_hashes=json.dumps(fp["page_hashes"]),
+    ))
+    db.add_all([CimLshBucket(bucket=bucket, content_hash=content_hash) for bucket in band_buckets(fp["signature"])])
+
+
+def _load_signatures(row):
+    return (np.frombuffer(row.signature, dtype=np.uint32),
+            np.frombuffer(row.page_signatures, dtype=np.uint32).reshape(-1, NUM_PERM))
+
+
+def find_previous_version(db, user_id, content_hash, fp, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """The user's latest result for the most similar earlier document, or None.
+
+    Returns a dict with result_id, content_hash, similarity, summary_json,
+    page_hashes and page_signatures of that document.
+    """
+    # Only documents this user has analyzed can be their earlier version, so other users'
+    # similar CIMs (templated banker decks) never take up the candidate slots
+    candidates = db.query(CimLshBucket.content_hash).filter(
+        CimLshBucket.bucket.in_(band_buckets(fp["signature"])),
+        CimLshBucket.content_hash != content_hash,
+        exists().where(
+            AnalysisResult.content_hash == CimLshBucket.content_hash,
+            AnalysisResult.user_id == user_id
+        )
+    ).group_by(CimLshBucket.content_hash).order_by(func.count().desc()).limit(NEAR_DUPLICATE_CANDIDATES).all()
+    if not candidates:
+        return None
+
+    latest = {}
+    for result_id, result_hash, summary_json in db.query(
+        AnalysisResult.id, AnalysisResult.content_hash, AnalysisResult.summary_json
+    ).filter(
+        AnalysisResult.user_id == user_id,
+        AnalysisResult.content_hash.in_([row.content_hash for row in candidates])
+    ).order_by(AnalysisResult.id):
+        latest[result_hash] = (result_id, summary_json)
+    if not latest:
+        return None
+
+    best = None
+    for row in db.query(CimFingerprint).filter(CimFingerprint.content_hash.in_(list(latest))):
+        signature, page_signatures = _load_signatures(row)
+        score = similarity(fp["signature"], signature)
+        if score >= threshold and (best is None or score > best["similarity"]):
+            result_id, summary_json = latest[row.content_hash]
+            best = {
+                "result_id": result_id,
+                "content_hash": row.content_hash,
+                "similarity": round(score, 3),
+                "summary_json": summary_json,
+                "page_hashes": json.loads(row.page_hashes),
+                "page_signatures": page_signatures,
+            }
+    return best
+
+
+def diff_pages(fp, previous):
+    """Which pages (1-based, among the extracted pages) are new or changed, and how many disappeared.
+
+    Changed pages are split into "revised" (an edited version of a page
+    that disappeared) and "added".
+    """
+    old_hashes = set(previous["page_hashes"])
+    new_hashes = set(fp["page_hashes"])
+    changed = [i for i, page_hash in enumerate(fp["page_hashes"]) if page_hash not in old_hashes]
+    removed = [i for i, page_hash in enumerate(previous["page_hashes"]) if page_hash not in new_hashes]
+
+    revised = []
+    if changed and removed:
+        new_signatures = fp["page_signatures"][changed]
+        old_signatures = previous["page_signatures"][removed]
+        # Pairwise page similarity, changed x removed
+        scores = (new_signatures[:, None, :] == old_signatures[None, :, :]).mean(axis=2)
+        revised = [changed[i] for i in np.flatnonzero(scores.max(axis=1) >= PAGE_REVISION_THRESHOLD)]
+    return {
+        "previous_result_id": previous["result_id"],
+        "similarity": previous["similarity"],
+        "pages": len(fp["page_hashes"]),
+        "changed_pages": [i + 1 for i in changed],
+        "revised_pages": [i + 1 for i in revised],
+        "added_pages": [i + 1 for i in changed if i not in revised],
+        "removed_pages": len(removed),
+    }
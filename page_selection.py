@@ -0,0 +1,173 @@
+"""
+Relevance-ranked page selection for the analysis prompt.
+
+Extracted pages are cleaned of running headers and footers, scored for
+investment relevance (financial keywords, density of figures, minus
+boilerplate such as disclaimers and tables of contents) and the best ones
+are packed, back in document order, into a token budget counted with the
+model's own tokenizer.
+"""
+
+import logging
+import math
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Tokens of CIM text per single-call prompt (the old 10,000-character cut was roughly 2,500)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+TOKENIZER_MODEL = os.getenv("TOKENIZER_MODEL", "gpt-4o")
+
+# A line counts as a running header/footer when it sits in the first/last few lines of this share of pages
+EDGE_LINES = 3
+REPEATED_LINE_SHARE = 0.3
+MAX_HEADER_CHARS = 120
+
+FINANCIAL_TERMS = {
+    "revenue": 3, "ebitda": 4, "adjusted ebitda": 6, "margin": 3, "gross profit": 3, "net income": 3,
+    "operating income": 3, "free cash flow": 6, "cash flow": 2, "capex": 3, "capital expenditure": 3,
+    "cagr": 3, "growth": 1, "bookings": 2, "backlog": 2, "recurring": 2, "retention": 2, "churn": 2,
+    "customers": 1, "customer concentration": 2, "working capital": 2, "debt": 1, "leverage": 2,
+    "valuation": 2, "projection": 2, "forecast": 2, "budget": 1, "fiscal": 1, "fy": 1,
+    "investment highlights": 4, "executive summary": 4, "key risks": 3, "market share": 2,
+}
+# Subtracted from the score
+BOILERPLATE_TERMS = {
+    "table of contents": 8, "disclaimer": 6, "forward-looking statements": 6, "confidentiality": 4,
+    "not an offer": 5, "no representation or warranty": 6, "without the prior written consent": 5,
+    "intentionally left blank": 10, "all rights reserved": 4, "securities act": 4,
+}
+TERM_WEIGHTS = {**FINANCIAL_TERMS, **{term: -weight for term, weight in BOILERPLATE_TERMS.items()}}
+# One pass per page; longest alternatives first, so "free cash flow" isn't also counted as "cash flow"
+_TERMS = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in sorted(TERM_WEIGHTS, key=len, reverse=True)) + r")\b")
+_NUMBER = re.compile(r"[$€£]?\d[\d,]*(?:\.\d+)?\s?(?:%|x|bps|[mbk]n?\b|million|billion)?", re.IGNORECASE)
+_TOC_LEADER = re.compile(r"\.{4,}\s*\d+\s*$", re.MULTILINE)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except Exception as e:
+        # No tiktoken, or its vocabulary can't be downloaded (offline container)
+        logger.warning("Tokenizer unavailable, estimating 4 characters per token",
+                       extra={"model": TOKENIZER_MODEL, "error": e.__class__.__name__})
+        return None
+
+
+def count_tokens(text):
+    """Tokens `text` costs the model, falling back to ~4 characters per token."""
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    encoding = _encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+def split_to_tokens(text, max_tokens):
+    """`text` cut into consecutive pieces of at most `max_tokens` tokens each."""
+    encoding = _encoding()
+    if encoding is None:
+        step = max_tokens * 4
+        return [text[i:i + step] for i in range(0, len(text), step)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def _normalize_line(line):
+    # "Page 12 of 80" and "Page 13 of 80" should match
+    return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+
+def strip_repeated_lines(pages):
+    """Remove running headers and footers: lines repeated at the top or bottom of many pages."""
+    if len(pages) < 3:
+        return list(pages)
+    seen = Counter()
+    for page in pages:
+        lines = [line for line in page.splitlines() if line.strip()]
+        edges = lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+        seen.update({_normalize_line(line) for line in edges if len(line.strip()) <= MAX_HEADER_CHARS})
+    threshold = max(3, math.ceil(len(pages) * REPEATED_LINE_SHARE))
+    repeated = {line for line, count in seen.items() if count >= threshold}
+    if not repeated:
+        return list(pages)
+
+    cleaned = []
+    for page in pages:
+        lines = page.splitlines()
+        kept_indexes = [i for i, line in enumerate(lines) if line.strip()]
+        edge = set(kept_indexes[:EDGE_LINES] + kept_indexes[-EDGE_LINES:])
+        stripped = "\n".join(
+            line for i, line in enumerate(lines)
+            if not (i in edge and _normalize_line(line) in repeated)
+        ).strip()
+        # A page that is nothing but "header" lines is more likely real content repeated
+        cleaned.append(stripped or page)
+    return cleaned
+
+
+def score_page(text):
+    """Investment relevance of one page; higher is better, boilerplate goes negative."""
+    lowered = text.lower()
+    words = max(len(lowered.split()), 1)
+    weights = [TERM_WEIGHTS[term] for term in _TERMS.findall(lowered)]
+    keywords = sum(weight for weight in weights if weight > 0)
+    boilerplate = -sum(weight for weight in weights if weight < 0)
+    numbers = len(_NUMBER.findall(text))
+    toc_lines = len(_TOC_LEADER.findall(text))
+    # Densities per 100 words so long narrative pages don't win on size alone
+    density = 100.0 * (keywords + 0.5 * numbers) / words
+    penalty = 100.0 * (boilerplate + 3 * toc_lines) / words
+    # Very short pages carry little even when dense
+    return round((density - penalty) * min(1.0, words / 80), 3)
+
+
+def select_pages(text_pages, budget=PROMPT_TOKEN_BUDGET):
+    """Pick the most relevant pages that fit in `budget` tokens.
+
+    Returns (pages in document order, stats). If the best page alone is
+    over budget it is truncated rather than dropped.
+    """
+    pages = strip_repeated_lines(text_pages)
+    scored = []
+    for index, page in enumerate(pages):
+        if page:
+            scored.append((score_page(page), index, count_tokens(page)))
+
+    chosen = {}
+    remaining = budget
+    # Separator between pages, counted against the budget too
+    separator = count_tokens("\n\n")
+    for score, index, tokens in sorted(scored, key=lambda item: (-item[0], item[1])):
+        if score <= 0 and chosen:
+            break
+        cost = tokens + (separator if chosen else 0)
+        if cost <= remaining:
+            chosen[index] = pages[index]
+            remaining -= cost
+        elif not chosen:
+            chosen[index] = truncate_to_tokens(pages[index], budget)
+            remaining = 0
+        if remaining <= 0:
+            break
+
+    selected = [chosen[index] for index in sorted(chosen)]
+    stats = {
+        "candidate_pages": len(text_pages),
+        "selected_pages": sorted(index + 1 for index in chosen),
+        "selected_tokens": budget - remaining,
+        "candidate_tokens": sum(tokens for _, _, tokens in scored),
+    }
+    return selected, stats
@@ -0,0 +1,69 @@
+"""
+Incremental parsing of a JSON object as it streams in from the LLM.
+
+`SectionParser` is fed text deltas and hands back each top-level
+`"KEY": value` pair as soon as its value is complete, so a client can show
+COMPANY INFO while THESIS is still being generated. Anything before the
+first `{` (e.g. a ```json fence) is ignored.
+"""
+
+import json
+
+
+class SectionParser:
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.member = None  # Characters of the current top-level member, once inside the object
+        self.done = False
+
+    def feed(self, text):
+        """Consume a text delta. Returns a list of (key, value) pairs completed by it."""
+        sections = []
+        for char in text:
+            if self.done:
+                break
+            if self.member is None:
+                if char == "{":
+                    self.depth = 1
+                    self.member = []
+                continue
+
+            if self.in_string:
+                self.member.append(char)
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+            if self.depth == 0 or (self.depth == 1 and char == ","):
+                # End of a top-level member: the closing brace of the object, or a comma
+                section = self._parse_member()
+                if section:
+                    sections.append(section)
+                self.member = []
+                if self.depth == 0:
+                    self.done = True
+                continue
+            self.member.append(char)
+        return sections
+
+    def _parse_member(self):
+        raw = "".join(self.member).strip()
+        if not raw:
+            return None
+        try:
+            parsed = json.loads("{" + raw + "}")
+        except ValueError:
+            return None
+        return next(iter(parsed.items()), None)
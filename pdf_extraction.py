@@ -0,0 +1,196 @@
+import asyncio
+import mmap
+import os
+import signal
+import threading
+import time
+from PyPDF2 import PdfReader
+
+# Pages shorter than this (after stripping) are treated as cover/filler pages
+MIN_PAGE_CHARS = 100
+MAX_USEFUL_PAGES = 10
+# A worker closes its cached document after this long unused. The open mmap keeps a
+# deleted spool file's disk space allocated, and workers have no "job finished" signal
+DOCUMENT_IDLE_SECONDS = float(os.getenv("PDF_DOCUMENT_IDLE_SECONDS", "2"))
+
+# Per-process cache of the open document, so each page task doesn't re-parse the xref
+_open_document = None  # (file identity, file, mmap, reader)
+_document_lock = threading.RLock()  # Reentrant: the SIGALRM handler can interrupt a holder
+_last_used = 0.0
+_reaper = None
+
+
+class PageTimeout(Exception):
+    """A single page took longer than its time budget."""
+
+
+def _classify(text):
+    """Apply the page filtering rules. Returns (status, cleaned text or None)."""
+    if not text:
+        return "empty", None
+    clean = text.strip()
+    if len(clean) <= MIN_PAGE_CHARS:
+        return "short", None
+    if clean.lower().startswith("confidential"):
+        return "confidential", None
+    return "ok", clean
+
+
+def extract_text_pages(pdf_path, max_pages=MAX_USEFUL_PAGES):
+    """Extract the first `max_pages` pages with readable business content.
+
+    This is the simple serial loop; `extract_pages_parallel` is the engine
+    the upload pipeline uses. The PDF is memory-mapped rather than read into
+    a bytes copy, so the OS pages in only what PyPDF2 actually touches.
+    """
+    with open(pdf_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        reader = PdfReader(data)
+        text_pages = []
+        for page in reader.pages:
+            status, clean = _classify(page.extract_text())
+            if status == "ok":
+                text_pages.append(clean)
+            if len(text_pages) >= max_pages:
+                break
+        return text_pages
+
+
+def _close_document():
+    global _open_document
+    if _open_document:
+        _, f, data, _ = _open_document
+        data.close()
+        f.close()
+    _open_document = None
+
+
+def _document_key(pdf_path):
+    # Same path, different file: a retried job's spool is written again in place
+    st = os.stat(pdf_path)
+    return pdf_path, st.st_ino, st.st_mtime_ns
+
+
+def _get_reader(pdf_path):
+    """The cached reader for `pdf_path`, opening it if needed. Call with _document_lock held."""
+    global _open_document, _last_used, _reaper
+    key = _document_key(pdf_path)
+    if _open_document is None or _open_document[0] != key:
+        _close_document()
+        f = open(pdf_path, "rb")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _open_document = (key, f, data, PdfReader(data))
+        if _reaper is None or not _reaper.is_alive():
+            _reaper = threading.Thread(target=_close_idle_document, daemon=True)
+            _reaper.start()
+    _last_used = time.monotonic()
+    return _open_document[3]
+
+
+def _close_idle_document():
+    while True:
+        time.sleep(DOCUMENT_IDLE_SECONDS / 2)
+        with _document_lock:
+            if _open_document and time.monotonic() - _last_used >= DOCUMENT_IDLE_SECONDS:
+                _close_document()
+
+
+def count_pages(pdf_path):
+    with _document_lock:
+        return len(_get_reader(pdf_path).pages)
+
+
+def _raise_page_timeout(signum, frame):
+    raise PageTimeout()
+
+
+def extract_page(pdf_path, page_number, timeout=None):
+    """Extract one page in a worker process.
+
+    Returns (page_number, status, cleaned text or None, seconds). On Unix the
+    time budget is enforced inside the worker with SIGALRM, so a pathological
+    page is abandoned instead of pinning the process.
+    """
+    global _last_used
+    use_alarm = timeout and hasattr(signal, "setitimer")
+    start = time.perf_counter()
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _raise_page_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with _document_lock:
+            text = _get_reader(pdf_path).pages[page_number].extract_text()
+            _last_used = time.monotonic()
+        status, clean = _classify(text)
+    except PageTimeout:
+        # The reader may be half-way through lazily loading an object; start fresh next time
+        with _document_lock:
+            _close_document()
+        status, clean = "timeout", None
+    except Exception:
+        status, clean = "error", None
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    return page_number, status, clean, round(time.perf_counter() - start, 4)
+
+
+async def extract_pages_parallel(pdf_path, executor, max_pages=MAX_USEFUL_PAGES,
+                                 page_timeout=5.0, window=8):
+    """Spread page extraction across a process pool with a per-page time budget.
+
+    Pages are submitted in a sliding window and consumed in document order,
+    so the result matches the serial loop: the first `max_pages` pages that
+    pass the filters (every page when `max_pages` is None). Pages over
+    budget are skipped. Returns (text_pages, stats) where stats has
+    per-page timings and outcomes.
+    """
+    loop = asyncio.get_running_loop()
+    wall_start = time.perf_counter()
+    total_pages = await loop.run_in_executor(executor, count_pages, pdf_path)
+
+    # The parent waits a little longer than the worker's own alarm
+    parent_timeout = page_timeout + 1.0 if page_timeout else None
+    pending = {}
+    next_page = 0
+    text_pages = []
+    page_stats = []
+
+    def submit():
+        nonlocal next_page
+        while next_page < total_pages and len(pending) < window:
+            future = loop.run_in_executor(executor, extract_page, pdf_path, next_page, page_timeout)
+            pending[next_page] = future
+            next_page += 1
+
+    submit()
+    page_number = 0
+    try:
+        while page_number < total_pages and (max_pages is None or len(text_pages) < max_pages):
+            submit()
+            future = pending.pop(page_number)
+            try:
+                _, status, clean, seconds = await asyncio.wait_for(future, timeout=parent_timeout)
+            except asyncio.TimeoutError:
+                status, clean, seconds = "timeout", None, parent_timeout
+            if status == "ok":
+                text_pages.append(clean)
+            page_stats.append({"page": page_number + 1, "status": status, "seconds": seconds,
+                               "chars": len(clean) if clean else 0})
+            page_number += 1
+    finally:
+        for future in pending.values():
+            future.cancel()
+
+    timings = [p["seconds"] for p in page_stats]
+    stats = {
+        "total_pages": total_pages,
+        "pages_examined": len(page_stats),
+        "useful_pages": len(text_pages),
+        "timed_out_pages": [p["page"] for p in page_stats if p["status"] == "timeout"],
+        "page_seconds_total": round(sum(timings), 4),
+        "page_seconds_max": max(timings) if timings else 0.0,
+        "wall_seconds": round(time.perf_counter() - wall_start, 4),
+        "pages": page_stats,
+    }
+    return text_pages, stats
@@ -0,0 +1,245 @@
+"""
+Portfolio analytics over a user's results, from materialized histograms.
+
+For every (user, quarter screened, rating bucket, metric) the
+`portfolio_stats` table holds a fixed-bin histogram: a count and a sum of
+values per bin. `apply_changes` adds or subtracts rows in the same
+transaction that inserts, re-rates or deletes results, so queries read a few
+hundred small rows per metric instead of scanning analysis_results.
+
+Counts and means are exact. Percentiles are interpolated inside a bin, so
+they are as precise as the bin width: 0.5 points of margin, 0.01 of
+confidence, 0.25 of rating, and about 12% for revenue and EBITDA, whose bins
+are log-spaced.
+"""
+
+import numpy as np
+from sqlalchemy import delete, select
+
+from models.analysis_result import AnalysisResult
+from models.portfolio_stat import PortfolioStat
+
+_MONEY = np.geomspace(1e4, 1e12, 81)  # $10K..$1T, 10 bins per decade
+MONEY_EDGES = np.concatenate([-_MONEY[::-1], _MONEY])
+
+# metric -> (column, bin edges); bin b holds values in [edges[b-1], edges[b]),
+# with bin 0 and bin len(edges) open-ended
+METRICS = {
+    "results": (None, np.array([])),
+    "revenue": (AnalysisResult.revenue, MONEY_EDGES),
+    "ebitda": (AnalysisResult.ebitda, MONEY_EDGES),
+    "ebitda_margin": (AnalysisResult.ebitda_margin, np.linspace(-100, 100, 401)),
+    "user_rating": (AnalysisResult.user_rating, np.linspace(1, 5, 17)),
+    "confidence_score": (AnalysisResult.confidence_score, np.linspace(0, 1, 101)),
+    "ai_confidence": (AnalysisResult.ai_confidence, np.linspace(0, 1, 101)),
+    "red_flag_count": (AnalysisResult.red_flag_count, np.arange(0, 51)),
+}
+VALUE_METRICS = [name for name, (column, _) in METRICS.items() if column is not None]
+
+# What a result contributes to the histograms, in this order
+FACT_COLUMNS = [AnalysisResult.user_id, AnalysisResult.timestamp, AnalysisResult.user_rating] + [
+    METRICS[name][0] for name in VALUE_METRICS if name != "user_rating"
+]
+FACT_NAMES = [column.key for column in FACT_COLUMNS]
+
+def facts(result):
+    """The FACT_COLUMNS values of an AnalysisResult object."""
+    return tuple(getattr(result, name) for name in FACT_NAMES)
+
+
+def quarter_of(timestamp):
+    return f"{timestamp.year}Q{(timestamp.month - 1) // 3 + 1}"
+
+
+def rating_bucket(rating):
+    if rating is None:
+        return "unrated"
+    return str(min(5, max(1, int(rating))))
+
+
+def _deltas(rows, sign):
+    """{(user, quarter, bucket, metric, bin): [count, total]} for a list of fact tuples."""
+    if not rows:
+        return {}
+    columns = dict(zip(FACT_NAMES, zip(*rows)))
+    groups = [
+        (user_id, quarter_of(timestamp), rating_bucket(rating))
+        for user_id, timestamp, rating in zip(columns["user_id"], columns["timestamp"], columns["user_rating"])
+    ]
+    positions = {}
+    group_index = np.array([positions.setdefault(group, len(positions)) for group in groups])
+    group_keys = list(positions)
+
+    changes = {}
+    for group, count in zip(*np.unique(group_index, return_counts=True)):
+        changes[(*group_keys[group], "results", 0)] = [sign * int(count), 0.0]
+
+    for name in VALUE_METRICS:
+        values = np.array(columns[name], dtype=float)  # None -> nan
+        present = ~np.isnan(values)
+        if not present.any():
+            continue
+        values = values[present]
+        bins = np.searchsorted(METRICS[name][1], values, side="right")
+        # One (group, bin) key per row, then count and sum per distinct key
+        width = len(METRICS[name][1]) + 1
+        keys = group_index[present] * width + bins
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse)
+        totals = np.bincount(inverse, weights=values)
+        for key, count, total in zip(unique_keys, counts, totals):
+            group, bin_index = divmod(int(key), width)
+            changes[(*group_keys[group], name, bin_index)] = [sign * int(count), sign * float(total)]
+    return changes
+
+
+def _upsert(dialect_name):
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(PortfolioStat)
+    return statement.on_conflict_do_update(
+        index_elements=["user_id", "quarter", "rating_bucket", "metric", "bin"],
+        set_={
+            "count": PortfolioStat.count + statement.excluded["count"],
+            "total": PortfolioStat.total + statement.excluded.total,
+        },
+    )
+
+
+def apply_changes(db, removed=(), added=()):
+    """Move results out of (`removed`) and into (`added`) the histograms.
+
+    Both are lists of `facts(...)` tuples; a re-rated result appears in both
+    with its old and new values. Runs in the caller's transaction, so the
+    histograms commit or roll back with the change itself. `db` is a sync
+    Session (use `AsyncSession.run_sync` from async code).
+    """
+    changes = _deltas(list(removed), -1)
+    for key, (count, total) in _deltas(list(added), 1).items():
+        current = changes.setdefault(key, [0, 0.0])
+        current[0] += count
+        current[1] += total
+    params = [
+        {"user_id": user_id, "quarter": quarter, "rating_bucket": bucket, "metric": metric,
+         "bin": bin_index, "count": count, "total": total}
+        for (user_id, quarter, bucket, metric, bin_index), (count, total) in changes.items()
+        if count or total
+    ]
+    if params:
+        db.execute(_upsert(db.get_bind().dialect.name), params)
+
+
+def rebuild(db, user_id=None, batch_size=2000):
+    """Recompute the histograms from analysis_results (all users, or one). Commits."""
+    clear = delete(PortfolioStat)
+    query = select(*FACT_COLUMNS).order_by(AnalysisResult.id)
+    if user_id is not None:
+        clear = clear.where(PortfolioStat.user_id == user_id)
+        query = query.where(AnalysisResult.user_id == user_id)
+    db.execute(clear)
+    for partition in db.execute(query.execution_options(yield_per=batch_size)).partitions():
+        apply_changes(db, added=[tuple(row) for row in partition])
+    db.commit()
+
+
+def ensure_portfolio_stats(bind):
+    """Build the histograms once for a database that has results but no stats yet (alembic revision 0008)."""
+    from sqlalchemy.orm import Session
+    with Session(bind) as db:
+        if db.scalar(select(PortfolioStat.user_id).limit(1)) is None and \
+                db.scalar(select(AnalysisResult.id).limit(1)) is not None:
+            rebuild(db)
+
+
+def summarize(rows, metric, group_by, percentiles):
+    """Per-group count, mean, percentiles and histogram from PortfolioStat rows.
+
+    `rows` are (quarter, rating_bucket, bin, count, total) tuples for one
+    metric; `group_by` is "quarter", "rating" or "none".
+    """
+    edges = METRICS[metric][1]
+    width = len(edges) + 1
+    if group_by == "quarter":
+        labels = [row[0] for row in rows]
+    elif group_by == "rating":
+        labels = [row[1] for row in rows]
+    else:
+        labels = ["all"] * len(rows)
+    if not rows:
+        return []
+
+    group_keys, group_index = np.unique(np.array(labels, dtype=str), return_inverse=True)
+    bins = np.array([row[2] for row in rows])
+    counts = np.zeros((len(group_keys), width))
+    totals = np.zeros((len(group_keys), width))
+    np.add.at(counts, (group_index, bins), [row[3] for row in rows])
+    np.add.at(totals, (group_index, bins), [row[4] for row in rows])
+
+    n = counts.sum(axis=1)
+    means = np.divide(totals.sum(axis=1), n, out=np.full(len(n), np.nan), where=n > 0)
+
+    # Percentiles: find the bin where the cumulative count crosses q% of n,
+    # then interpolate between its edges (or use the bin mean if it's open-ended)
+    q = np.asarray(percentiles, dtype=float) / 100
+    cumulative = counts.cumsum(axis=1)
+    target = n[:, None] * q[None, :]
+    bin_of = (cumulative[:, None, :] >= target[:, :, None]).argmax(axis=2)
+    rows_index = np.arange(len(group_keys))[:, None]
+    in_bin = counts[rows_index, bin_of]
+    before = cumulative[rows_index, bin_of] - in_bin
+    fraction = np.divide(target - before, in_bin, out=np.zeros_like(target), where=in_bin > 0)
+    bounded = np.concatenate([[np.nan], edges.astype(float), [np.nan]])
+    lower, upper = bounded[bin_of], bounded[bin_of + 1]
+    bin_mean = np.divide(totals[rows_index, bin_of], in_bin, out=np.full_like(target, np.nan), where=in_bin > 0)
+    values = np.where(np.isnan(lower) | np.isnan(upper), bin_mean, lower + fraction * (upper - lower))
+
+    groups = []
+    for g, key in enumerate(group_keys):
+        if n[g] <= 0:
+            continue
+        group = {"key": str(key), "count": int(n[g])}
+        if metric != "results":
+            occupied = np.flatnonzero(counts[g])
+            group["mean"] = float(means[g])
+            group["percentiles"] = {f"p{p:g}": float(v) for p, v in zip(percentiles, values[g])}
+            group["histogram"] = [
+                {"lower": None if np.isnan(bounded[b]) else float(bounded[b]),
+                 "upper": None if np.isnan(bounded[b + 1]) else float(bounded[b + 1]),
+                 "count": int(counts[g, b])}
+                for b in occupied
+            ]
+        groups.append(group)
+    return groups
+
+
+def stats_query(user_id, metric, since=None, until=None):
+    query = select(
+        PortfolioStat.quarter, PortfolioStat.rating_bucket, PortfolioStat.bin,
+        PortfolioStat.count, PortfolioStat.total,
+    ).where(
+        PortfolioStat.user_id == user_id,
+        PortfolioStat.metric == metric,
+        PortfolioStat.count != 0,
+    )
+    if since:
+        query = query.where(PortfolioStat.quarter >= since)
+    if until:
+        query = query.where(PortfolioStat.quarter <= until)
+    return query
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild the portfolio analytics histograms from analysis_results.")
+    parser.add_argument("--user", help="Only this user's stats")
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        rebuild(db, args.user)
+    finally:
+        db.close()
+    print("✓ Portfolio stats rebuilt")
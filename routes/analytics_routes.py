@@ -0,0 +1,42 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from auth import get_current_user
+from models.user import User
+from metrics import timed, DB_QUERY_SECONDS
+from typing import Optional
+import portfolio_stats
+
+router = APIRouter()
+
+QUARTER_PATTERN = r"^\d{4}Q[1-4]$"
+
+@router.get("/api/analytics/portfolio")
+async def portfolio_analytics(
+    metric: str = Query("ebitda_margin", pattern="^(" + "|".join(portfolio_stats.METRICS) + ")$"),
+    group_by: str = Query("rating", pattern="^(rating|quarter|none)$"),
+    since: Optional[str] = Query(None, pattern=QUARTER_PATTERN),
+    until: Optional[str] = Query(None, pattern=QUARTER_PATTERN),
+    percentiles: str = Query("10,25,50,75,90", pattern=r"^\d+(\.\d+)?(,\d+(\.\d+)?)*$"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Distribution of one metric over the user's results, by rating bucket or quarter screened.
+
+    e.g. ?metric=ebitda_margin&group_by=rating&since=2026Q4 is the median
+    (p50) EBITDA margin of this quarter's screens per rating. Quarters are
+    from the upload timestamp, ratings are bucketed 1-5 by their whole part.
+    Read from the materialized histograms in portfolio_stats, never from
+    analysis_results.
+    """
+    wanted = sorted({min(100.0, float(p)) for p in percentiles.split(",")})
+    query = portfolio_stats.stats_query(current_user.id, metric, since, until)
+    with timed(DB_QUERY_SECONDS, query="analytics"):
+        rows = (await db.execute(query)).all()
+    return {
+        "metric": metric,
+        "group_by": group_by,
+        "since": since,
+        "until": until,
+        "groups": portfolio_stats.summarize(rows, metric, group_by, wanted),
+    }
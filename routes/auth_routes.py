@@ -1,15 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
-from database import get_db
+from database import get_async_db
 from models.user import User  
 import auth
 import logging
 import os
 import requests
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -41,38 +41,38 @@ def is_real_email(email):
 
 # Register route
 @router.post("/register")
-def register(request: RegisterRequest, db: Session = Depends(get_db)):
-    print(f"Registration attempt for email: {request.email}")
+async def register(request: RegisterRequest, db: AsyncSession = Depends(get_async_db)):
+    logger.info(f"Registration attempt for email: {request.email}")
 
-    existing_user = db.query(User).filter(User.email == request.email).first()
-    print(f"Existing user found: {existing_user is not None}")
+    existing_user = await db.scalar(select(User).where(User.email == request.email))
 
     if existing_user:
-        print("Email already registered")
+        logger.info("Email already registered")
         raise HTTPException(status_code=400, detail="Email already registered")
 
     if not is_real_email(request.email):
-        print("Email is not real or deliverable")
+        logger.info("Email is not real or deliverable")
         raise HTTPException(status_code=400, detail="Please enter a real, deliverable email address.")
 
-    hashed_pw = auth.hash_password(request.password)
+    # bcrypt is deliberately slow; keep it off the event loop
+    hashed_pw = await run_in_threadpool(auth.hash_password, request.password)
     new_user = User(email=request.email, hashed_password=hashed_pw)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     return {"message": "User registered successfully"}
 
 # Login route
 @router.post("/login")
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     logger.info(f"Login attempt for email: {request.email}")
     
-    user = db.query(User).filter(User.email == request.email).first()
+    user = await db.scalar(select(User).where(User.email == request.email))
     if not user:
         logger.warning(f"User not found: {request.email}")
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    if not auth.verify_password(request.password, user.hashed_password):
+    if not await run_in_threadpool(auth.verify_password, request.password, user.hashed_password):
         logger.warning(f"Invalid password for user: {request.email}")
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
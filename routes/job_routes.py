@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from database import get_db
+from models.analysis_job import AnalysisJob
+from auth import get_current_user
+from models.user import User
+from jobs import job_to_dict
+from llm_governor import governor
+
+router = APIRouter()
+
+@router.get("/api/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    job = db.query(AnalysisJob).filter(
+        AnalysisJob.id == job_id,
+        AnalysisJob.user_id == current_user.id
+    ).first()
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job_to_dict(job)
+
+@router.get("/api/batches/{batch_id}")
+def get_batch(
+    batch_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    jobs = db.query(AnalysisJob).filter(
+        AnalysisJob.batch_id == batch_id,
+        AnalysisJob.user_id == current_user.id
+    ).order_by(AnalysisJob.created_at, AnalysisJob.id).all()
+
+    if not jobs:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    counts = {}
+    for job in jobs:
+        counts[job.state] = counts.get(job.state, 0) + 1
+    return {"batch_id": batch_id, "counts": counts, "jobs": [job_to_dict(job) for job in jobs]}
+
+@router.get("/api/llm/queue")
+async def get_llm_queue(current_user: User = Depends(get_current_user)):
+    """LLM governor state: calls waiting for rate-limit room, recent wait times, retries."""
+    return governor.stats()
@@ -1,99 +1,371 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer_group
+from database import get_async_db
 from models.analysis_result import AnalysisResult
 from auth import get_current_user
 from models.user import User
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from search_index import search_results
+import export
+import portfolio_stats
+from metrics import timed, DB_QUERY_SECONDS
+from datetime import datetime
+from typing import List, Literal, Optional
+import base64
+import hashlib
+import json
 
 router = APIRouter()
 
+# Columns a client can ask for with ?fields=; id and the sort column always come back (they form the cursor)
+RESULT_FIELDS = {
+    "id": AnalysisResult.id,
+    "filename": AnalysisResult.filename,
+    "preview_text": AnalysisResult.preview_text,
+    "summary_json": AnalysisResult.summary_json,
+    "timestamp": AnalysisResult.timestamp,
+    "user_rating": AnalysisResult.user_rating,
+    "confidence_score": AnalysisResult.confidence_score,
+    "company_name": AnalysisResult.company_name,
+    "revenue": AnalysisResult.revenue,
+    "ebitda": AnalysisResult.ebitda,
+    "ebitda_margin": AnalysisResult.ebitda_margin,
+    "fiscal_year": AnalysisResult.fiscal_year,
+    "thesis_count": AnalysisResult.thesis_count,
+    "red_flag_count": AnalysisResult.red_flag_count,
+    "ai_confidence": AnalysisResult.ai_confidence,
+    "confidence_company_info": AnalysisResult.confidence_company_info,
+    "confidence_financials": AnalysisResult.confidence_financials,
+    "confidence_thesis": AnalysisResult.confidence_thesis,
+    "confidence_red_flags": AnalysisResult.confidence_red_flags,
+    "confidence_summary": AnalysisResult.confidence_summary,
+    "previous_version_id": AnalysisResult.previous_version_id,
+}
+SORT_FIELDS = [
+    "timestamp", "company_name", "revenue", "ebitda", "ebitda_margin", "fiscal_year",
+    "user_rating", "confidence_score", "red_flag_count",
+]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BULK_IDS = 10000
+# Ids per statement; keeps well under SQLite's bound-parameter limit
+BULK_CHUNK_SIZE = 500
+
 class RatingUpdate(BaseModel):
     rating: float
 
 class ConfidenceUpdate(BaseModel):
     confidence: float
 
+class BulkOperation(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=MAX_BULK_IDS)
+    operation: Literal["delete", "rating", "confidence"]
+    value: Optional[float] = None
+
+def encode_cursor(sort, value, result_id):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([sort, value, result_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, result_id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_sort != sort:
+            raise ValueError("cursor was issued for a different sort")
+        if sort == "timestamp":
+            value = datetime.fromisoformat(value)
+        return value, int(result_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_fields(fields, sort="timestamp"):
+    if not fields:
+        return list(RESULT_FIELDS)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in RESULT_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    required = ["id", "timestamp"] + ([sort] if sort != "timestamp" else [])
+    return required + [name for name in requested if name not in required]
+
+async def result_filters(
+    company: Optional[str] = Query(None, max_length=200),
+    min_revenue: Optional[float] = None,
+    max_revenue: Optional[float] = None,
+    min_ebitda: Optional[float] = None,
+    max_ebitda: Optional[float] = None,
+    min_margin: Optional[float] = None,
+    max_margin: Optional[float] = None,
+    year: Optional[int] = None,
+    min_rating: Optional[float] = None,
+    max_red_flags: Optional[int] = None,
+):
+    """Filter query parameters shared by the results endpoints, as SQL conditions.
+
+    Revenue and EBITDA are in USD, margin in percent. Async only so FastAPI
+    doesn't send it to the threadpool.
+    """
+    conditions = []
+    if company:
+        escaped = company.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append(AnalysisResult.company_name.ilike(f"%{escaped}%", escape="\\"))
+    for column, low, high in [
+        (AnalysisResult.revenue, min_revenue, max_revenue),
+        (AnalysisResult.ebitda, min_ebitda, max_ebitda),
+        (AnalysisResult.ebitda_margin, min_margin, max_margin),
+    ]:
+        if low is not None:
+            conditions.append(column >= low)
+        if high is not None:
+            conditions.append(column <= high)
+    if year is not None:
+        conditions.append(AnalysisResult.fiscal_year == year)
+    if min_rating is not None:
+        conditions.append(AnalysisResult.user_rating >= min_rating)
+    if max_red_flags is not None:
+        conditions.append(AnalysisResult.red_flag_count <= max_red_flags)
+    return conditions
+
+def etag_response(request: Request, payload):
+    """Serialize `payload` with an ETag; answer 304 if the client already has it."""
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":"))
+    etag = 'W/"' + hashlib.sha1(body.encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def build_results_query(user_id, names, sort, order, cursor, filters):
+    """SELECT for one page of a user's results (limit not applied)."""
+    sort_column = RESULT_FIELDS[sort]
+    query = select(*[RESULT_FIELDS[name] for name in names]).where(
+        AnalysisResult.user_id == user_id,
+        *filters
+    )
+    if sort != "timestamp":
+        query = query.where(sort_column.isnot(None))
+    if cursor:
+        value, result_id = decode_cursor(cursor, sort)
+        if order == "desc":
+            after = or_(sort_column < value, and_(sort_column == value, AnalysisResult.id < result_id))
+        else:
+            after = or_(sort_column > value, and_(sort_column == value, AnalysisResult.id > result_id))
+        query = query.where(after)
+    if order == "desc":
+        return query.order_by(sort_column.desc(), AnalysisResult.id.desc())
+    return query.order_by(sort_column.asc(), AnalysisResult.id.asc())
+
+def page_response(request: Request, rows, names, sort, limit):
+    items = [dict(zip(names, row)) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(sort, last[sort], last["id"])
+    return etag_response(request, {"items": items, "next_cursor": next_cursor})
+
+async def get_owned_result(db: AsyncSession, result_id: int, user_id: str, *options):
+    with timed(DB_QUERY_SECONDS, query="get"):
+        result = await db.scalar(select(AnalysisResult).options(*options).where(
+            AnalysisResult.id == result_id,
+            AnalysisResult.user_id == user_id
+        ))
+    if not result:
+        raise HTTPException(status_code=404, detail="Result not found")
+    return result
+
 @router.get("/api/results")
-def get_user_results(
-    db: Session = Depends(get_db),
+async def get_user_results(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    sort: str = Query("timestamp", pattern="^(" + "|".join(SORT_FIELDS) + ")$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    filters: list = Depends(result_filters),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Page of the user's results, keyset-paginated on (sort column, id).
+
+    Defaults to newest first. Pass the returned `next_cursor` back as
+    `cursor` for the next page, and `fields=` to skip heavy columns such as
+    preview_text and summary_json. Sorting by anything but timestamp only
+    returns rows that have a value for that column.
+    """
+    names = parse_fields(fields, sort)
+    query = build_results_query(current_user.id, names, sort, order, cursor, filters)
+    with timed(DB_QUERY_SECONDS, query="list"):
+        rows = (await db.execute(query.limit(limit + 1))).all()
+    return page_response(request, rows, names, sort, limit)
+
+# Declared before /api/results/{result_id} so "search" isn't taken as an id
+@router.get("/api/results/search")
+async def search_user_results(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    results = db.query(AnalysisResult).filter(AnalysisResult.user_id == current_user.id).order_by(AnalysisResult.timestamp.desc()).all()
-    return [
-        {
-            "id": result.id,
-            "filename": result.filename,
-            "preview_text": result.preview_text,
-            "summary_json": result.summary_json,
-            "timestamp": result.timestamp,
-            "user_rating": result.user_rating,
-            "confidence_score": result.confidence_score
-        }
-        for result in results
-    ]
+    """Full-text search over the user's analyses, best matches first, with highlighted snippets."""
+    with timed(DB_QUERY_SECONDS, query="search"):
+        items, has_more = await db.run_sync(search_results, current_user.id, q, limit, offset)
+    return {
+        "items": items,
+        "next_offset": offset + limit if has_more else None,
+    }
+
+@router.get("/api/results/export")
+async def export_user_results(
+    format: str = Query("csv", pattern="^(" + "|".join(export.FORMATS) + ")$"),
+    filters: list = Depends(result_filters),
+    current_user: User = Depends(get_current_user)
+):
+    """Every result matching the list endpoint's filters, newest first, as a streamed file.
+
+    summary_json is flattened into `summary.*` columns; preview_text is left out.
+    """
+    if format == "parquet" and export.pa is None:
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow installed on the server")
+    names = [name for name in RESULT_FIELDS if name != "preview_text"]
+    query = build_results_query(current_user.id, names, "timestamp", "desc", None, filters)
+    media_type, extension = export.FORMATS[format]
+    return StreamingResponse(
+        export.stream_export(query, names, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="cim-analyses.{extension}"'},
+    )
+
+@router.post("/api/results/bulk")
+async def bulk_update_results(
+    bulk: BulkOperation,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Delete, rate or set the confidence of many results in one request.
+
+    Runs as set-based `... WHERE id IN (...) AND user_id = ...` statements
+    (BULK_CHUNK_SIZE ids each) in a single transaction. Every requested id
+    gets an outcome: "ok", or "not_found" if it doesn't exist or belongs to
+    someone else. The portfolio analytics histograms are updated in the
+    same transaction.
+    """
+    if bulk.operation == "delete":
+        statement = delete(AnalysisResult)
+    elif bulk.value is None:
+        raise HTTPException(status_code=400, detail=f"'value' is required for {bulk.operation}")
+    elif bulk.operation == "rating":
+        if not 1 <= bulk.value <= 5:
+            raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
+        statement = update(AnalysisResult).values(user_rating=bulk.value)
+    else:
+        if not 0 <= bulk.value <= 1:
+            raise HTTPException(status_code=400, detail="Confidence must be between 0 and 1")
+        statement = update(AnalysisResult).values(confidence_score=bulk.value)
+
+    ids = list(dict.fromkeys(bulk.ids))
+    # RETURNING gives the rows' analytics facts as they are after the statement
+    returning = [AnalysisResult.id] + portfolio_stats.FACT_COLUMNS
+    owned = AnalysisResult.user_id == current_user.id
+    statement = statement.where(owned).returning(*returning)
+    applied, removed, added = set(), [], []
+    with timed(DB_QUERY_SECONDS, query=f"bulk_{bulk.operation}"):
+        for start in range(0, len(ids), BULK_CHUNK_SIZE):
+            chunk = ids[start:start + BULK_CHUNK_SIZE]
+            if bulk.operation != "delete":
+                before = {row[0]: tuple(row[1:]) for row in await db.execute(
+                    select(*returning).where(owned, AnalysisResult.id.in_(chunk))
+                )}
+            rows = await db.execute(
+                statement.where(AnalysisResult.id.in_(chunk)),
+                execution_options={"synchronize_session": False},
+            )
+            for row in rows:
+                applied.add(row[0])
+                if bulk.operation == "delete":
+                    removed.append(tuple(row[1:]))
+                elif row[0] in before:
+                    removed.append(before[row[0]])
+                    added.append(tuple(row[1:]))
+        await db.run_sync(portfolio_stats.apply_changes, removed, added)
+        await db.commit()
+
+    return {
+        "operation": bulk.operation,
+        "requested": len(ids),
+        "succeeded": len(applied),
+        "results": [{"id": result_id, "status": "ok" if result_id in applied else "not_found"}
+                    for result_id in ids],
+    }
+
+@router.get("/api/results/{result_id}")
+async def get_result(
+    result_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    result = await get_owned_result(db, result_id, current_user.id, undefer_group("text"))
+    return etag_response(request, {name: getattr(result, name) for name in RESULT_FIELDS})
 
 @router.put("/api/results/{result_id}/rating")
-def update_rating(
+async def update_rating(
     result_id: int,
     rating_update: RatingUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    result = db.query(AnalysisResult).filter(
-        AnalysisResult.id == result_id,
-        AnalysisResult.user_id == current_user.id
-    ).first()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="Result not found")
-    
+    result = await get_owned_result(db, result_id, current_user.id)
+
     if not 1 <= rating_update.rating <= 5:
         raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
     
+    old_facts = portfolio_stats.facts(result)
     result.user_rating = rating_update.rating
-    db.commit()
+    await db.run_sync(portfolio_stats.apply_changes, [old_facts], [portfolio_stats.facts(result)])
+    with timed(DB_QUERY_SECONDS, query="update_rating"):
+        await db.commit()
     
     return {"message": "Rating updated successfully", "rating": result.user_rating}
 
 @router.put("/api/results/{result_id}/confidence")
-def update_confidence(
+async def update_confidence(
     result_id: int,
     confidence_update: ConfidenceUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    result = db.query(AnalysisResult).filter(
-        AnalysisResult.id == result_id,
-        AnalysisResult.user_id == current_user.id
-    ).first()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="Result not found")
-    
+    result = await get_owned_result(db, result_id, current_user.id)
+
     if not 0 <= confidence_update.confidence <= 1:
         raise HTTPException(status_code=400, detail="Confidence must be between 0 and 1")
     
+    old_facts = portfolio_stats.facts(result)
     result.confidence_score = confidence_update.confidence
-    db.commit()
+    await db.run_sync(portfolio_stats.apply_changes, [old_facts], [portfolio_stats.facts(result)])
+    with timed(DB_QUERY_SECONDS, query="update_confidence"):
+        await db.commit()
     
     return {"message": "Confidence updated successfully", "confidence": result.confidence_score}
 
 @router.delete("/api/results/{result_id}")
-def delete_result(
+async def delete_result(
     result_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    result = db.query(AnalysisResult).filter(
-        AnalysisResult.id == result_id,
-        AnalysisResult.user_id == current_user.id
-    ).first()
-    
-    if not result:
-        raise HTTPException(status_code=404, detail="Result not found")
-    
-    db.delete(result)
-    db.commit()
+    result = await get_owned_result(db, result_id, current_user.id)
+
+    await db.run_sync(portfolio_stats.apply_changes, [portfolio_stats.facts(result)])
+    await db.delete(result)
+    with timed(DB_QUERY_SECONDS, query="delete"):
+        await db.commit()
     
     return {"message": "Result deleted successfully"}
@@ -0,0 +1,159 @@
+"""
+Server-side full-text search over analyses.
+
+On SQLite this is an FTS5 table, `analysis_results_fts`, keyed by the
+analysis_results rowid. It indexes filename, preview_text and the THESIS,
+RED FLAGS and SUMMARY text pulled out of summary_json, plus an `owner`
+token per user, so a search only walks the hits of the user it's for. Rows
+are indexed from Python with their plain text when they're created
+(`index_result`), so nothing in SQL has to decompress them (see
+compression.py) and any connection can write the table; a trigger drops a
+deleted row's entry. On Postgres the same five fields feed a weighted
+`tsvector` expression with a GIN index, so `search_results` has one
+interface on both backends. The table, its trigger and the GIN index come
+from alembic revision 0008.
+"""
+
+import hashlib
+import json
+import re
+
+from sqlalchemy import select, text
+
+from models.analysis_result import AnalysisResult
+
+FTS_TABLE = "analysis_results_fts"
+
+# Column weights for ranking: filename, preview, thesis, red flags, summary, owner
+BM25_WEIGHTS = (2.0, 1.0, 1.5, 1.5, 1.0, 0.0)
+TEXT_COLUMNS = "filename preview_text thesis red_flags summary"
+FTS_COLUMNS = "rowid, filename, preview_text, thesis, red_flags, summary, owner"
+INDEX_BATCH_SIZE = 500
+
+_INSERT = text(f"INSERT INTO {FTS_TABLE}({FTS_COLUMNS}) VALUES "
+               f"(:rowid, :filename, :preview_text, :thesis, :red_flags, :summary, :owner)")
+
+
+def owner_token(user_id):
+    """The one token a user's rows are indexed under; hex, so the tokenizer keeps it whole."""
+    return "u" + hashlib.sha256(str(user_id).encode()).hexdigest()[:32]
+
+
+def _json_text(summary, key):
+    value = summary.get(key) if isinstance(summary, dict) else None
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def _document(result_id, filename, preview_text, summary_json, user_id):
+    try:
+        summary = json.loads(summary_json) if summary_json else None
+    except ValueError:
+        summary = None  # Malformed LLM output indexes as empty text
+    return {
+        "rowid": result_id,
+        "filename": filename,
+        "preview_text": preview_text,
+        "thesis": _json_text(summary, "THESIS"),
+        "red_flags": _json_text(summary, "RED FLAGS"),
+        "summary": _json_text(summary, "SUMMARY"),
+        "owner": owner_token(user_id),
+    }
+
+
+def index_result(db, result):
+    """Index a new AnalysisResult (flushed, so it has its id) in the caller's transaction.
+
+    Results are only ever created and deleted, never rewritten; code that
+    changes their text or owner has to call this again.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :id"), {"id": result.id})
+    db.execute(_INSERT, _document(result.id, result.filename, result.preview_text,
+                                  result.summary_json, result.user_id))
+
+
+def index_missing_results(conn):
+    """Index rows that weren't written through index_result (bulk inserts, rows older than the index).
+
+    Runs in `conn`'s transaction and returns how many were added. Values are
+    read through the model's columns, so compressed ones come back as plain
+    text.
+    """
+    if conn.dialect.name != "sqlite":
+        return 0
+    table = AnalysisResult.__table__
+    indexed = 0
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.filename, table.c.preview_text, table.c.summary_json, table.c.user_id)
+            .where(text(f"analysis_results.id NOT IN (SELECT rowid FROM {FTS_TABLE})"))
+            .limit(INDEX_BATCH_SIZE)
+        ).all()
+        if rows:
+            conn.execute(_INSERT, [_document(*row) for row in rows])
+        indexed += len(rows)
+        if len(rows) < INDEX_BATCH_SIZE:
+            return indexed
+
+
+# Postgres equivalent of the five FTS columns, weighted A-D like the bm25 weights
+POSTGRES_DOCUMENT = """(
+    setweight(to_tsvector('english', coalesce(filename, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(cim_json_text(summary_json, 'THESIS'), '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(cim_json_text(summary_json, 'RED FLAGS'), '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(cim_json_text(summary_json, 'SUMMARY'), '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(preview_text, '')), 'D')
+)"""
+
+
+def to_match_query(q):
+    """Turn free text into a safe FTS5 query: every word must match, the last as a prefix."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_results(db, user_id, q, limit=20, offset=0):
+    """Ranked search over one user's analyses. Returns (rows, has_more).
+
+    Each row has id, filename, timestamp, company_name, rank and a
+    highlighted `snippet`.
+    """
+    if db.bind.dialect.name == "postgresql":
+        rows = db.execute(text(f"""
+            SELECT r.id, r.filename, r.timestamp, r.company_name,
+                   ts_rank_cd({POSTGRES_DOCUMENT}, query) AS rank,
+                   ts_headline('english',
+                       coalesce(cim_json_text(r.summary_json, 'SUMMARY'), '') || ' ' || coalesce(r.preview_text, ''),
+                       query, 'StartSel=<mark>, StopSel=</mark>, MaxFragments=2') AS snippet
+            FROM analysis_results r, websearch_to_tsquery('english', :q) query
+            WHERE r.user_id = :user_id AND {POSTGRES_DOCUMENT} @@ query
+            ORDER BY rank DESC, r.id DESC
+            LIMIT :limit OFFSET :offset
+        """), {"q": q, "user_id": user_id, "limit": limit + 1, "offset": offset}).mappings().all()
+    else:
+        match = to_match_query(q)
+        if not match:
+            return [], False
+        # Only the user's own rows are walked; their words are only looked for in the text columns
+        match = f'owner : "{owner_token(user_id)}" AND {{{TEXT_COLUMNS}}} : ({match})'
+        weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+        rows = db.execute(text(f"""
+            SELECT r.id, r.filename, r.timestamp, r.company_name,
+                   bm25({FTS_TABLE}, {weights}) AS rank,
+                   snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', 16) AS snippet
+            FROM {FTS_TABLE}
+            JOIN analysis_results r ON r.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH :match AND r.user_id = :user_id
+            ORDER BY rank, r.id DESC
+            LIMIT :limit OFFSET :offset
+        """), {"match": match, "user_id": user_id, "limit": limit + 1, "offset": offset}).mappings().all()
+
+    rows = [dict(row) for row in rows]
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,146 @@
+"""
+Parse the LLM's JSON analysis into typed values once, at write time.
+
+`extract_fields` turns a `summary_json` string into the column values stored
+on AnalysisResult (company name, revenue, EBITDA, margin, year, section
+confidences and list counts), so the API can filter and sort in SQL instead
+of re-parsing every blob.
+"""
+
+import json
+import re
+
+# Bump when parsing rules change; the backfill re-processes rows below this version
+SUMMARY_PARSER_VERSION = 1
+
+SECTION_CONFIDENCE_COLUMNS = {
+    "COMPANY INFO": "confidence_company_info",
+    "FINANCIALS": "confidence_financials",
+    "THESIS": "confidence_thesis",
+    "RED FLAGS": "confidence_red_flags",
+    "SUMMARY": "confidence_summary",
+}
+
+_NUMBER = re.compile(r"(\(?-?)\s*\$?\s*(\d[\d,]*(?:\.\d+)?)\s*(%|[a-zA-Z]+)?")
+_SCALES = {
+    "k": 1e3, "thousand": 1e3,
+    "m": 1e6, "mm": 1e6, "mn": 1e6, "mil": 1e6, "million": 1e6, "millions": 1e6,
+    "b": 1e9, "bn": 1e9, "billion": 1e9, "billions": 1e9,
+}
+_YEAR = re.compile(r"(?<!\d)(19\d{2}|20\d{2})(?!\d)")
+
+
+def _first_number(value):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value), None
+    match = _NUMBER.search(str(value))
+    if not match:
+        return None
+    sign, digits, unit = match.groups()
+    number = float(digits.replace(",", ""))
+    if "-" in sign or "(" in sign:
+        number = -number
+    return number, (unit or "").lower()
+
+
+def parse_money(value):
+    """'$12.5M' -> 12500000.0, '1.2 billion' -> 1.2e9. Returns None if there's no number."""
+    parsed = _first_number(value)
+    if not parsed:
+        return None
+    number, unit = parsed
+    return number * _SCALES.get(unit, 1.0)
+
+
+def parse_percent(value):
+    """'24%' or '24.5 percent' -> 24.0 / 24.5; a bare fraction like 0.24 -> 24.0."""
+    parsed = _first_number(value)
+    if not parsed:
+        return None
+    number, unit = parsed
+    if unit != "%" and -1 < number < 1 and number != 0:
+        number *= 100
+    return number
+
+
+def parse_year(value):
+    match = _YEAR.search(str(value or ""))
+    return int(match.group(1)) if match else None
+
+
+def parse_confidence(value):
+    """Normalize a 0-1 or 0-100 confidence to 0-1."""
+    parsed = _first_number(value)
+    if not parsed:
+        return None
+    number, _ = parsed
+    if number > 1:
+        number /= 100
+    return max(0.0, min(1.0, number))
+
+
+def _as_list(value):
+    if isinstance(value, list):
+        return [item for item in value if item not in ("", None)]
+    if isinstance(value, str) and value.strip() and value.strip().lower() != "unknown":
+        return [value]
+    return []
+
+
+def load_summary(summary_json):
+    try:
+        summary = json.loads(summary_json) if isinstance(summary_json, str) else summary_json
+    except (TypeError, ValueError):
+        return None
+    return summary if isinstance(summary, dict) else None
+
+
+def extract_fields(summary_json):
+    """Return a dict of AnalysisResult column values parsed from the LLM output.
+
+    Unparseable output yields all-None values (with the parser version set),
+    so the row is still marked as processed.
+    """
+    fields = {
+        "company_name": None,
+        "revenue": None,
+        "ebitda": None,
+        "ebitda_margin": None,
+        "fiscal_year": None,
+        "thesis_count": None,
+        "red_flag_count": None,
+        "ai_confidence": None,
+        "summary_version": SUMMARY_PARSER_VERSION,
+    }
+    fields.update({column: None for column in SECTION_CONFIDENCE_COLUMNS.values()})
+
+    summary = load_summary(summary_json)
+    if summary is None:
+        return fields
+
+    company = summary.get("COMPANY INFO") or {}
+    financials = summary.get("FINANCIALS") or {}
+    actuals = (financials.get("Actuals") or {}) if isinstance(financials, dict) else {}
+    breakdown = summary.get("confidence_breakdown") or {}
+
+    name = str(company.get("Name") or "").strip() if isinstance(company, dict) else ""
+    if name and name.lower() != "unknown":
+        fields["company_name"] = name[:200]
+
+    if isinstance(actuals, dict):
+        fields["revenue"] = parse_money(actuals.get("revenue"))
+        fields["ebitda"] = parse_money(actuals.get("EBITDA"))
+        fields["ebitda_margin"] = parse_percent(actuals.get("margin"))
+        fields["fiscal_year"] = parse_year(actuals.get("year"))
+    if fields["ebitda_margin"] is None and fields["revenue"] and fields["ebitda"] is not None:
+        fields["ebitda_margin"] = round(fields["ebitda"] / fields["revenue"] * 100, 2)
+
+    fields["thesis_count"] = len(_as_list(summary.get("THESIS")))
+    fields["red_flag_count"] = len(_as_list(summary.get("RED FLAGS")))
+    fields["ai_confidence"] = parse_confidence(summary.get("confidence_score"))
+    if isinstance(breakdown, dict):
+        for section, column in SECTION_CONFIDENCE_COLUMNS.items():
+            fields[column] = parse_confidence(breakdown.get(section))
+    return fields
@@ -0,0 +1,96 @@
+"""
+Shared setup: a throwaway SQLite database migrated to head, the fake LLM,
+and S3 on a local moto server (started by the `s3` fixture).
+
+    pip install pytest "moto[server]"
+    python -m pytest
+"""
+
+import os
+import socket
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+TEMP_DIR = tempfile.mkdtemp(prefix="cim-tests-")
+S3_PORT = free_port()
+BUCKET = "cim-tests"
+# Anything that isn't a Clerk or HS256 token authenticates as the development user
+USER_HEADERS = {"Authorization": "Bearer test"}
+DEV_USER = "test_user_123"
+
+# Must happen before the app (and database.py / analysis.py / ingest.py) is imported
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{Path(TEMP_DIR) / 'test.db'}",
+    "JOBS_DIR": str(Path(TEMP_DIR) / "jobs"),
+    "JOB_WORKERS": "0",
+    "LLM_PROVIDER": "fake",
+    "LLM_FAKE_PROFILE": "instant",
+    "LLM_RPM": "1000000",
+    "LLM_TPM": "1000000000",
+    "CLERK_JWKS_URL": "http://jwks.invalid/.well-known/jwks.json",
+    "S3_ENDPOINT_URL": f"http://127.0.0.1:{S3_PORT}",
+    "S3_BUCKET_NAME": BUCKET,
+    "AWS_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "LOG_LEVEL": "WARNING",
+})
+
+from migrate_database import upgrade_database  # noqa: E402
+
+upgrade_database()  # The app doesn't create its own schema
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def empty_tables():
+    """Every test starts from the migrated but empty schema."""
+    yield
+    from database import Base, engine
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table.name != "compression_dictionaries":
+                conn.execute(table.delete())
+
+
+@pytest.fixture
+def db():
+    from database import SessionLocal
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+async def client():
+    """The app in-process; its aiosqlite connections belong to this test's event loop."""
+    import main
+    from database import async_engine
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as api:
+        yield api
+    await async_engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def s3():
+    from moto.server import ThreadedMotoServer
+    import analysis
+    server = ThreadedMotoServer(port=S3_PORT, verbose=False)
+    server.start()
+    analysis.s3_client.create_bucket(Bucket=BUCKET)
+    yield analysis.s3_client
+    server.stop()
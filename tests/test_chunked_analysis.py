@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+import analysis
+from benchmarks.synthetic_pdf import make_page_texts
+from llm_providers import FakeLLMProvider
+
+
+def without_whitespace(texts):
+    # A run-on paragraph is cut on token boundaries, which can fall inside a word
+    return "".join("".join(text.split()) for text in texts)
+
+
+def test_oversized_pages_are_split_not_truncated():
+    run_on = " ".join(f"word{i}" for i in range(3000))  # One paragraph, no sentence breaks
+    pages = ["Short cover page.", run_on, "\n".join(f"Sentence {i} of a long page." for i in range(400))]
+
+    chunks = analysis.chunk_pages(pages, max_tokens=500)
+
+    assert all(analysis.estimate_tokens(chunk) <= 500 for chunk in chunks)
+    assert without_whitespace(chunks) == without_whitespace(pages)
+
+
+@pytest.mark.anyio
+async def test_map_reduce_calls_the_llm_once_per_chunk_plus_the_merge(monkeypatch):
+    provider = FakeLLMProvider(profile="instant")
+    monkeypatch.setattr(analysis, "provider", provider)
+    pages = make_page_texts(30)
+    chunks = analysis.chunk_pages(pages)
+    assert len(chunks) > 1
+
+    timings = {}
+    summary = json.loads(await analysis.run_chunked_analysis(pages, timings))
+
+    assert provider.calls == len(chunks) + 1
+    assert set(json.loads(analysis.ANALYSIS_SCHEMA)) <= set(summary)
+    assert {"llm_map", "llm_reduce"} <= set(timings)
@@ -0,0 +1,73 @@
+import httpx
+import pytest
+
+import jobs
+from benchmarks.synthetic_pdf import make_cim_pdf
+from conftest import BUCKET, DEV_USER, USER_HEADERS
+from ingest import MAX_UPLOAD_BYTES
+from models.analysis_job import AnalysisJob
+from models.analysis_result import AnalysisResult
+
+pytestmark = pytest.mark.anyio
+
+
+async def presign_and_store(client, name, body, content_type="application/pdf"):
+    response = await client.post("/api/upload/presign", json={"filename": name, "size": len(body)},
+                                 headers=USER_HEADERS)
+    assert response.status_code == 200, response.text
+    grant = response.json()
+    # Straight to the bucket, like the browser does
+    async with httpx.AsyncClient() as s3_client:
+        stored = await s3_client.post(grant["url"], data=grant["fields"], files={"file": (name, body, content_type)})
+    assert stored.status_code < 300, stored.text
+    return grant
+
+
+def object_keys(s3):
+    return [item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET).get("Contents", [])]
+
+
+async def test_presign_finalize_and_analyze(client, db, s3):
+    grant = await presign_and_store(client, "Project Falcon.pdf", make_cim_pdf(pages=3, seed=11))
+    assert grant["max_bytes"] == MAX_UPLOAD_BYTES
+
+    response = await client.post(grant["finalize_url"], headers=USER_HEADERS)
+    assert response.status_code == 202, response.text
+    queued = response.json()
+    assert (queued["state"], queued["filename"]) == ("queued", "Project Falcon.pdf")
+    # Finalizing twice (a client retry) doesn't queue a second job
+    again = await client.post(grant["finalize_url"], headers=USER_HEADERS)
+    assert again.json()["job_id"] == queued["job_id"]
+
+    assert jobs.claim_next_job("worker") == queued["job_id"]
+    await jobs.process_job(queued["job_id"], "worker")
+
+    job = db.get(AnalysisJob, queued["job_id"])
+    assert job.state == "succeeded", job.error
+    result = db.get(AnalysisResult, job.result_id)
+    assert (result.user_id, result.filename) == (DEV_USER, "Project Falcon.pdf")
+    # The worker moved the upload to its content-addressed key
+    assert object_keys(s3) == [f"cims/{result.content_hash}.pdf"]
+
+
+async def test_finalize_rejects_and_deletes_a_non_pdf(client, s3):
+    grant = await presign_and_store(client, "notes.pdf", b"just some text, not a PDF")
+
+    response = await client.post(grant["finalize_url"], headers=USER_HEADERS)
+
+    assert response.status_code == 400
+    assert grant["fields"]["key"] not in object_keys(s3)
+
+
+async def test_finalize_without_an_upload(client, s3):
+    response = await client.post(f"/api/upload/{'0' * 32}/finalize", headers=USER_HEADERS)
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("request_body, status", [
+    ({"filename": "deck.docx"}, 400),
+    ({"filename": "deck.pdf", "size": MAX_UPLOAD_BYTES + 1}, 413),
+])
+async def test_presign_refuses_up_front(client, request_body, status):
+    response = await client.post("/api/upload/presign", json=request_body, headers=USER_HEADERS)
+    assert response.status_code == status
@@ -0,0 +1,91 @@
+import asyncio
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+import jobs
+from models.analysis_job import AnalysisJob
+
+
+def queue_job(db, tmp_path, user_id, name="cim.pdf"):
+    pdf = b"%PDF-1.4 " + f"{user_id}/{name}/{tmp_path}".encode()
+    spool_path = tmp_path / f"{user_id}-{name}"
+    spool_path.write_bytes(pdf)
+    return jobs.enqueue_job(db, user_id, name, "application/pdf", spool_path, hashlib.sha256(pdf).hexdigest()).id
+
+
+def job_row(db, job_id):
+    db.expire_all()
+    return db.get(AnalysisJob, job_id)
+
+
+def test_each_job_is_claimed_by_exactly_one_worker(db, tmp_path):
+    job_ids = {queue_job(db, tmp_path, f"user{i}") for i in range(8)}
+    claims = []
+    start = threading.Barrier(4)
+
+    def worker(worker_id):
+        start.wait()
+        while (job_id := jobs.claim_next_job(worker_id)) is not None:
+            claims.append((job_id, worker_id))
+
+    threads = [threading.Thread(target=worker, args=(f"worker-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(job_id for job_id, _ in claims) == sorted(job_ids)
+    for job_id, worker_id in claims:
+        job = job_row(db, job_id)
+        assert (job.state, job.locked_by, job.attempts) == ("running", worker_id, 1)
+
+
+def test_claims_skip_users_at_their_cap(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_PER_USER", 2)
+    batch = [queue_job(db, tmp_path, "batch", f"{i}.pdf") for i in range(3)]
+    other = queue_job(db, tmp_path, "analyst")
+
+    claimed = [jobs.claim_next_job("worker") for _ in range(4)]
+
+    assert claimed == [batch[0], batch[1], other, None]
+
+
+def test_expired_lease_is_reclaimed_and_the_old_worker_locked_out(db, tmp_path):
+    job_id = queue_job(db, tmp_path, "analyst")
+    assert jobs.claim_next_job("worker-1") == job_id
+    assert jobs.claim_next_job("worker-2") is None  # Leased
+
+    job = job_row(db, job_id)
+    job.locked_at = datetime.utcnow() - timedelta(seconds=jobs.JOB_LEASE_SECONDS + 1)
+    db.commit()
+
+    assert jobs.claim_next_job("worker-2") == job_id
+    assert job_row(db, job_id).attempts == 2
+    assert not jobs._update_job(job_id, "worker-1")
+    assert jobs._update_job(job_id, "worker-2")
+
+
+@pytest.mark.anyio
+async def test_heartbeat_renews_the_lease_and_abandons_a_stolen_job(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.05)
+    job_id = queue_job(db, tmp_path, "analyst")
+    assert jobs.claim_next_job("worker-1") == job_id
+    renewed_from = job_row(db, job_id).locked_at
+
+    work = asyncio.create_task(asyncio.sleep(10))
+    heartbeat = asyncio.create_task(jobs._keep_lease(job_id, "worker-1", work))
+    await asyncio.sleep(0.2)
+    assert job_row(db, job_id).locked_at > renewed_from
+    assert not work.done()
+
+    job = job_row(db, job_id)
+    job.locked_by = "worker-2"
+    db.commit()
+
+    assert await asyncio.wait_for(heartbeat, 2) is True
+    with pytest.raises(asyncio.CancelledError):
+        await work
+    assert job_row(db, job_id).locked_by == "worker-2"
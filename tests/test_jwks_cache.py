@@ -0,0 +1,157 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+import auth
+from jwks_cache import JWKSCache
+
+
+class SigningKey:
+    def __init__(self, kid):
+        self.kid = kid
+        private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.pem = private.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                         serialization.NoEncryption())
+        public_pem = private.public_key().public_bytes(serialization.Encoding.PEM,
+                                                       serialization.PublicFormat.SubjectPublicKeyInfo)
+        self.public_jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": kid, "use": "sig"}
+
+    def token(self, sub="user_clerk"):
+        claims = {"sub": sub, "iss": auth.CLERK_ISSUER, "aud": auth.CLERK_ISSUER, "exp": int(time.time()) + 300}
+        return jwt.encode(claims, self.pem, algorithm="RS256", headers={"kid": self.kid})
+
+
+class JWKSServer:
+    """A local JWKS endpoint whose key set can be rotated, broken or slowed down."""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.status = 200
+        self.delay = 0.0
+        self.hits = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits += 1
+                time.sleep(server.delay)
+                body = json.dumps({"keys": [key.public_jwk for key in server.keys]}).encode()
+                self.send_response(server.status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(body if server.status == 200 else b"{}")
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/.well-known/jwks.json"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return SigningKey("key-1"), SigningKey("key-2")
+
+
+@pytest.fixture
+def jwks(keys):
+    server = JWKSServer([keys[0]])
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def use_cache(monkeypatch):
+    """Point auth at a cache of our own, with no verified tokens remembered."""
+    def install(cache):
+        monkeypatch.setattr(auth, "jwks_cache", cache)
+        auth.verified_tokens.clear()
+        return cache
+    yield install
+    auth.verified_tokens.clear()
+
+
+def test_rotated_signing_key_is_picked_up_with_one_refetch(jwks, keys, use_cache):
+    use_cache(JWKSCache(jwks.url, min_refetch_interval=0))
+    old, new = keys
+    assert auth.verify_clerk_token(old.token())["sub"] == "user_clerk"
+    assert jwks.hits == 1
+
+    jwks.keys = [new]
+    assert auth.verify_clerk_token(new.token())["sub"] == "user_clerk"
+    assert jwks.hits == 2
+    # Both kids are now known from memory
+    assert auth.verify_clerk_token(new.token("someone")) and jwks.hits == 2
+
+
+def test_unknown_kid_refetches_at_most_once_per_interval(jwks, keys, use_cache):
+    cache = use_cache(JWKSCache(jwks.url, min_refetch_interval=0.5))
+    assert cache.get_key("key-1")
+    time.sleep(0.6)
+
+    for _ in range(5):
+        assert auth.verify_clerk_token(keys[1].token()) is None
+    assert jwks.hits == 2  # The first fetch, then one refetch for the unknown kid
+
+
+def test_expired_keys_are_served_stale_while_the_endpoint_is_down(jwks, use_cache):
+    cache = use_cache(JWKSCache(jwks.url, ttl=0.2, refresh_ahead=0, min_refetch_interval=0))
+    first = cache.get_key("key-1")
+    jwks.status = 503
+    time.sleep(0.25)
+
+    assert cache.get_key("key-1") == first
+    assert jwks.hits == 2
+
+    jwks.status = 200
+    assert cache.get_key("key-1") == first
+    assert jwks.hits == 3
+    assert not cache.needs_fetch("key-1")
+
+
+def test_concurrent_expiry_refresh_is_single_flight(jwks, use_cache):
+    cache = use_cache(JWKSCache(jwks.url, ttl=0.2, refresh_ahead=0, min_refetch_interval=0))
+    cache.get_key("key-1")
+    time.sleep(0.25)
+    jwks.delay = 0.3
+    start = threading.Barrier(8)
+    found = []
+
+    def lookup():
+        start.wait()
+        found.append(cache.get_key("key-1"))
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(found) == 8 and all(found)
+    assert jwks.hits == 2
+
+
+def test_refresh_ahead_happens_in_the_background(jwks, use_cache):
+    cache = use_cache(JWKSCache(jwks.url, ttl=2, refresh_ahead=1.9, min_refetch_interval=0))
+    cache.get_key("key-1")
+    time.sleep(0.15)
+    jwks.delay = 0.3
+
+    started = time.monotonic()
+    assert cache.get_key("key-1")
+    assert time.monotonic() - started < 0.1  # Served from memory while the refresh runs
+    deadline = time.monotonic() + 2
+    while jwks.hits < 2 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert jwks.hits == 2
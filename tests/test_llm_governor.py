@@ -0,0 +1,123 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import openai
+import pytest
+
+from llm_governor import LLMGovernor, retry_after_seconds
+from llm_providers import FakeLLMProvider
+
+pytestmark = pytest.mark.anyio
+
+MESSAGES = [{"role": "user", "content": "Analyze this CIM."}]
+
+
+def rate_limit_error(headers):
+    request = httpx.Request("POST", "http://fake-llm/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("Rate limited", response=response, body=None)
+
+
+async def grant_order(governor, calls):
+    """Queue (user, tokens, name) calls at once; returns the names in the order they were let through."""
+    order = []
+
+    async def call(user, tokens, name):
+        await governor.acquire(tokens, user)
+        order.append(name)
+
+    tasks = [asyncio.create_task(call(*entry)) for entry in calls]
+    await asyncio.gather(*tasks)
+    return order
+
+
+async def test_users_are_served_round_robin():
+    # One request at a time, ten per second
+    governor = LLMGovernor(rpm=600, tpm=1e9, burst_seconds=0.1)
+    calls = [("batch", 1, f"batch{i}") for i in range(6)] + [("analyst", 1, f"analyst{i}") for i in range(2)]
+
+    order = await grant_order(governor, calls)
+
+    # batch0 goes straight through before anything else is queued; then the two users alternate
+    assert order == ["batch0", "batch1", "analyst0", "batch2", "analyst1", "batch3", "batch4", "batch5"]
+    assert governor.stats()["queue_depth"] == 0
+
+
+def token_starved_governor(max_bypass_seconds):
+    # 1000 tokens a second into an empty 1000-token bucket
+    governor = LLMGovernor(rpm=1e6, tpm=60000, burst_seconds=1, min_burst_tokens=1000,
+                           max_bypass_seconds=max_bypass_seconds)
+    governor.tokens.level = 0
+    return governor
+
+
+CALLS = [("big", 1000, "big")] + [(f"user{i}", 200, f"small{i}") for i in range(4)]
+
+
+async def test_small_calls_pass_a_large_call_that_does_not_fit():
+    order = await grant_order(token_starved_governor(max_bypass_seconds=60), CALLS)
+
+    assert order == ["small0", "small1", "small2", "small3", "big"]
+
+
+async def test_large_call_goes_first_once_it_has_waited_max_bypass_seconds():
+    order = await grant_order(token_starved_governor(max_bypass_seconds=0.1), CALLS)
+
+    assert order == ["big", "small0", "small1", "small2", "small3"]
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after-ms": "1500"}, 1.5),
+    ({"retry-after": "7"}, 7.0),
+    ({}, None),
+    ({"retry-after": "soon"}, None),
+])
+async def test_retry_after_header(headers, expected):
+    assert retry_after_seconds(rate_limit_error(headers)) == expected
+
+
+async def test_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    delay = retry_after_seconds(rate_limit_error({"retry-after": format_datetime(retry_at, usegmt=True)}))
+    assert 28 <= delay <= 30
+
+
+async def test_429_waits_as_long_as_retry_after_and_holds_other_users():
+    governor = LLMGovernor(rpm=1e6, tpm=1e9, backoff_max=5)
+    provider = FakeLLMProvider(profile="instant")
+    attempts = []
+
+    async def throttled_once():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise rate_limit_error({"retry-after": "0.3"})
+        return await provider.complete(MESSAGES)
+
+    start = time.monotonic()
+    first = asyncio.create_task(governor.run(throttled_once, 100, user="batch"))
+    await asyncio.sleep(0.05)
+    # Queued behind the pause the 429 put on every call, not just the throttled one
+    other = await governor.run(lambda: provider.complete(MESSAGES), 100, user="analyst")
+    other_done = time.monotonic() - start
+    assert await first == other
+
+    assert attempts[1] - attempts[0] >= 0.3
+    assert other_done >= 0.25
+    stats = governor.stats()
+    assert (stats["retries"], stats["throttled"], stats["failed"]) == (1, 1, 0)
+    assert provider.calls == 2
+
+
+async def test_non_transient_errors_are_not_retried():
+    governor = LLMGovernor(rpm=1e6, tpm=1e9)
+
+    async def bad_request():
+        request = httpx.Request("POST", "http://fake-llm/v1/chat/completions")
+        raise openai.BadRequestError("Bad request", response=httpx.Response(400, request=request), body=None)
+
+    with pytest.raises(openai.BadRequestError):
+        await governor.run(bad_request, 100, user="analyst")
+    assert governor.stats()["retries"] == 0
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import DEV_USER, USER_HEADERS
+from models.analysis_result import AnalysisResult
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def results(db):
+    """25 of the user's results, in groups of 3 sharing a timestamp (and of 4 sharing a revenue), plus another user's."""
+    rows = [
+        AnalysisResult(user_id=DEV_USER, filename=f"{i}.pdf", timestamp=START + timedelta(minutes=i // 3),
+                       revenue=None if i % 5 == 0 else float(i // 4))
+        for i in range(25)
+    ]
+    rows += [AnalysisResult(user_id="someone_else", filename="theirs.pdf", timestamp=START, revenue=1.0)
+             for _ in range(5)]
+    db.add_all(rows)
+    db.commit()
+    return [row for row in rows if row.user_id == DEV_USER]
+
+
+async def all_pages(client, **params):
+    ids, cursor, pages = [], None, 0
+    while True:
+        query = {**params, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/results", params=query, headers=USER_HEADERS)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        ids += [item["id"] for item in page["items"]]
+        pages += 1
+        cursor = page["next_cursor"]
+        if not cursor:
+            return ids, pages
+
+
+async def test_newest_first_pages_cover_every_result_once(client, results):
+    ids, pages = await all_pages(client, limit=7, fields="filename")
+
+    expected = [row.id for row in sorted(results, key=lambda row: (row.timestamp, row.id), reverse=True)]
+    assert ids == expected
+    assert pages == 4
+
+
+async def test_sorted_pages_break_ties_on_id_and_skip_missing_values(client, results):
+    ids, _ = await all_pages(client, limit=4, sort="revenue", order="asc", fields="revenue")
+
+    with_revenue = [row for row in results if row.revenue is not None]
+    assert ids == [row.id for row in sorted(with_revenue, key=lambda row: (row.revenue, row.id))]
+
+
+async def test_rows_added_between_pages_do_not_shift_the_next_page(client, db, results):
+    first = (await client.get("/api/results", params={"limit": 10}, headers=USER_HEADERS)).json()
+    db.add(AnalysisResult(user_id=DEV_USER, filename="new.pdf", timestamp=START + timedelta(days=1)))
+    db.commit()
+
+    second = (await client.get("/api/results", params={"limit": 10, "cursor": first["next_cursor"]},
+                               headers=USER_HEADERS)).json()
+
+    seen = [item["id"] for item in first["items"] + second["items"]]
+    expected = [row.id for row in sorted(results, key=lambda row: (row.timestamp, row.id), reverse=True)]
+    assert seen == expected[:20]
+
+
+@pytest.mark.parametrize("params", [
+    {"cursor": "not-a-cursor"},
+    {"sort": "revenue"},  # cursor below was issued for the timestamp sort
+])
+async def test_bad_cursors_are_rejected(client, results, params):
+    first = (await client.get("/api/results", params={"limit": 5}, headers=USER_HEADERS)).json()
+    query = {"cursor": first["next_cursor"], **params}
+
+    response = await client.get("/api/results", params=query, headers=USER_HEADERS)
+
+    assert response.status_code == 400